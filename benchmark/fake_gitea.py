@@ -0,0 +1,319 @@
+"""
+a local stand-in for the parts of the gitea api the downloader uses
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+MAX_RESPONSE_ITEMS = 50  # like gitea's default
+DEFAULT_PAGING_NUM = 30  # like gitea's default
+TIMESTAMP = "2020-01-01T00:00:00Z"
+RELEASE_ASSET_SIZE = 64 * 1024  # bytes of the asset of a release
+ATTACHMENT_SIZE = 10 * 1024  # bytes of an attachment
+
+
+class FakeGitea:
+    """
+    represents a gitea instance consisting of:
+    - repos (each with a bare git repo in folder)
+    - issues per repo
+    - comments per issue
+    - releases per repo (one, with one asset)
+    - files (that can be downloaded, the path of their url to their size)
+    - latency (seconds added to every answer)
+    and counts the requests and bytes it answered
+    """
+
+    def __init__(self, folder: str, repos: int, issues: int, comments: int,
+                 latency: float = 0.0) -> None:
+        self.folder: str = folder
+        self.latency: float = latency
+        self.requests: int = 0
+        self.bytes: int = 0
+        self.lock = threading.Lock()
+        self.repos: List[Dict[str, Any]] = []
+        self.issues: Dict[str, List[Dict[str, Any]]] = {}
+        self.comments: Dict[str, List[Dict[str, Any]]] = {}
+        self.releases: Dict[str, List[Dict[str, Any]]] = {}
+        self.files: Dict[str, int] = {}
+        self.server: Optional[ThreadingHTTPServer] = None
+        # their browser_download_url is only known once the server started
+        self.__assets: List[Dict[str, Any]] = []
+
+        comment_id = 1
+        for number in range(repos):
+            owner = "owner" + str(number % 10)
+            name = owner + "/repo" + str(number)
+            path = os.path.join(folder, name + ".git")
+            create_git_repo(path)
+            self.repos.append({'id': number + 1, 'full_name': name, 'name': "repo" + str(number),
+                               'owner': {'login': owner, 'id': number % 10 + 1},
+                               'ssh_url': path, 'clone_url': path,
+                               'size': 1 + number * 100, 'archived': number % 7 == 6,
+                               'fork': number % 5 == 4, 'mirror': number % 11 == 10,
+                               'updated_at': TIMESTAMP})
+            self.issues[name] = []
+            self.comments[name] = []
+            self.releases[name] = [{'id': number + 1, 'tag_name': "v1.0", 'name': "1.0",
+                                    'assets': [self.__asset(
+                                        number + 1, "app.tar.gz", RELEASE_ASSET_SIZE,
+                                        "/" + name + "/releases/download/v1.0/app.tar.gz")]}]
+            for index in range(1, issues + 1):
+                self.issues[name].append({'id': number * issues + index, 'number': index,
+                                          'title': "issue " + str(index),
+                                          'user': {'login': "alice", 'full_name': "Alice"},
+                                          'body': "body of issue " + str(index),
+                                          'state': "open" if index % 2 else "closed",
+                                          'labels': [{'name': "bug"}] if index % 3 == 0 else [],
+                                          'comments': comments,
+                                          'assets': self.__attachments(
+                                              number * issues + index, index % 5 == 0),
+                                          'updated_at': TIMESTAMP})
+                # gitea leaves the issue_url of comments on pull requests empty
+                pull = index % 4 == 0
+                for position in range(comments):
+                    self.comments[name].append({'id': comment_id,
+                                                'issue_url': "" if pull else
+                                                "/" + name + "/issues/" + str(index),
+                                                'pull_request_url': "/" + name + "/pulls/"
+                                                + str(index) if pull else "",
+                                                'user': {'login': "bob", 'full_name': "Bob"},
+                                                'body': "comment " + str(position),
+                                                'assets': self.__attachments(
+                                                    comment_id, position == 0 and index % 7 == 0),
+                                                'updated_at': TIMESTAMP})
+                    comment_id += 1
+
+    def __asset(self, asset_id: int, name: str, size: int, path: str) -> Dict[str, Any]:
+        self.files[path] = size
+        asset = {'id': asset_id, 'name': name, 'size': size, 'download_path': path}
+        self.__assets.append(asset)
+        return asset
+
+    def __attachments(self, owner_id: int, attached: bool) -> List[Dict[str, Any]]:
+        if not attached:
+            return []
+        uuid = "{:032x}".format(owner_id * 1000 + len(self.__assets))
+        return [self.__asset(len(self.__assets) + 1, "screenshot.png", ATTACHMENT_SIZE,
+                             "/attachments/" + uuid)]
+
+    def start(self) -> str:
+        """
+        start answering requests on a free local port
+        :return: the url of the instance
+        """
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler_for(self))
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url = "http://127.0.0.1:" + str(self.server.server_address[1])
+        for asset in self.__assets:
+            asset['browser_download_url'] = url + asset.pop('download_path')
+        return url
+
+    def stop(self) -> None:
+        """
+        stop answering requests
+        :return: None
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def reset_counters(self) -> Tuple[int, int]:
+        """
+        get the counted requests and bytes and start counting again
+        :return: (requests, bytes)
+        """
+        with self.lock:
+            counted = (self.requests, self.bytes)
+            self.requests = 0
+            self.bytes = 0
+        return counted
+
+    def answer(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, Any, Optional[int]]:
+        """
+        answer an api request
+        :param path: the path of the url
+        :param query: the parsed query of the url
+        :return: (status code, json, total count for paginated lists or None)
+        """
+        if path == "/api/v1/version":
+            return 200, {'version': "1.20.0"}, None
+        if path == "/api/v1/user":
+            return 200, {'id': 1, 'login': "alice", 'full_name': "Alice"}, None
+        if path == "/api/v1/settings/api":
+            return 200, {'max_response_items': MAX_RESPONSE_ITEMS,
+                         'default_paging_num': DEFAULT_PAGING_NUM}, None
+        if path == "/api/v1/repos/search":
+            repos, total = paginate([repo for repo in self.repos if searched(repo, query)], query)
+            return 200, {'ok': True, 'data': repos}, total
+
+        for repo in self.repos:
+            if path == "/api/v1/repos/" + repo['full_name']:
+                return 200, repo, None
+            if path == "/api/v1/repos/" + repo['full_name'] + "/releases":
+                releases, total = paginate(self.releases[repo['full_name']], query)
+                return 200, releases, total
+        match = re.match(r"^/api/v1/repos/([^/]+/[^/]+)/issues"
+                         r"(?:/(comments|\d+)(?:/(comments))?)?$", path)
+        if match is None or match.group(1) not in self.issues:
+            return 404, {'message': "not found"}, None
+        repo, sub, subsub = match.groups()
+        since = query.get('since', [""])[0]
+        if sub is None:
+            state = query.get('state', ["open"])[0]
+            issues = [issue for issue in self.issues[repo]
+                      if state in ["all", issue['state']] and issue['updated_at'] > since]
+            issues, total = paginate(issues, query)
+            return 200, issues, total
+        if sub == "comments":
+            comments = [comment for comment in self.comments[repo] if comment['updated_at'] > since]
+            comments, total = paginate(comments, query)
+            return 200, comments, total
+        index = int(sub)
+        if index < 1 or index > len(self.issues[repo]):
+            return 404, {'message': "not found"}, None
+        if subsub is None:
+            return 200, self.issues[repo][index - 1], None
+        return 200, [comment for comment in self.comments[repo]
+                     if (comment['issue_url'] or comment['pull_request_url'])
+                     .endswith("/" + str(index))], None
+
+
+def searched(repo: Dict[str, Any], query: Dict[str, List[str]]) -> bool:
+    """
+    check if a repo is found by /repos/search
+    :param repo: the repo
+    :param query: the parsed query with q, archived, mode and exclusive
+    :return: bool
+    """
+    keyword = query.get('q', [""])[0].lower()
+    archived = query.get('archived', [""])[0]
+    mode = query.get('mode', [""])[0]
+    return keyword in repo['name'].lower() \
+        and (archived == "" or repo['archived'] == (archived == "true")) \
+        and (mode != "source" or not (repo['fork'] or repo['mirror'])) \
+        and (mode != "fork" or repo['fork']) \
+        and (mode != "mirror" or repo['mirror']) \
+        and (query.get('exclusive', [""])[0] != "true" or repo['owner']['login'] == "alice")
+
+
+def paginate(items: List[Any], query: Dict[str, List[str]]) -> Tuple[List[Any], int]:
+    """
+    cut one page out of a list like gitea does
+    :param items: all items
+    :param query: the parsed query with page and limit
+    :return: (items of the page, number of all items)
+    """
+    page = max(1, int(query.get('page', ["1"])[0]))
+    limit = min(MAX_RESPONSE_ITEMS, int(query.get('limit', [str(DEFAULT_PAGING_NUM)])[0]))
+    return items[(page - 1) * limit:page * limit], len(items)
+
+
+def handler_for(gitea: FakeGitea) -> type:
+    """
+    build the request handler of a fake instance
+    :param gitea: the fake instance
+    :return: the handler class
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        """
+        answers http requests with the fake instance
+        """
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self) -> None:  # pylint: disable=invalid-name
+            """
+            answer a get request
+            :return: None
+            """
+            if gitea.latency:
+                time.sleep(gitea.latency)
+            url = urlparse(self.path)
+            if url.path in gitea.files:
+                self.download(url.path)
+                return
+            status, answer, total = gitea.answer(url.path, parse_qs(url.query))
+            body = json.dumps(answer).encode()
+            with gitea.lock:
+                gitea.requests += 1
+                gitea.bytes += len(body)
+            self.send_response(status)
+            self.send_header('Content-Type', "application/json")
+            self.send_header('Content-Length', str(len(body)))
+            if total is not None:
+                self.send_header('X-Total-Count', str(total))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def download(self, path: str) -> None:
+            """
+            answer the download of a file, or of its end with a range header
+            :param path: the path of the file
+            :return: None
+            """
+            data = file_content(path, gitea.files[path])
+            start = 0
+            match = re.match(r"^bytes=(\d+)-$", self.headers.get('Range', ""))
+            if match is not None:
+                start = int(match.group(1))
+                if start >= len(data):
+                    self.send_response(416)
+                    self.send_header('Content-Range', "bytes */" + str(len(data)))
+                    self.send_header('Content-Length', "0")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header('Content-Range', "bytes " + str(start) + "-"
+                                 + str(len(data) - 1) + "/" + str(len(data)))
+            else:
+                self.send_response(200)
+            with gitea.lock:
+                gitea.requests += 1
+                gitea.bytes += len(data) - start
+            self.send_header('Content-Type', "application/octet-stream")
+            self.send_header('Content-Length', str(len(data) - start))
+            self.end_headers()
+            self.wfile.write(data[start:])
+
+        def log_message(self, *args: Any) -> None:  # pylint: disable=arguments-differ
+            pass
+
+    return Handler
+
+
+def file_content(path: str, size: int) -> bytes:
+    """
+    get the content of a file that can be downloaded, the same every time
+    :param path: the path of the file
+    :param size: its size
+    :return: the content
+    """
+    line = (path + "\n").encode()
+    return (line * (size // len(line) + 1))[:size]
+
+
+def create_git_repo(path: str) -> None:
+    """
+    create a bare git repo with one commit
+    :param path: the folder of the bare repo
+    :return: None
+    """
+    work = path + ".work"
+    quiet = {'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL, 'check': True}
+    subprocess.run(['git', 'init', '--bare', path], **quiet)
+    subprocess.run(['git', 'init', work], **quiet)
+    with open(os.path.join(work, "README"), 'w') as readme:
+        readme.write(path + "\n")
+    subprocess.run(['git', '-C', work, 'add', 'README'], **quiet)
+    subprocess.run(['git', '-C', work, '-c', 'user.name=bench', '-c', 'user.email=bench@localhost',
+                    'commit', '-m', 'initial commit'], **quiet)
+    subprocess.run(['git', '-C', work, 'push', path, 'HEAD:refs/heads/main'], **quiet)
+    subprocess.run(['git', '-C', path, 'symbolic-ref', 'HEAD', 'refs/heads/main'], **quiet)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+benchmark the downloader against a local fake gitea instance (see fake_gitea)
+run from the root of the repo: python -m benchmark.run_benchmark
+"""
+from argparse import ArgumentParser
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import tempfile
+import time
+import traceback
+from typing import Any, Dict, List
+
+from benchmark.fake_gitea import FakeGitea
+from util.issue_archive import FILES, FORMATS
+
+SCENARIOS = ["repos", "issues", "backup", "update"]
+
+
+def write_config(folder: str, url: str) -> str:
+    """
+    write a config file for the fake instance
+    :param folder: the folder to write it to
+    :param url: the url of the fake instance
+    :return: the path of the config file
+    """
+    path = os.path.join(folder, "config.ini")
+    with open(path, 'w') as config_file:
+        config_file.write("[gitea]\nurl = " + url + "\n\n"
+                          "[repos]\nexception = []\n\n"
+                          "[auth]\nuser = alice\ntoken = benchmark\n")
+    return path
+
+
+def run_scenario(scenario: str, config_path: str, folder: str, jobs: int, issue_format: str,
+                 results: Any) -> None:
+    """
+    run one scenario and put its wall time and peak rss into results
+    runs in a process of its own, so the peak rss is only that of the scenario
+    :param scenario: the scenario (see SCENARIOS)
+    :param config_path: the config file of the fake instance
+    :param folder: the download folder
+    :param jobs: the number of repos to work on in parallel
+    :param issue_format: the format to save issues in
+    :param results: queue for the result
+    :return: None
+    """
+    # pylint: disable=import-outside-toplevel
+    import gitea_downloader
+    from util.config import get_config
+    from util.gitea_request import get_issues, get_repos
+
+    exit_code = 0
+    start = time.perf_counter()
+    try:
+        if scenario in ["repos", "issues"]:
+            config = get_config(config_path)
+            config.pool_size = max(config.pool_size, jobs)
+            repos = get_repos(config)
+            if scenario == "issues":
+                for repo in repos:
+                    for _ in get_issues(config, repo):
+                        pass
+        else:
+            sys.argv = ['gitea_downloader.py', '--config', config_path, '--folder', folder,
+                        '--jobs', str(jobs), '--issue-format', issue_format]
+            if scenario == "update":
+                sys.argv.append('--update')
+            sys.stdout = open(os.devnull, 'w')
+            gitea_downloader.main()
+    except SystemExit as exception:
+        exit_code = exception.code if isinstance(exception.code, int) else 1
+    except Exception:  # pylint: disable=broad-except
+        # reported as a failed scenario instead of leaving the parent waiting for the result
+        traceback.print_exc()
+        exit_code = 1
+    wall_time = time.perf_counter() - start
+    # kilobytes on linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put({'wall_time': wall_time, 'peak_rss_kb': peak_rss, 'exit_code': exit_code})
+
+
+def benchmark(gitea: FakeGitea, url: str, folder: str, scenarios: List[str], jobs: int,
+              issue_format: str) -> List[Dict[str, Any]]:
+    """
+    run the scenarios one after another against a fake instance
+    backup and update share the download folder, so update fetches into the clones of backup
+    :param gitea: the fake instance
+    :param url: its url
+    :param folder: the folder for config and downloads
+    :param scenarios: the scenarios to run (see SCENARIOS)
+    :param jobs: the number of repos to work on in parallel
+    :param issue_format: the format to save issues in
+    :return: list of the measurements of the scenarios
+    """
+    config_path = write_config(folder, url)
+    download_folder = os.path.join(folder, "download")
+    # spawn, so no scenario inherits the memory of the fake instance
+    context = multiprocessing.get_context('spawn')
+    measurements = []
+    for scenario in scenarios:
+        results = context.Queue()
+        gitea.reset_counters()
+        process = context.Process(target=run_scenario,
+                                  args=(scenario, config_path, download_folder, jobs,
+                                        issue_format, results))
+        process.start()
+        measurement = wait_for(process, results)
+        process.join()
+        requests, sent_bytes = gitea.reset_counters()
+        measurement.update({'scenario': scenario, 'requests': requests, 'bytes': sent_bytes})
+        measurements.append(measurement)
+    return measurements
+
+
+def wait_for(process: Any, results: Any) -> Dict[str, Any]:
+    """
+    wait for the result of a scenario
+    :param process: the process running the scenario (see run_scenario)
+    :param results: the queue it puts its result into
+    :return: the result or, if the process died without one, a failure with its exit code
+    """
+    while True:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            if not process.is_alive():
+                break
+    try:
+        # it may have put the result just before it ended
+        return results.get(timeout=1)
+    except queue.Empty:
+        return {'wall_time': 0.0, 'peak_rss_kb': 0, 'exit_code': process.exitcode or 1}
+
+
+def print_measurements(measurements: List[Dict[str, Any]]) -> None:
+    """
+    print the measurements as a table
+    :param measurements: the measurements (see benchmark)
+    :return: None
+    """
+    print("{:<10}{:>10}{:>10}{:>12}{:>14}{:>6}".format(
+        "scenario", "wall [s]", "requests", "bytes", "peak rss [MB]", "exit"))
+    for measurement in measurements:
+        print("{:<10}{:>10.3f}{:>10}{:>12}{:>14.1f}{:>6}".format(
+            measurement['scenario'], measurement['wall_time'], measurement['requests'],
+            measurement['bytes'], measurement['peak_rss_kb'] / 1024, measurement['exit_code']))
+
+
+def main() -> None:
+    """
+    the main function
+    :return: None
+    """
+    parser = ArgumentParser(description='Benchmark the downloader '
+                                        'against a local fake gitea instance')
+    parser.add_argument('--repos', type=int, default=20, help='number of repos')
+    parser.add_argument('--issues', type=int, default=100, help='number of issues per repo')
+    parser.add_argument('--comments', type=int, default=3, help='number of comments per issue')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds the fake instance waits before every answer')
+    parser.add_argument('--jobs', '-j', type=int, default=4,
+                        help='number of repos to work on in parallel')
+    parser.add_argument('--issue-format', choices=FORMATS, default=FILES,
+                        help='format to save issues in')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='scenario to run (can be given more than once, default: all)')
+    parser.add_argument('--json', help='also write the measurements to this json file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="gitea-benchmark-") as folder:
+        gitea = FakeGitea(os.path.join(folder, "git"), args.repos, args.issues, args.comments,
+                          args.latency)
+        url = gitea.start()
+        try:
+            measurements = benchmark(gitea, url, folder, args.scenario or SCENARIOS,
+                                     args.jobs, args.issue_format)
+        finally:
+            gitea.stop()
+
+    print_measurements(measurements)
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({'parameters': vars(args), 'measurements': measurements}, json_file, indent=1)
+    if any(measurement['exit_code'] != 0 for measurement in measurements):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
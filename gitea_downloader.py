@@ -2,36 +2,41 @@
 """
 this programs downloads repos and issues from a gitea instance
 """
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
+from concurrent.futures import Future, ThreadPoolExecutor
+import configparser
+import copy
 import os
 import shutil
+import sqlite3
 import subprocess
-from subprocess import CalledProcessError
-from typing import List
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 from colorama import Fore, Style
 
-from util.config import Config, DEFAULT_CONFIG_FILE, get_config
-from util.gitea_request import get_version, get_repos, get_issues
-from util.issue import Issue, State
+from util.asset import Attachments, load_synced_at, save_synced_at
+from util.clone_strategy import CloneStrategy, choose_strategy
+from util.config import Config, DEFAULT_CONFIG_FILE, TARGET_PREFIX, get_config
+from util.export import COMPRESSIONS, ZSTD, Exporter, default_compression
+from util.git import clone, fetch, remote_refs, GitException
+from util.gitea_request import get_version, get_listing, get_repo, get_issues, \
+    get_issues_by_number, get_release_assets, get_attachments, download_asset, \
+    GiteaException, IncompleteResultException
+from util.issue import Issue
+from util.issue_archive import FILES, FORMATS, IssueArchive, open_archive
+from util.journal import Journal, IssueCheckpoint
+from util.manifest import Manifest, hash_content, sync_start
 from util.repo import Repo
-
-
-def remove_exceptions(exceptions: List[str], repos: List[Repo], verbose: bool) -> List[Repo]:
-    """
-    removing exceptions from repos
-    :param exceptions: the name of the repos to remove
-    :param repos: the repos (see Repo)
-    :param verbose: verbose output?
-    :return: list of repos with exceptions removed
-    """
-    for exception in exceptions:
-        for repo in repos:
-            if repo.is_name(exception):
-                if verbose:
-                    print("removing " + str(repo) + " due to " + exception)
-                repos.remove(repo)
-    return repos
+from util.repo_filter import RepoFilter
+from util.repo_state import RepoStates, refs_digest
+from util.result import RepoResult
+from util.scheduler import DISK_WRITES, GIT_TRANSFERS, API_REQUESTS, get_limit
+from util.shard import ShardManifest, shard_of, verify_shards
+from util.transport import TRANSPORTS, Transport, get_transport, stop_transports
+from util.stats import ASSETS, EXPORT, GIT, ISSUES, WRITE, get_stats
+from util.webhook import SyncQueue, WebhookServer, Work
 
 
 def create_folder(folder: str, verbose: bool) -> None:
@@ -44,7 +49,7 @@ def create_folder(folder: str, verbose: bool) -> None:
     if not os.path.exists(folder):
         if verbose:
             print(folder + " does not exists. Will create it")
-        os.makedirs(folder)
+        os.makedirs(folder, exist_ok=True)
 
 
 def check_for_git() -> None:
@@ -61,67 +66,299 @@ def check_for_git() -> None:
         exit(2)
 
 
-def download_repo(folder: str, repo: Repo) -> None:
+def download_repo(folder: str, repo: Repo, update: bool,
+                  strategy: Optional[CloneStrategy] = None,
+                  states: Optional[RepoStates] = None,
+                  transport: Optional[Transport] = None) -> str:
     """
-    git clone the Repo
+    git clone the Repo or, in update mode, fetch into an existing clone
+    with states, an existing clone is only fetched if gitea reports a change since the last sync
+    and the refs of the remote (git ls-remote) changed
     :param folder: folder to save to
     :param repo: the repo to clone
-    :return: None
+    :param update: fetch into existing clones instead of failing?
+    :param strategy: how to clone the repo or None to clone everything
+    :param states: the states of the repos after their last sync or None to always fetch
+    :param transport: how git reaches the gitea instance or None for plain ssh
+    :return: what was done
     """
-    print("working on " + repo.name + " ", end='')
-    try:
-        git = subprocess.Popen(['git', 'clone', repo.url, str(os.path.join(folder, repo.name))],
-                               stdout=subprocess.DEVNULL,
-                               stderr=subprocess.DEVNULL)
-        git.communicate()
-    except CalledProcessError:
-        print(Fore.RED + "✘" + Style.RESET_ALL)
-        return
-    print(Fore.GREEN + "✓" + Style.RESET_ALL)
+    path = str(os.path.join(folder, repo.name))
+    url = transport.url_of(repo) if transport is not None else repo.url
+    environment = transport.environment if transport is not None else None
+    if os.path.exists(path):
+        if not update:
+            raise GitException(path + " already exists (use --update to fetch into it)")
+        digest: Optional[str] = None
+        if states is not None:
+            if states.is_unchanged(repo):
+                return "unchanged"
+            digest = refs_digest(remote_refs(url, environment))
+            if states.has_refs(repo, digest):
+                states.record(repo, digest)
+                return "unchanged"
+        changed = fetch(path, url, environment)
+        if states is not None:
+            states.record(repo, digest)
+        return "updated, " + str(changed) + (" ref" if changed == 1 else " refs") + " changed"
+    if strategy is None:
+        clone(url, path, environment=environment)
+        message = "cloned"
+    else:
+        clone(url, path, strategy.clone_arguments(), environment)
+        message = "cloned with strategy " + strategy.name
+    if states is not None:
+        states.record(repo, None)
+    return message
 
 
-def working_on_issues(config: Config, repo: Repo, args) -> None:
+def working_on_issues(config: Config, repo: Repo, args, journal: Optional[Journal] = None,
+                      numbers: Optional[Set[int]] = None,
+                      attachments: Optional[Attachments] = None) -> int:
     """
-    get issues for repo and then ask user to save them
+    get issues for repo and save them
+    only issues changed since the last run are requested, see Manifest
     :param config: the config to be used
     :param repo: the repo for which issues are worked on
     :param args: the commandline parameter
-    :return:
+    :param journal: the journal to record saved pages in and resume from or None
+    :param numbers: only save these issues (e.g. named by webhooks) or None for all changed ones
+    :param attachments: to collect the attachments of the requested issues in or None
+    :return: the number of issues written
     """
     if args.verbose:
-        print("saving issues to file")
-    issues: List[Issue] = get_issues(config, repo)
-    if args.always_ask:
-        if ask("save issues for " + repo.name):
-            save_issues(args.folder, repo, issues, args.verbose)
-    else:
-        save_issues(args.folder, repo, issues, args.verbose)
+        print("saving issues of " + repo.name + " to file")
+    manifest = Manifest(str(os.path.join(args.folder, "issues/" + repo.name)))
+    manifest.load()
+    if numbers is not None and manifest.format == args.issue_format:
+        # the other issues may have changed too, so the last sync stays where it is
+        try:
+            return save_issues(args.folder, repo, get_issues_by_number(config, repo, numbers),
+                               args.verbose, manifest, args.issue_format)
+        finally:
+            manifest.save()
+    if manifest.format != args.issue_format:
+        manifest.reset(args.issue_format)
+    since = manifest.synced_at
+    started_at = sync_start()
+    first_page = 1
+    checkpoint: Optional[IssueCheckpoint] = None
+    if journal is not None:
+        last_page = journal.last_page(repo.name, args.issue_format)
+        if last_page is not None:
+            # go on like the run that stopped, the last saved page is requested again
+            # in case issues were deleted since and the following ones moved up
+            since, started_at, first_page = \
+                last_page['since'], last_page['started_at'], last_page['page']
+            manifest.merge({int(number): entry
+                            for number, entry in last_page['issues'].items()})
+        checkpoint = IssueCheckpoint(journal, repo.name, since, started_at, args.issue_format,
+                                     manifest)
+    if attachments is not None:
+        attachments.since = since
+    issues: Iterable[Issue] = get_issues(config, repo, since, first_page,
+                                         checkpoint.page_saved if checkpoint else None,
+                                         attachments)
+    try:
+        written = save_issues(args.folder, repo, issues, args.verbose, manifest, args.issue_format,
+                              checkpoint)
+        # only a complete sync may move on, otherwise the missing issues would be skipped next time
+        manifest.synced_at = started_at
+        if attachments is not None:
+            # a resumed sync didn't see the pages before
+            attachments.complete = first_page == 1
+    finally:
+        manifest.save()
+    return written
+
+
+def git_stage(config: Config, repo: Repo, args, states: Optional[RepoStates],
+              journal: Optional[Journal] = None,
+              exporter: Optional[Exporter] = None) -> RepoResult:
+    """
+    clone or update the repo and export a bundle of it
+    :param config: the config to be used
+    :param repo: the repo to back up
+    :param args: the commandline parameter
+    :param states: the states of the repos after their last sync or None to always fetch
+    :param journal: the journal of the run or None
+    :param exporter: the export of the run or None to export nothing
+    :return: the result of this stage
+    """
+    result = RepoResult(repo.name)
+    if journal is not None and journal.is_done(GIT, repo.name):
+        result.note("git already done before the resume")
+        return result
+    strategy = choose_strategy(config.clone_strategies, repo)
+    # a clone of the run that stopped may have been cut off, so it is fetched into
+    update = args.update or (journal is not None and journal.resumed)
+    try:
+        # the limit is waited for before the timing starts
+        with get_limit(GIT_TRANSFERS).hold(), get_stats().phase(GIT, repo.name):
+            result.note(download_repo(args.folder, repo, update, strategy, states,
+                                      get_transport(config)))
+        if exporter is not None:
+            with get_limit(DISK_WRITES).hold(), get_stats().phase(EXPORT, repo.name):
+                result.note(exporter.export_repo(repo.name, os.path.join(args.folder, repo.name)))
+        if journal is not None:
+            journal.finish(GIT, repo.name)
+    except GitException as exception:
+        result.fail(str(exception))
+    except OSError as exception:
+        result.fail("bundle export failed: " + (str(exception) or type(exception).__name__))
+    return result
+
+
+def issue_stage(config: Config, repo: Repo, args, journal: Optional[Journal] = None,
+                numbers: Optional[Set[int]] = None, exporter: Optional[Exporter] = None,
+                attachments: Optional[Attachments] = None) -> RepoResult:
+    """
+    export the issues of the repo and pack them
+    :param config: the config to be used
+    :param repo: the repo to back up
+    :param args: the commandline parameter
+    :param journal: the journal of the run or None
+    :param numbers: only save these issues or None for all changed ones (see working_on_issues)
+    :param exporter: the export of the run or None to pack nothing
+    :param attachments: to collect the attachments of the requested issues in for the asset stage,
+                        it is told when they are complete in any case, or None
+    :return: the result of this stage
+    """
+    result = RepoResult(repo.name)
+    try:
+        if journal is not None and journal.is_done(ISSUES, repo.name):
+            result.note("issues already saved before the resume")
+            return result
+        with get_stats().phase(ISSUES, repo.name):
+            written = working_on_issues(config, repo, args, journal, numbers, attachments)
+        result.note(str(written) + (" issue" if written == 1 else " issues") + " saved")
+        if exporter is not None:
+            with get_limit(DISK_WRITES).hold(), get_stats().phase(EXPORT, repo.name):
+                issue_folder = os.path.join(args.folder, "issues", repo.name)
+                result.note(exporter.export_issues(repo.name, issue_folder))
+        if journal is not None:
+            journal.finish(ISSUES, repo.name)
+    except (GiteaException, OSError, sqlite3.Error, ValueError) as exception:
+        # e.g. a corrupt manifest or issue archive only fails its repo
+        result.fail("issue export failed: " + (str(exception) or type(exception).__name__))
+    finally:
+        if attachments is not None:
+            attachments.finish()
+    return result
 
 
-def save_issues(folder: str, repo: Repo, issues: List[Issue], verbose: bool)-> None:
+def asset_stage(config: Config, repo: Repo, args, downloads: ThreadPoolExecutor,
+                journal: Optional[Journal] = None,
+                attachments: Optional[Attachments] = None) -> RepoResult:
+    """
+    download the release assets and attachments of the repo that aren't saved yet
+    attachments are only looked for in issues and comments changed since the last complete run,
+    those the issue stage requested anyway are taken from it
+    :param config: the config to be used
+    :param repo: the repo to back up
+    :param args: the commandline parameter
+    :param downloads: the executor the downloads of all repos share
+    :param journal: the journal of the run or None
+    :param attachments: those the issue stage of the repo collects or None
+    :return: the result of this stage
+    """
+    result = RepoResult(repo.name)
+    if journal is not None and journal.is_done(ASSETS, repo.name):
+        result.note("assets already downloaded before the resume")
+        return result
+    folder = os.path.join(args.folder, "assets", repo.name)
+    max_size = config.asset_max_size * 1024 * 1024
+    failed: List[str] = []
+    try:
+        with get_stats().phase(ASSETS, repo.name):
+            started_at = sync_start()
+            since = load_synced_at(folder)
+            assets = get_release_assets(config, repo)
+            if attachments is not None and attachments.covers(since):
+                assets += list(attachments.assets.values())
+            else:
+                assets += get_attachments(config, repo, since)
+            futures: List[Tuple[str, Future]] = []
+            for asset in assets:
+                if max_size and asset.size > max_size:
+                    if args.verbose:
+                        print("leaving out " + asset.path + " of " + repo.name
+                              + " because it is larger than [assets] max_size")
+                    continue
+                futures.append((asset.path, downloads.submit(download_asset, config, repo, asset,
+                                                             os.path.join(folder, asset.path))))
+            downloaded = 0
+            for path, future in futures:
+                try:
+                    if future.result():
+                        downloaded += 1
+                except (GiteaException, OSError) as exception:
+                    failed.append(path + ": " + (str(exception) or type(exception).__name__))
+        if failed:
+            result.fail(str(len(failed)) + " of " + str(len(futures)) + " assets failed: "
+                        + "; ".join(failed))
+            return result
+        # only a complete run may move on, otherwise the missing attachments would be skipped
+        save_synced_at(folder, started_at)
+        result.note(str(downloaded) + " of " + str(len(futures)) + " assets downloaded")
+        if journal is not None:
+            journal.finish(ASSETS, repo.name)
+    except (GiteaException, OSError) as exception:
+        result.fail("asset download failed: " + (str(exception) or type(exception).__name__))
+    return result
+
+
+def save_issues(folder: str, repo: Repo, issues: Iterable[Issue], verbose: bool,
+                manifest: Optional[Manifest] = None, issue_format: str = FILES,
+                checkpoint: Optional[IssueCheckpoint] = None) -> int:
     """
     save the Issue to file
+    each Issue is written as soon as it arrives
     :param folder: folder to save to
     :param repo: the repo to save Issues from
-    :param issues: the list of Issues
+    :param issues: the Issues (a list or an iterator from get_issues)
     :param verbose: verbose output?
-    :return: None
+    :param manifest: the manifest of the already saved issues, to skip unchanged ones
+    :param issue_format: the format to save the issues in (see issue_archive)
+    :param checkpoint: the progress to make durable after every page or None
+    :return: the number of issues written
     """
-    for issue in issues:
-        if issue.state is State.open:
-            create_folder(str(os.path.join(folder, "issues/" + repo.name + "/open")), verbose)
-        elif issue.state is State.closed:
-            create_folder(str(os.path.join(folder, "issues/" + repo.name + "/closed")), verbose)
-        elif issue.state is State.unknown:
-            create_folder(str(os.path.join(folder, "issues/" + repo.name + "/unknown")), verbose)
+    issue_folder = str(os.path.join(folder, "issues/" + repo.name))
+    create_folder(issue_folder, verbose)
+    archive: IssueArchive = open_archive(issue_format, issue_folder)
+    if checkpoint is not None:
+        checkpoint.archive = archive
+    written = 0
+    # only the time spent writing, the issues arrive from the api in between
+    writing = 0.0
+    writes = get_limit(DISK_WRITES)
+    try:
+        for issue in issues:
+            start = time.perf_counter()
+            content = issue.save_to_file()
+            file = archive.file_of(issue, manifest)
+            content_hash = hash_content(content) if manifest is not None else ""
+            if manifest is not None \
+                    and manifest.is_saved(issue.number, content_hash, file) \
+                    and archive.exists(file):
+                writing += time.perf_counter() - start
+                continue
 
-        with open(
-                str(os.path.join(folder,
-                                 "issues/" + repo.name
-                                 + "/" + issue.state.name
-                                 + "/" + issue.title)),
-                'w') as out:
-            out.write(issue.save_to_file())
+            with writes.hold():
+                archive.write(issue, content, file)
+            written += 1
+            if manifest is not None:
+                # recorded only once it is written, so a failed write is tried again next time
+                old_file = manifest.record(issue.number, issue.updated_at, content_hash, file)
+                if old_file is not None:
+                    with writes.hold():
+                        archive.remove(old_file)
+            writing += time.perf_counter() - start
+    finally:
+        start = time.perf_counter()
+        with writes.hold():
+            archive.close()
+        get_stats().record_phase(WRITE, repo.name, writing + time.perf_counter() - start)
+    return written
 
 
 def ask(question: str) -> bool:
@@ -140,6 +377,399 @@ def ask(question: str) -> bool:
             return answer.lower() == "y" or answer == ""
 
 
+def positive_int(value: str) -> int:
+    """
+    argparse type for integers greater than zero
+    :param value: the value given on the commandline
+    :return: the value as int
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise ArgumentTypeError(value + " is not a number")
+    if number < 1:
+        raise ArgumentTypeError(value + " is not greater than zero")
+    return number
+
+
+def shard_spec(value: str) -> Tuple[int, int]:
+    """
+    argparse type for a shard given as i/N
+    :param value: the value given on the commandline
+    :return: (number of the shard, number of all shards)
+    """
+    try:
+        shard, shards = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ArgumentTypeError(value + " is not of the form i/N")
+    if not 1 <= shard <= shards:
+        raise ArgumentTypeError(value + " is not a shard from 1/N to N/N")
+    return shard, shards
+
+
+def check_shards(paths: List[str], repos: List[Repo], incomplete: bool) -> bool:
+    """
+    check that the shard manifests together cover every repo exactly once and print the problems
+    :param paths: the shard manifest files
+    :param repos: all repos that should be backed up
+    :param incomplete: is the list of repos incomplete?
+    :return: did the check pass?
+    """
+    manifests: List[ShardManifest] = []
+    for path in paths:
+        manifest = ShardManifest(path)
+        try:
+            manifest.load()
+        except (OSError, ValueError, KeyError) as exception:
+            print(Fore.RED + "can't read shard manifest " + path + ": " + str(exception)
+                  + Style.RESET_ALL)
+            return False
+        manifests.append(manifest)
+    problems = verify_shards(manifests, [repo.name for repo in repos])
+    if incomplete:
+        problems.append("the list of repos is incomplete, so some repos can't be checked")
+    for problem in problems:
+        print(Fore.RED + problem + Style.RESET_ALL)
+    if not problems:
+        print(Fore.GREEN + "all " + str(len(repos)) + " repos are backed up in exactly one of "
+              + str(len(manifests)) + " shards" + Style.RESET_ALL)
+    return not problems
+
+
+def refresh_in_background(args) -> None:
+    """
+    refresh the cached list of repos in a process of its own, so this run isn't held up
+    :param args: the commandline parameter
+    :return: None
+    """
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), '--config', args.config,
+                      '--list', '--refresh'] + (['--target', args.target] if args.target else []),
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL, start_new_session=True)
+
+
+def plan_repos(repos: List[Repo], args) -> List[Tuple[Repo, bool, bool, bool]]:
+    """
+    decide for every repo what should be done
+    all questions are asked here, before any work starts, so no worker waits for input
+    :param repos: the repos to work on
+    :param args: the commandline parameter
+    :return: list of (repo, download?, save issues?, download assets?)
+    """
+    plans: List[Tuple[Repo, bool, bool, bool]] = []
+    for repo in repos:
+        download = True
+        issues = not args.no_issues
+        assets = args.assets
+        if args.always_ask:
+            download = ask("download " + repo.name)
+            if issues:
+                issues = ask("save issues for " + repo.name)
+            if assets:
+                assets = ask("download assets of " + repo.name)
+        if download or issues or assets:
+            plans.append((repo, download, issues, assets))
+    return plans
+
+
+def list_repos(config: Config, args, repo_filter: RepoFilter,
+               refresh: bool) -> Tuple[List[Repo], bool]:
+    """
+    get the repos to back up sorted by name
+    :param config: the config to be used
+    :param args: the commandline parameter
+    :param repo_filter: the rules which repos to leave out
+    :param refresh: ask gitea even if the cached list is recent enough?
+    :return: (list of Repo, is the list incomplete?)
+    """
+    incomplete = False
+    try:
+        found_repos, stale = get_listing(config, repo_filter, refresh)
+    except IncompleteResultException as exception:
+        print(Fore.RED + "the list of repos is incomplete: " + str(exception) + Style.RESET_ALL)
+        found_repos, stale = exception.result, False
+        incomplete = True
+    if stale:
+        refresh_in_background(args)
+    return sorted(found_repos, key=lambda repo: repo.name), incomplete
+
+
+def shard_repos(repos: List[Repo], args) -> List[Repo]:
+    """
+    leave out the repos of other shards
+    :param repos: the repos
+    :param args: the commandline parameter
+    :return: the repos of the shard given by --shard or all without it
+    """
+    if not args.shard:
+        return repos
+    shard, shards = args.shard
+    repos = [repo for repo in repos if shard_of(repo.name, shards) == shard]
+    if args.verbose:
+        print(str(len(repos)) + " repos are in shard " + str(shard) + " of " + str(shards))
+    return repos
+
+
+def backup(config: Config, args, repos: List[Repo], incomplete: bool) -> int:
+    """
+    back up the repos and their issues and print the result of every repo
+    :param config: the config to be used
+    :param args: the commandline parameter
+    :param repos: the repos to back up
+    :param incomplete: is the list of repos incomplete?
+    :return: the number of repos that failed
+    """
+    failed = 0
+    create_folder(args.folder, args.verbose)
+
+    if args.verbose:
+        print("downloading to " + args.folder)
+
+    check_for_git()
+
+    plans = plan_repos(repos, args)
+
+    shard_manifest: Optional[ShardManifest] = None
+    if args.shard:
+        shard_file = ShardManifest.file_name(*args.shard)
+        shard_manifest = ShardManifest(os.path.join(args.folder, shard_file), *args.shard)
+
+    states: Optional[RepoStates] = None
+    if not args.force_fetch:
+        states = RepoStates(args.folder)
+        states.load()
+
+    journal = Journal(args.folder)
+    if args.resume:
+        journal.load()
+    else:
+        journal.reset()
+
+    exporter: Optional[Exporter] = None
+    if args.export:
+        exporter = Exporter(args.export, config.export_compression or default_compression(),
+                            config.export_level)
+        try:
+            exporter.load()
+        except ValueError as exception:
+            # the bundles and packs are kept, they are only made in full again
+            print(Fore.RED + str(exception) + ", exporting all repos in full" + Style.RESET_ALL)
+
+    # git transfers, issue exports and asset downloads run in stages of their own,
+    # so a slow clone doesn't hold up the issues of other repos, reported in the original order
+    git_executor = ThreadPoolExecutor(max_workers=args.git_jobs)
+    issue_executor = ThreadPoolExecutor(max_workers=args.issue_jobs)
+    asset_executor = ThreadPoolExecutor(max_workers=args.issue_jobs)
+    downloads = ThreadPoolExecutor(max_workers=config.asset_jobs)
+    executors = [git_executor, issue_executor, asset_executor, downloads]
+    stages: List[Tuple[Repo, List[Optional[Future]]]] = []
+    collected: List[Attachments] = []
+    try:
+        # the largest repos first, so no large repo starts when the others are done
+        git_futures: Dict[str, Future] = {}
+        for repo, download, _, _ in sorted(plans, key=lambda plan: -plan[0].size):
+            if download:
+                git_futures[repo.name] = git_executor.submit(git_stage, config, repo, args,
+                                                             states, journal, exporter)
+        for repo, _, issues, assets in plans:
+            # the asset stage takes the attachments of the issues the issue stage requests
+            attachments = Attachments() if issues and assets else None
+            if attachments is not None:
+                collected.append(attachments)
+            stages.append((repo, [
+                git_futures.get(repo.name),
+                issue_executor.submit(issue_stage, config, repo, args, journal, None, exporter,
+                                      attachments)
+                if issues else None,
+                asset_executor.submit(asset_stage, config, repo, args, downloads, journal,
+                                      attachments)
+                if assets else None]))
+        for repo, futures in stages:
+            result = RepoResult(repo.name)
+            for future in futures:
+                if future is not None:
+                    result.merge(future.result())
+            print(args.target + ": " + str(result) if args.target else result)
+            if not result.ok:
+                failed += 1
+            if shard_manifest is not None:
+                shard_manifest.repos[repo.name] = result.ok
+    except BaseException:
+        # e.g. Ctrl-C: the repos that didn't start are left to --resume,
+        # only the stages already running finish
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        for attachments in collected:
+            # their issue stage may never run
+            attachments.finish()
+        journal.close()
+        raise
+    for executor in executors:
+        executor.shutdown()
+
+    if states is not None:
+        states.save()
+    if exporter is not None:
+        exporter.save()
+    if failed or incomplete:
+        journal.close()
+    else:
+        # nothing left to resume
+        journal.reset()
+    if shard_manifest is not None:
+        shard_manifest.complete = not incomplete
+        shard_manifest.save()
+
+    if failed:
+        print(Fore.RED + (args.target + ": " if args.target else "") + str(failed) + " of "
+              + str(len(stages)) + " repos failed" + Style.RESET_ALL)
+    return failed
+
+
+def sync_repo(config: Config, args, repo_filter: RepoFilter, work: Work) -> RepoResult:
+    """
+    sync what webhooks told of a repo: fetch it and save the issues they named
+    :param config: the config to be used
+    :param args: the commandline parameter
+    :param repo_filter: the rules which repos to leave out
+    :param work: what is waiting to be synced of the repo
+    :return: the result
+    """
+    result = RepoResult(work.name)
+    try:
+        repo = get_repo(config, work.name)
+    except GiteaException as exception:
+        result.fail("can't get the repo: " + (str(exception) or type(exception).__name__))
+        return result
+    reason = repo_filter.excludes(repo)
+    if reason is None and args.shard and shard_of(repo.name, args.shard[1]) != args.shard[0]:
+        reason = "it isn't in shard " + str(args.shard[0]) + " of " + str(args.shard[1])
+    if reason is not None:
+        result.note("skipped because " + reason)
+        return result
+    if work.git:
+        result.merge(git_stage(config, repo, args, None))
+    if work.issues and not args.no_issues:
+        result.merge(issue_stage(config, repo, args, numbers=work.issues))
+    return result
+
+
+def watch(config: Config, args, repo_filter: RepoFilter) -> None:
+    """
+    run until interrupted: sync a repo soon after a webhook tells of a change
+    and back up all repos every [watch] sweep seconds, for changes without a webhook
+    webhook syncs and sweeps take turns, so a repo is never synced twice at the same time
+    :param config: the config to be used
+    :param args: the commandline parameter
+    :param repo_filter: the rules which repos to leave out
+    :return: None
+    """
+    if not config.watch_secret:
+        print(Fore.RED + "--watch needs the secret the webhooks are signed with "
+                         "([watch] secret in the config file)" + Style.RESET_ALL)
+        exit(2)
+    queue = SyncQueue(config.watch_debounce, config.watch_max_delay)
+    server = WebhookServer(config.watch_listen, config.watch_port, config.watch_secret, queue)
+    try:
+        server.start()
+    except OSError as exception:
+        print(Fore.RED + "can't listen on " + config.watch_listen + ":" + str(config.watch_port)
+              + ": " + str(exception) + Style.RESET_ALL)
+        exit(2)
+    print("waiting for webhooks on " + config.watch_listen + ":" + str(config.watch_port))
+    next_sweep = time.monotonic()
+    try:
+        while True:
+            if time.monotonic() >= next_sweep:
+                next_sweep = time.monotonic() + config.watch_sweep
+                try:
+                    repos, incomplete = list_repos(config, args, repo_filter, True)
+                except GiteaException as exception:
+                    print(Fore.RED + "can't list the repos: " + str(exception) + Style.RESET_ALL)
+                    # try again soon instead of a whole sweep later
+                    next_sweep = time.monotonic() + config.watch_max_delay
+                else:
+                    backup(config, args, shard_repos(repos, args), incomplete)
+            work = queue.take(next_sweep - time.monotonic())
+            if work is not None:
+                print(sync_repo(config, args, repo_filter, work))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+def target_args(args, name: str):
+    """
+    get the commandline parameter for a target, whose files go to folders of its own
+    :param args: the commandline parameter
+    :param name: the name of the target or empty if there are no targets
+    :return: the commandline parameter of the target
+    """
+    if not name:
+        return args
+    args = copy.copy(args)
+    args.target = name
+    args.folder = os.path.join(args.folder, name)
+    if args.export:
+        args.export = os.path.join(args.export, name)
+    return args
+
+
+def run_target(config: Config, args) -> RepoResult:
+    """
+    list the repos of a target and back them up, list them or verify the shards
+    :param config: the config of the target
+    :param args: the commandline parameter of the target (see target_args)
+    :return: the result of the target
+    """
+    result = RepoResult(args.target)
+    repo_filter = RepoFilter(config)
+    try:
+        repos, incomplete = list_repos(config, args, repo_filter, args.refresh)
+    except GiteaException as exception:
+        message = "can't list the repos: " + (str(exception) or type(exception).__name__)
+        print(Fore.RED + (args.target + ": " if args.target else "") + message + Style.RESET_ALL)
+        result.fail(message)
+        return result
+
+    if args.verbose:
+        print("detected gitea version " + str(get_version(config)) + " at " + config.url)
+        for name, reason in sorted(repo_filter.excluded.items()):
+            print("removing " + name + " because " + reason)
+
+    if args.verify_shards:
+        exit(0 if check_shards(args.verify_shards, repos, incomplete) else 1)
+
+    repos = shard_repos(repos, args)
+
+    if args.list:
+        # one write with the line break, so the lists of targets don't get mixed
+        print("".join(["Repos" + (" of " + args.target if args.target else "") + ":\n"]
+                      + ["\t- " + repo.name + "\n" for repo in repos]), end="")
+        failed = 0
+    else:
+        failed = backup(config, args, repos, incomplete)
+    result.note(str(len(repos)) + (" repo" if len(repos) == 1 else " repos"))
+    if failed:
+        result.fail(str(failed) + " failed")
+    if incomplete:
+        result.fail("the list of repos is incomplete")
+    return result
+
+
+def print_stats(args) -> None:
+    """
+    print and save the request counters and timings, if asked to
+    :param args: the commandline parameter
+    :return: None
+    """
+    if args.stats:
+        print(get_stats().summary())
+    if args.stats_file:
+        get_stats().save(args.stats_file)
+
+
 def main() -> None:
     """
     the main function loop
@@ -161,6 +791,71 @@ def main() -> None:
                         help='ask about every action',
                         action='store_true',
                         default=False)
+    parser.add_argument('--jobs', '-j',
+                        help='number of repos to work on in parallel',
+                        type=positive_int,
+                        default=1)
+    parser.add_argument('--git-jobs',
+                        help='number of repos to clone or update in parallel (default: --jobs)',
+                        type=positive_int)
+    parser.add_argument('--issue-jobs',
+                        help='number of repos to export issues of in parallel (default: --jobs)',
+                        type=positive_int)
+    parser.add_argument('--issue-format',
+                        help='save the issues of a repo as one file per issue, '
+                             'as one jsonl file with an index or as one sqlite database',
+                        choices=FORMATS,
+                        default=FILES)
+    parser.add_argument('--update', '-u',
+                        help='fetch into existing clones instead of cloning them again',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--force-fetch',
+                        help='with --update fetch every repo, even if it seems unchanged',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--resume',
+                        help='continue the last run where it stopped, '
+                             'the repos and pages of issues it finished are skipped',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--refresh',
+                        help='ask gitea for the list of repos '
+                             'even if a cached one is recent enough',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--shard',
+                        help='only back up the repos of shard i of N (e.g. 2/3), '
+                             'so N hosts can each back up a part of the instance',
+                        type=shard_spec)
+    parser.add_argument('--assets',
+                        help='also download the files of releases and the attachments of issues '
+                             'and comments, see [assets]',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--export',
+                        help='after the backup write what changed since the last export to '
+                             'this folder: a git bundle per repo and the packed issues, '
+                             'compressed as [export] compression',
+                        metavar='FOLDER')
+    parser.add_argument('--watch',
+                        help='keep running: sync a repo when a gitea webhook tells of a change '
+                             'and all repos every [watch] sweep seconds',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--target', '-t',
+                        help='only back up this target ([target:<name>] in the config file), '
+                             'can be given more than once (default: all targets)',
+                        action='append',
+                        dest='targets',
+                        metavar='NAME')
+    parser.add_argument('--stats',
+                        help='print request counters and timings at the end',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--stats-file',
+                        help='write request counters and timings to this file '
+                             '(prometheus text format if it ends with .prom, otherwise json)')
     group = parser.add_mutually_exclusive_group()
     group.add_argument('--folder', '-f',
                        help='download git repos here',
@@ -169,43 +864,97 @@ def main() -> None:
                        help='list repos only (no download)',
                        action='store_true',
                        default=False)
+    group.add_argument('--verify-shards',
+                       help='check that the manifests of all shards together '
+                            'cover every repo exactly once (no download)',
+                       nargs='+',
+                       metavar='MANIFEST')
 
     args = parser.parse_args()
+    if args.watch and (args.list or args.verify_shards or args.always_ask):
+        parser.error("--watch can't be used with --list, --verify-shards or --always-ask")
+    if args.watch:
+        # every sweep after the first one finds the clones of the one before
+        args.update = True
 
-    config: Config = get_config(args.config)
+    args.git_jobs = args.git_jobs or args.jobs
+    args.issue_jobs = args.issue_jobs or args.jobs
+
+    try:
+        config: Config = get_config(args.config)
+    except (ValueError, configparser.Error) as exception:
+        print(Fore.RED + "invalid config file: " + str(exception) + Style.RESET_ALL)
+        exit(2)
+    # every issue worker and download should get a connection of its own
+    config.pool_size = max(config.pool_size,
+                           args.issue_jobs + (config.asset_jobs if args.assets else 0))
+    for target in config.targets.values():
+        target.pool_size = config.pool_size
 
     if args.verbose:
         config.print()
-        print("detected gitea version " + str(get_version(config)))
 
-    repos: List[Repo] = get_repos(config)
-
-    repos = remove_exceptions(config.exceptions, repos, args.verbose)
+    if args.export and config.export_compression not in COMPRESSIONS + [""]:
+        print(Fore.RED + "unknown compression " + config.export_compression + " ([export] "
+              "compression must be one of " + ", ".join(COMPRESSIONS) + ")" + Style.RESET_ALL)
+        exit(2)
+    if args.export and config.export_compression == ZSTD and shutil.which('zstd') is None:
+        print(Fore.RED + "[export] compression is zstd, but zstd isn't installed"
+              + Style.RESET_ALL)
+        exit(2)
 
-    if args.list:
-        # List Repos
-        print("Repos:")
-        for repo in repos:
-            print("\t- " + repo.name)
-    else:
-        create_folder(args.folder, args.verbose)
+    if config.git_transport not in TRANSPORTS:
+        print(Fore.RED + "unknown transport " + config.git_transport + " ([git] transport must "
+              "be one of " + ", ".join(TRANSPORTS) + ")" + Style.RESET_ALL)
+        exit(2)
+    if args.assets and config.asset_jobs < 1:
+        print(Fore.RED + "[assets] jobs must be at least 1" + Style.RESET_ALL)
+        exit(2)
 
-        if args.verbose:
-            print("downloading to " + args.folder)
+    targets: Dict[str, Config] = config.targets or {"": config}
+    if args.targets:
+        unknown = [name for name in args.targets if name not in config.targets]
+        if unknown:
+            print(Fore.RED + "unknown target " + ", ".join(unknown) + " (there is no ["
+                  + TARGET_PREFIX + unknown[0] + "] in the config file)" + Style.RESET_ALL)
+            exit(2)
+        targets = {name: config.targets[name] for name in args.targets}
+    if len(targets) > 1 and (args.watch or args.verify_shards or args.always_ask):
+        print(Fore.RED + "--watch, --verify-shards and --always-ask need a single target, "
+                         "choose one with --target" + Style.RESET_ALL)
+        exit(2)
 
-        check_for_git()
+    # the targets share these limits, see [limits]
+    get_limit(API_REQUESTS, config.limit_requests)
+    get_limit(GIT_TRANSFERS, config.limit_git)
+    get_limit(DISK_WRITES, config.limit_writes)
+    args.target = ""
 
-        # clone each git repo
-        for repo in repos:
-            if args.always_ask:
-                if ask("download " + repo.name):
-                    download_repo(args.folder, repo)
-                    continue
-            else:
-                download_repo(args.folder, repo)
+    try:
+        if args.watch:
+            name, target = next(iter(targets.items()))
+            watch(target, target_args(args, name), RepoFilter(target))
+            print_stats(args)
+            return
+        if len(targets) == 1:
+            results = [run_target(target, target_args(args, name))
+                       for name, target in targets.items()]
+        else:
+            # the targets are backed up at the same time, each with its own workers
+            with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+                futures = [executor.submit(run_target, target, target_args(args, name))
+                           for name, target in targets.items()]
+                results = [future.result() for future in futures]
+            print("Targets:")
+            for result in results:
+                print("\t" + str(result))
 
-            if not args.no_issues:
-                working_on_issues(config, repo, args)
+        print_stats(args)
+        if not all(result.ok for result in results):
+            exit(1)
+    finally:
+        # the shared ssh connections would otherwise stay open for [git] persist seconds
+        stop_transports()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,86 @@
+"""
+holds the release assets and attachments of a repo
+"""
+from collections import namedtuple
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+from util.atomic import atomic_write_json
+
+# a file of a release or attached to an issue or comment:
+# - url (to download it from)
+# - path (relative to the assets folder of the repo)
+# - size (bytes, 0 if unknown)
+Asset = namedtuple("Asset", ['url', 'path', 'size'])
+
+STATE_NAME = ".assets.json"  # in the assets folder of a repo
+
+
+class Attachments:
+    """
+    represents the attachments seen while the issues of a repo were requested consisting of:
+    - assets (path of the attachment to Asset)
+    - since (the issues and comments were requested changed since then, None for all of them)
+    - complete (were all of them seen, e.g. not after a resume?)
+    the issue stage fills them and calls finish, so the asset stage
+    doesn't need to request the issues and comments again (see covers)
+    """
+
+    def __init__(self) -> None:
+        self.assets: Dict[str, Asset] = {}
+        self.since: Optional[str] = None
+        self.complete: bool = False
+        self.__finished = threading.Event()
+
+    def finish(self) -> None:
+        """
+        tell that no more attachments are added
+        :return: None
+        """
+        self.__finished.set()
+
+    def covers(self, since: Optional[str]) -> bool:
+        """
+        wait until the issues were requested and check if all attachments
+        of the issues and comments changed since then were seen
+        :param since: the time (ISO 8601) or None for all attachments
+        :return: bool
+        """
+        self.__finished.wait()
+        return self.complete and (self.since is None or (since is not None and self.since <= since))
+
+
+def safe_name(name: str) -> str:
+    """
+    make a name given by gitea usable as a file name
+    :param name: the name (of a release, tag or file)
+    :return: the name without path separators
+    """
+    name = name.replace('/', '_').replace('\\', '_').replace('\0', '_').strip()
+    return '_' if name in ['', '.', '..'] else name
+
+
+def load_synced_at(folder: str) -> Optional[str]:
+    """
+    get when the attachments of a repo were last synced
+    :param folder: the assets folder of the repo
+    :return: the time (ISO 8601) or None if never
+    """
+    try:
+        with open(os.path.join(folder, STATE_NAME)) as state_file:
+            return json.load(state_file).get('synced_at')
+    except (OSError, ValueError):
+        return None
+
+
+def save_synced_at(folder: str, synced_at: str) -> None:
+    """
+    record when the attachments of a repo were synced
+    :param folder: the assets folder of the repo
+    :param synced_at: the time (see sync_start)
+    :return: None
+    """
+    os.makedirs(folder, exist_ok=True)
+    atomic_write_json(os.path.join(folder, STATE_NAME), {'synced_at': synced_at})
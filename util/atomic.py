@@ -0,0 +1,63 @@
+"""
+holds writing files so that after a crash or a power loss there is either the old or the new file
+"""
+from contextlib import contextmanager
+import json
+import os
+import threading
+from typing import IO, Any, Iterator, Optional
+
+
+@contextmanager
+def atomic_file(path: str, mode: str = 'w') -> Iterator[IO]:
+    """
+    open a temporary file to write the new content of a file to,
+    once the block is left without an exception it is synced to the disk and renamed to the file
+    the temporary file is of the process and thread, so several writers of a file don't meet
+    :param path: the file
+    :param mode: 'w' for text or 'wb' for bytes
+    :return: the temporary file
+    """
+    temporary = path + "." + str(os.getpid()) + "-" + str(threading.get_ident()) + ".tmp"
+    try:
+        with open(temporary, mode) as out:
+            yield out
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.isfile(temporary):
+            os.remove(temporary)
+        raise
+    __sync_folder(os.path.dirname(path) or ".")
+
+
+def atomic_write_json(path: str, data: Any, indent: Optional[int] = None) -> None:
+    """
+    write data as json to a file (see atomic_file)
+    :param path: the file
+    :param data: the data
+    :param indent: the indent of the json or None for one line
+    :return: None
+    """
+    with atomic_file(path) as out:
+        json.dump(data, out, indent=indent)
+
+
+def __sync_folder(folder: str) -> None:
+    """
+    sync a folder to the disk, so a rename in it survives a power loss
+    :param folder: the folder
+    :return: None
+    """
+    try:
+        descriptor = os.open(folder, os.O_RDONLY)
+    except OSError:
+        # e.g. folders can't be opened on windows
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
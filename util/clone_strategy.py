@@ -0,0 +1,142 @@
+"""
+holds the strategies repos are cloned with, chosen per repo by size, state and name
+"""
+import configparser
+from datetime import datetime, timedelta, timezone
+import json
+from typing import List, Optional, Pattern, Set
+
+from util.patterns import compile_patterns, matches
+from util.repo import Repo
+
+SECTION_PREFIX = "strategy:"  # sections of the config file that are strategies
+
+
+class CloneStrategy:
+    """
+    represents how matching repos are cloned consisting of:
+    - name (of the strategy)
+    conditions, all given ones must match:
+    - names, pattern (compiled patterns of repo names, see compile_patterns)
+    - min_size (in KB, 0 for any size)
+    - archived (True or False to only match archived or not archived repos, None for both)
+    - not_updated_for (days since the last change, 0 for any)
+    options:
+    - depth (only clone the last commits, 0 for all)
+    - blob_filter (partial clone filter like blob:none, empty for none)
+    - single_branch (only clone the default branch)
+    - mirror (clone all refs as bare mirror)
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self.names: Set[str] = set()
+        self.pattern: Optional[Pattern] = None
+        self.has_patterns: bool = False
+        self.min_size: int = 0
+        self.archived: Optional[bool] = None
+        self.not_updated_for: float = 0
+        self.depth: int = 0
+        self.blob_filter: str = ""
+        self.single_branch: bool = False
+        self.mirror: bool = False
+
+    def load(self, section: configparser.SectionProxy) -> None:
+        """
+        load the strategy from its section of the config file
+        :param section: the section
+        :return: None
+        :raises ValueError: if a pattern is invalid
+        """
+        patterns = json.loads(section.get('pattern', fallback="") or "[]")
+        self.has_patterns = bool(patterns)
+        try:
+            self.names, self.pattern = compile_patterns(patterns)
+        except ValueError as exception:
+            raise ValueError("[" + section.name + "] pattern: " + str(exception)) from exception
+        self.min_size = int(section.getfloat('min_size', fallback=0) * 1024)
+        if section.get('archived', fallback=""):
+            self.archived = section.getboolean('archived')
+        self.not_updated_for = section.getfloat('not_updated_for', fallback=0)
+        self.depth = section.getint('depth', fallback=0)
+        self.blob_filter = section.get('filter', fallback="")
+        self.single_branch = section.getboolean('single_branch', fallback=False)
+        self.mirror = section.getboolean('mirror', fallback=False)
+
+    def matches(self, repo: Repo) -> bool:
+        """
+        check if a repo should be cloned with this strategy
+        :param repo: the repo
+        :return: bool
+        """
+        if self.has_patterns and not matches(repo.name, self.names, self.pattern):
+            return False
+        if self.min_size and repo.size < self.min_size:
+            return False
+        if self.archived is not None and repo.archived != self.archived:
+            return False
+        if self.not_updated_for:
+            updated_at = CloneStrategy.__parse_time(repo.updated_at)
+            unchanged_since = datetime.now(timezone.utc) - timedelta(days=self.not_updated_for)
+            if updated_at is None or updated_at > unchanged_since:
+                return False
+        return True
+
+    def clone_arguments(self) -> List[str]:
+        """
+        get the arguments for git clone
+        :return: list of arguments
+        """
+        arguments: List[str] = []
+        if self.mirror:
+            arguments.append('--mirror')
+        if self.depth:
+            arguments += ['--depth', str(self.depth)]
+        if self.blob_filter:
+            arguments.append('--filter=' + self.blob_filter)
+        if self.single_branch:
+            arguments.append('--single-branch')
+        return arguments
+
+    @staticmethod
+    def __parse_time(value: str) -> Optional[datetime]:
+        """
+        parse a time of the gitea api
+        :param value: the time (ISO 8601)
+        :return: the time or None if it isn't one
+        """
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed
+
+
+def load_strategies(config: configparser.ConfigParser) -> List[CloneStrategy]:
+    """
+    load all strategies of a config file in the order they are written in
+    :param config: the config file
+    :return: list of CloneStrategy
+    """
+    strategies: List[CloneStrategy] = []
+    for section in config.sections():
+        if section.startswith(SECTION_PREFIX):
+            strategy = CloneStrategy(section[len(SECTION_PREFIX):])
+            strategy.load(config[section])
+            strategies.append(strategy)
+    return strategies
+
+
+def choose_strategy(strategies: List[CloneStrategy], repo: Repo) -> Optional[CloneStrategy]:
+    """
+    get the first strategy matching a repo
+    :param strategies: the strategies in order
+    :param repo: the repo
+    :return: the strategy or None to clone everything
+    """
+    for strategy in strategies:
+        if strategy.matches(repo):
+            return strategy
+    return None
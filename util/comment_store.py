@@ -0,0 +1,114 @@
+"""
+holds the comments of the issues of a repo while the issues are requested
+"""
+import sqlite3
+from typing import Dict, Hashable, Iterator, List, Optional, Set
+
+from util.issue import Comment
+
+# comments kept in memory, the comments of larger repos go to a temporary database
+COMMENTS_IN_MEMORY = 10000
+
+
+class CommentStore:
+    """
+    represents the comments of a repo grouped by the number of their issue consisting of:
+    - limit (of the comments kept in memory)
+    once there are more comments they all go to a temporary sqlite database on disk,
+    so the memory a full export needs doesn't grow with the comments of the repo;
+    a comment that shows up again (e.g. on the next page) is recognized by its id
+    and can be used like a dict of issue number to list of Comment (pop, in, len, iter)
+    """
+
+    def __init__(self, limit: int = COMMENTS_IN_MEMORY) -> None:
+        self.limit: int = limit
+        self.__ids: Set[Hashable] = set()
+        self.__comments: Dict[int, List[Comment]] = {}
+        self.__count: int = 0
+        self.__numbers: Set[int] = set()
+        self.__database: Optional[sqlite3.Connection] = None
+
+    def add(self, comment_id: Optional[Hashable], number: int, comment: Comment) -> bool:
+        """
+        add a comment
+        :param comment_id: the id of the comment or None if it is unknown
+        :param number: the number of its issue
+        :param comment: the comment
+        :return: was it seen for the first time?
+        """
+        if self.__database is None and self.__count >= self.limit:
+            self.__spill()
+        if self.__database is not None:
+            inserted = self.__database.execute(
+                'INSERT OR IGNORE INTO comments (id, number, author, body) VALUES (?, ?, ?, ?)',
+                (None if comment_id is None else str(comment_id), number,
+                 comment.author, comment.body)).rowcount
+            if inserted:
+                self.__numbers.add(number)
+            return inserted > 0
+        if comment_id is not None:
+            if comment_id in self.__ids:
+                return False
+            self.__ids.add(comment_id)
+        self.__comments.setdefault(number, []).append(comment)
+        self.__numbers.add(number)
+        self.__count += 1
+        return True
+
+    def pop(self, number: int, default: Optional[List[Comment]] = None) -> List[Comment]:
+        """
+        take the comments of an issue, each issue needs them once
+        :param number: the number of the issue
+        :param default: what to return if it has no comments
+        :return: list of Comment in the order they were added
+        """
+        if number not in self.__numbers:
+            return default if default is not None else []
+        self.__numbers.discard(number)
+        if self.__database is None:
+            return self.__comments.pop(number)
+        rows = self.__database.execute('SELECT author, body FROM comments WHERE number = ? '
+                                       'ORDER BY position', (number,)).fetchall()
+        self.__database.execute('DELETE FROM comments WHERE number = ?', (number,))
+        return [Comment(author=author, body=body) for author, body in rows]
+
+    def close(self) -> None:
+        """
+        forget the comments and remove the temporary database
+        :return: None
+        """
+        if self.__database is not None:
+            self.__database.close()
+            self.__database = None
+        self.__ids = set()
+        self.__comments = {}
+        self.__numbers = set()
+
+    def __contains__(self, number: int) -> bool:
+        return number in self.__numbers
+
+    def __len__(self) -> int:
+        return len(self.__numbers)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self.__numbers))
+
+    def __spill(self) -> None:
+        """
+        move the comments in memory to a temporary database
+        :return: None
+        """
+        # an empty name is a private database on disk, which is removed once it is closed
+        self.__database = sqlite3.connect("")
+        self.__database.execute('CREATE TABLE comments (position INTEGER PRIMARY KEY, '
+                                'id TEXT UNIQUE, number INTEGER, author TEXT, body TEXT)')
+        self.__database.execute('CREATE INDEX comments_number ON comments (number)')
+        # the ids seen so far only keep their comments out, so they belong to no issue
+        self.__database.executemany('INSERT INTO comments (id, number) VALUES (?, -1)',
+                                    ((str(comment_id),) for comment_id in self.__ids))
+        for number, comments in self.__comments.items():
+            self.__database.executemany(
+                'INSERT INTO comments (number, author, body) VALUES (?, ?, ?)',
+                ((number, comment.author, comment.body) for comment in comments))
+        self.__ids = set()
+        self.__comments = {}
@@ -2,25 +2,100 @@
 holds all config concerned classes
 """
 import configparser
+import copy
 import json
 import os
 from enum import Enum
-from typing import List
+from typing import Dict, List
 from urllib.parse import urlparse
 
+from util.clone_strategy import CloneStrategy, load_strategies
+from util.patterns import compile_patterns
+
+TARGET_PREFIX = "target:"  # sections of the config file that are targets
+
 
 class Config:
     """
     represents an config consisting of
         - url (of the gitea instance)
-        - exception (list of exceptions)
+        - exception (list of exceptions: names, globs or regular expressions)
+        - exclude_owners (owners whose repos are left out)
+        - skip_archived, skip_forks, skip_mirrors (leave out these kinds of repos)
+        - max_size (megabytes, larger repos are left out, 0 for no limit)
+        - only_own (leave out repos the user doesn't own)
+        - search (only repos gitea finds for this keyword)
         - auth
+        - timeout (seconds to wait for the gitea instance)
+        - pool_size (number of connections kept open to the gitea instance)
+        - page_workers (number of pages of a list requested at the same time)
+        - retries (how often a failed request is tried again)
+        - backoff (seconds to wait before the first retry, doubled for each further one)
+        - cache_folder (for cached api responses, empty to disable the cache)
+        - cache_max_age (days after which unused cached responses are deleted)
+        - cache_max_size (megabytes the cached responses may use)
+        - listing_ttl (seconds the cached list of repos is used without asking gitea, 0 to disable)
+        - listing_stale (seconds after listing_ttl it is still used while it is refreshed)
+        - clone_strategies (how repos are cloned, see clone_strategy)
+        - git_transport (how git reaches the gitea instance, see transport)
+        - git_multiplex (share one ssh connection between all git processes)
+        - git_persist (seconds the shared ssh connection stays open after its last use)
+        - watch_listen, watch_port (address the webhooks are received on in watch mode)
+        - watch_secret (the secret the webhooks are signed with)
+        - watch_debounce (seconds a repo waits after its last webhook before it is synced)
+        - watch_max_delay (seconds a repo waits at most after its first webhook)
+        - watch_sweep (seconds between two syncs of all repos in watch mode)
+        - export_compression (of the files of --export, empty for the best one installed)
+        - export_level (of the compression, 0 for its default)
+        - asset_jobs (number of release assets and attachments downloaded at the same time)
+        - asset_bandwidth (kilobytes per second all downloads together may use, 0 for no limit)
+        - asset_max_size (megabytes, larger assets are left out, 0 for no limit)
+        - limit_requests, limit_git, limit_writes (api requests, clones and fetches and
+          writes of issues and exports all targets together run at the same time, 0 for no limit)
+        - targets (name to the config of each [target:<name>] section, empty if there are none)
+    a target has its own url, auth and [repos] rules, everything else is shared
     """
 
     def __init__(self) -> None:
         self.url: str = urlparse("http://localhost").geturl()
         self.exceptions: List[str] = []
+        self.exclude_owners: List[str] = []
+        self.skip_archived: bool = False
+        self.skip_forks: bool = False
+        self.skip_mirrors: bool = False
+        self.max_size: int = 0
+        self.only_own: bool = False
+        self.search: str = ""
         self.auth: Auth = Auth()
+        self.timeout: float = 30.0
+        self.pool_size: int = 10
+        self.page_workers: int = 4
+        self.retries: int = 5
+        self.backoff: float = 1.0
+        self.cache_folder: str = ""
+        self.cache_max_age: float = 30
+        self.cache_max_size: int = 100
+        self.listing_ttl: float = 0
+        self.listing_stale: float = 24 * 60 * 60
+        self.clone_strategies: List[CloneStrategy] = []
+        self.git_transport: str = "ssh"
+        self.git_multiplex: bool = True
+        self.git_persist: int = 60
+        self.watch_listen: str = "127.0.0.1"
+        self.watch_port: int = 8765
+        self.watch_secret: str = ""
+        self.watch_debounce: float = 30
+        self.watch_max_delay: float = 5 * 60
+        self.watch_sweep: float = 24 * 60 * 60
+        self.export_compression: str = ""
+        self.export_level: int = 0
+        self.asset_jobs: int = 4
+        self.asset_bandwidth: int = 0
+        self.asset_max_size: int = 0
+        self.limit_requests: int = 0
+        self.limit_git: int = 0
+        self.limit_writes: int = 0
+        self.targets: Dict[str, 'Config'] = {}
 
     def load_config(self, config_name: str) -> None:
         """
@@ -31,13 +106,82 @@ class Config:
         config = configparser.ConfigParser()
         config.read(config_name)
 
-        self.url = urlparse(config.get("gitea", "url")).geturl()
-        exceptions = config.get("repos", "exception")
-        if exceptions:
-            self.exceptions = json.loads(exceptions)
-        else:
-            self.exceptions = []
-        self.auth.load(config)
+        targets = [section for section in config.sections()
+                   if section.startswith(TARGET_PREFIX)]
+        # with targets, [gitea] and [auth] only hold what the targets have in common
+        if config.has_section("gitea") or not targets:
+            self.url = urlparse(config.get("gitea", "url")).geturl()
+        self.__load_repos(config, "repos")
+        if config.has_section("auth") or not targets:
+            self.auth.load(config)
+        self.timeout = config.getfloat("http", "timeout", fallback=self.timeout)
+        self.pool_size = config.getint("http", "pool_size", fallback=self.pool_size)
+        self.page_workers = config.getint("http", "page_workers", fallback=self.page_workers)
+        self.retries = config.getint("http", "retries", fallback=self.retries)
+        self.backoff = config.getfloat("http", "backoff", fallback=self.backoff)
+        self.cache_folder = config.get("cache", "folder", fallback=self.cache_folder)
+        self.cache_max_age = config.getfloat("cache", "max_age", fallback=self.cache_max_age)
+        self.cache_max_size = config.getint("cache", "max_size", fallback=self.cache_max_size)
+        self.listing_ttl = config.getfloat("cache", "listing_ttl", fallback=self.listing_ttl)
+        self.listing_stale = config.getfloat("cache", "listing_stale", fallback=self.listing_stale)
+        self.clone_strategies = load_strategies(config)
+        self.git_transport = config.get("git", "transport", fallback=self.git_transport)
+        self.git_multiplex = config.getboolean("git", "multiplex", fallback=self.git_multiplex)
+        self.git_persist = config.getint("git", "persist", fallback=self.git_persist)
+        self.watch_listen = config.get("watch", "listen", fallback=self.watch_listen)
+        self.watch_port = config.getint("watch", "port", fallback=self.watch_port)
+        self.watch_secret = config.get("watch", "secret", fallback=self.watch_secret)
+        self.watch_debounce = config.getfloat("watch", "debounce", fallback=self.watch_debounce)
+        self.watch_max_delay = config.getfloat("watch", "max_delay",
+                                               fallback=self.watch_max_delay)
+        self.watch_sweep = config.getfloat("watch", "sweep", fallback=self.watch_sweep)
+        self.export_compression = config.get("export", "compression",
+                                             fallback=self.export_compression)
+        self.export_level = config.getint("export", "level", fallback=self.export_level)
+        self.asset_jobs = config.getint("assets", "jobs", fallback=self.asset_jobs)
+        self.asset_bandwidth = config.getint("assets", "bandwidth", fallback=self.asset_bandwidth)
+        self.asset_max_size = config.getint("assets", "max_size", fallback=self.asset_max_size)
+        self.limit_requests = config.getint("limits", "requests", fallback=self.limit_requests)
+        self.limit_git = config.getint("limits", "git", fallback=self.limit_git)
+        self.limit_writes = config.getint("limits", "writes", fallback=self.limit_writes)
+
+        self.targets = {}
+        for section in targets:
+            target = copy.deepcopy(self)
+            target.targets = {}
+            target.url = urlparse(config.get(section, "url", fallback=self.url)).geturl()
+            if any(config.has_option(section, option) for option in ["user", "password", "token"]):
+                target.auth = Auth()
+                target.auth.load(config, section)
+            target.__load_repos(config, section)
+            self.targets[section[len(TARGET_PREFIX):]] = target
+
+    def __load_repos(self, config: configparser.ConfigParser, section: str) -> None:
+        """
+        load the rules which repos are left out
+        :param config: the file to load from
+        :param section: the section of the rules, missing options stay as they are
+        :return: None
+        :raises ValueError: if the exceptions are invalid
+        """
+        exceptions = config.get(section, "exception", fallback=None)
+        if exceptions is not None:
+            self.exceptions = json.loads(exceptions) if exceptions else []
+            try:
+                # the repo filter compiles them, so a mistake shows up before any request
+                compile_patterns(self.exceptions)
+            except ValueError as exception:
+                raise ValueError("[" + section + "] exception: " + str(exception)) from exception
+        exclude_owners = config.get(section, "exclude_owners", fallback=None)
+        if exclude_owners is not None:
+            self.exclude_owners = json.loads(exclude_owners) if exclude_owners else []
+        self.skip_archived = config.getboolean(section, "skip_archived",
+                                               fallback=self.skip_archived)
+        self.skip_forks = config.getboolean(section, "skip_forks", fallback=self.skip_forks)
+        self.skip_mirrors = config.getboolean(section, "skip_mirrors", fallback=self.skip_mirrors)
+        self.max_size = config.getint(section, "max_size", fallback=self.max_size)
+        self.only_own = config.getboolean(section, "only_own", fallback=self.only_own)
+        self.search = config.get(section, "search", fallback=self.search)
 
     def save_config(self, config_name: str) -> None:
         """
@@ -54,13 +198,54 @@ class Config:
             config.add_section('gitea')
             config.set('gitea', 'url', self.url)
             config.add_section('repos')
-            config.set('repos', 'exceptions', json.dumps(self.exceptions))
+            config.set('repos', 'exception', json.dumps(self.exceptions))
+            config.set('repos', 'exclude_owners', json.dumps(self.exclude_owners))
+            config.set('repos', 'skip_archived', str(self.skip_archived).lower())
+            config.set('repos', 'skip_forks', str(self.skip_forks).lower())
+            config.set('repos', 'skip_mirrors', str(self.skip_mirrors).lower())
+            config.set('repos', 'max_size', str(self.max_size))
+            config.set('repos', 'only_own', str(self.only_own).lower())
+            config.set('repos', 'search', self.search)
             config.add_section('auth')
             config.set('auth', 'user', self.auth.user)
             if self.auth.mode == AuthMode.PASSWORD:
                 config.set('auth', 'password', self.auth.password)
             elif self.auth.mode == AuthMode.Token:
                 config.set('auth', 'token', self.auth.token)
+            config.add_section('http')
+            config.set('http', 'timeout', str(self.timeout))
+            config.set('http', 'pool_size', str(self.pool_size))
+            config.set('http', 'page_workers', str(self.page_workers))
+            config.set('http', 'retries', str(self.retries))
+            config.set('http', 'backoff', str(self.backoff))
+            config.add_section('cache')
+            config.set('cache', 'folder', self.cache_folder)
+            config.set('cache', 'max_age', str(self.cache_max_age))
+            config.set('cache', 'max_size', str(self.cache_max_size))
+            config.set('cache', 'listing_ttl', str(self.listing_ttl))
+            config.set('cache', 'listing_stale', str(self.listing_stale))
+            config.add_section('git')
+            config.set('git', 'transport', self.git_transport)
+            config.set('git', 'multiplex', str(self.git_multiplex).lower())
+            config.set('git', 'persist', str(self.git_persist))
+            config.add_section('watch')
+            config.set('watch', 'listen', self.watch_listen)
+            config.set('watch', 'port', str(self.watch_port))
+            config.set('watch', 'secret', self.watch_secret)
+            config.set('watch', 'debounce', str(self.watch_debounce))
+            config.set('watch', 'max_delay', str(self.watch_max_delay))
+            config.set('watch', 'sweep', str(self.watch_sweep))
+            config.add_section('export')
+            config.set('export', 'compression', self.export_compression)
+            config.set('export', 'level', str(self.export_level))
+            config.add_section('assets')
+            config.set('assets', 'jobs', str(self.asset_jobs))
+            config.set('assets', 'bandwidth', str(self.asset_bandwidth))
+            config.set('assets', 'max_size', str(self.asset_max_size))
+            config.add_section('limits')
+            config.set('limits', 'requests', str(self.limit_requests))
+            config.set('limits', 'git', str(self.limit_git))
+            config.set('limits', 'writes', str(self.limit_writes))
             config.write(config_file)
             config_file.close()
 
@@ -74,8 +259,57 @@ class Config:
         print("exceptions:")
         for exception in self.exceptions:
             print("\t- '%s'" % exception)
+        print("exclude_owners: %s" % self.exclude_owners)
+        print("skip_archived: %s" % self.skip_archived)
+        print("skip_forks: %s" % self.skip_forks)
+        print("skip_mirrors: %s" % self.skip_mirrors)
+        print("max_size: %s" % self.max_size)
+        print("only_own: %s" % self.only_own)
+        print("search: '%s'" % self.search)
         print("auth:")
         self.auth.print()
+        print("http:")
+        print("\ttimeout: %s" % self.timeout)
+        print("\tpool_size: %s" % self.pool_size)
+        print("\tpage_workers: %s" % self.page_workers)
+        print("\tretries: %s" % self.retries)
+        print("\tbackoff: %s" % self.backoff)
+        print("cache:")
+        print("\tfolder: '%s'" % self.cache_folder)
+        print("\tmax_age: %s" % self.cache_max_age)
+        print("\tmax_size: %s" % self.cache_max_size)
+        print("\tlisting_ttl: %s" % self.listing_ttl)
+        print("\tlisting_stale: %s" % self.listing_stale)
+        print("git:")
+        print("\ttransport: %s" % self.git_transport)
+        print("\tmultiplex: %s" % self.git_multiplex)
+        print("\tpersist: %s" % self.git_persist)
+        print("watch:")
+        print("\tlisten: %s:%s" % (self.watch_listen, self.watch_port))
+        print("\tsecret: %s" % ("set" if self.watch_secret else "not set"))
+        print("\tdebounce: %s" % self.watch_debounce)
+        print("\tmax_delay: %s" % self.watch_max_delay)
+        print("\tsweep: %s" % self.watch_sweep)
+        print("export:")
+        print("\tcompression: '%s'" % self.export_compression)
+        print("\tlevel: %s" % self.export_level)
+        print("assets:")
+        print("\tjobs: %s" % self.asset_jobs)
+        print("\tbandwidth: %s" % self.asset_bandwidth)
+        print("\tmax_size: %s" % self.asset_max_size)
+        print("limits:")
+        print("\trequests: %s" % self.limit_requests)
+        print("\tgit: %s" % self.limit_git)
+        print("\twrites: %s" % self.limit_writes)
+        print("clone strategies:")
+        for strategy in self.clone_strategies:
+            print("\t- %s: %s" % (strategy.name, " ".join(strategy.clone_arguments())))
+        for name, target in self.targets.items():
+            print("target %s:" % name)
+            print("\turl: %s" % target.url)
+            target.auth.print()
+            print("\texceptions: %s" % target.exceptions)
+            print("\texclude_owners: %s" % target.exclude_owners)
 
 
 class Auth:
@@ -89,21 +323,22 @@ class Auth:
         self.password: str = "sicher123"
         self.token: str = ""
 
-    def load(self, config: configparser.ConfigParser) -> None:
+    def load(self, config: configparser.ConfigParser, section: str = "auth") -> None:
         """
         load auth from file
         :param config: the file to load the config from
+        :param section: the section of the auth (e.g. of a target)
         :return: None
         """
-        self.user = config.get("auth", "user")
+        self.user = config.get(section, "user")
         try:
-            self.token = config.get("auth", "token")
+            self.token = config.get(section, "token")
             self.mode = AuthMode.TOKEN
         except configparser.NoOptionError:
             pass
 
         try:
-            self.password = config.get("auth", "password")
+            self.password = config.get(section, "password")
             self.mode = AuthMode.PASSWORD
         except configparser.NoOptionError:
             pass
@@ -139,6 +374,7 @@ def get_config(config_name: str) -> Config:
     or if this also not found get a default config
     :param config_name: the name of the file to load the config from
     :return: a Config for the program
+    :raises ValueError: if a value of the config file is invalid
     """
     # create a default config
     config: Config = Config()
@@ -0,0 +1,254 @@
+"""
+holds the export of the backup for offsite storage: git bundles and packed issues,
+only what changed since the last export and compressed on the way to the file
+"""
+from datetime import datetime, timezone
+import gzip
+import io
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import threading
+from typing import Any, Dict, Optional
+
+from util.atomic import atomic_write_json
+from util.git import bundle, existing_objects, list_refs, GitException
+from util.issue_archive import FILES, open_archive
+from util.manifest import Manifest
+
+ZSTD = "zstd"  # zstd executable, with a thread per core
+GZIP = "gzip"  # python's gzip, one thread
+NONE = "none"  # not compressed
+COMPRESSIONS = [ZSTD, GZIP, NONE]
+EXTENSIONS = {ZSTD: ".zst", GZIP: ".gz", NONE: ""}
+
+
+def default_compression() -> str:
+    """
+    get the best compression that can be used here
+    :return: ZSTD if the zstd executable is installed, otherwise GZIP
+    """
+    return ZSTD if shutil.which('zstd') is not None else GZIP
+
+
+class CompressedFile:
+    """
+    represents a file being written compressed consisting of:
+    - path (of the file, it only appears there once it is complete, see close)
+    - compression (see COMPRESSIONS)
+    - level (of the compression or 0 for the default of the compression)
+    the data is compressed while it is written, nothing is staged uncompressed
+    """
+
+    def __init__(self, path: str, compression: str, level: int = 0) -> None:
+        self.path: str = path
+        self.compression: str = compression
+        self.level: int = level
+        self.__temporary = path + ".tmp"
+        self.__file = open(self.__temporary, 'wb')
+        self.__zstd: Optional[subprocess.Popen] = None
+        self.__out: Any = self.__file
+        if compression == ZSTD:
+            self.__zstd = subprocess.Popen(['zstd', '-q', '-c', '-T0']
+                                           + (['-' + str(level)] if level else []),
+                                           stdin=subprocess.PIPE, stdout=self.__file)
+            self.__out = self.__zstd.stdin
+        elif compression == GZIP:
+            self.__out = gzip.GzipFile(fileobj=self.__file, mode='wb',
+                                       compresslevel=level or 6)
+
+    def write(self, data: bytes) -> int:
+        """
+        compress and write data
+        :param data: the data
+        :return: the number of bytes written
+        """
+        return self.__out.write(data)
+
+    def close(self) -> None:
+        """
+        finish the file and move it to its path
+        :return: None
+        """
+        if self.__out is not self.__file:
+            self.__out.close()
+        if self.__zstd is not None and self.__zstd.wait() != 0:
+            self.abort()
+            raise OSError("zstd failed for " + self.path)
+        self.__file.close()
+        os.replace(self.__temporary, self.path)
+
+    def abort(self) -> None:
+        """
+        throw away what was written
+        :return: None
+        """
+        if self.__zstd is not None:
+            self.__zstd.stdin.close()
+            self.__zstd.wait()
+        self.__file.close()
+        if os.path.isfile(self.__temporary):
+            os.remove(self.__temporary)
+
+
+class Exporter:
+    """
+    represents the export of a backup consisting of:
+    - folder (to export to, <owner>/<repo>/<time>-*.bundle and <time>-issues.tar in it)
+    - compression, level (see CompressedFile)
+    - stamp (the time of this export, the start of the file names)
+    - repos (name of the repo to its refs and the hashes, packed files and format of its issues
+      at the last export)
+    the first bundle of a repo is full, the following ones only hold the commits since;
+    to restore a repo clone its full bundle and fetch the following ones in order
+    all methods may be called from several threads
+    """
+    FILE_NAME = ".export.json"
+
+    def __init__(self, folder: str, compression: str, level: int = 0) -> None:
+        self.folder: str = folder
+        self.compression: str = compression
+        self.level: int = level
+        self.stamp: str = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        self.repos: Dict[str, Dict[str, Any]] = {}
+        self.__lock = threading.Lock()
+
+    def load(self) -> None:
+        """
+        load what was exported before, if anything
+        :return: None
+        :raises ValueError: if the state of the export can't be read
+        """
+        path = os.path.join(self.folder, Exporter.FILE_NAME)
+        if not os.path.isfile(path):
+            return
+        with open(path) as state_file:
+            try:
+                repos = json.load(state_file)
+            except ValueError as exception:
+                raise ValueError("corrupt export state " + path + ": " + str(exception)) \
+                    from exception
+        if not isinstance(repos, dict):
+            raise ValueError("corrupt export state " + path)
+        # a repo with a damaged entry is exported in full again
+        self.repos = {name: state for name, state in repos.items() if isinstance(state, dict)}
+
+    def save(self) -> None:
+        """
+        save what was exported
+        :return: None
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        with self.__lock:
+            atomic_write_json(os.path.join(self.folder, Exporter.FILE_NAME),
+                              dict(sorted(self.repos.items())), indent=1)
+
+    def export_repo(self, name: str, path: str) -> str:
+        """
+        write a bundle of what changed in a clone since its last export
+        :param name: the full name of the repo
+        :param path: the folder of the clone
+        :return: what was done
+        """
+        refs = list_refs(path)
+        with self.__lock:
+            exported: Dict[str, str] = self.repos.get(name, {}).get('refs', {})
+        if exported and refs == exported:
+            return "bundle unchanged"
+        # commits of the last export that are gone (e.g. force pushed away) can't be left out
+        exclude = sorted(existing_objects(path, set(exported.values()))) if exported else []
+        kind = "incremental" if exclude else "full"
+        file = self.__file_of(name, kind + ".bundle")
+        out = CompressedFile(file, self.compression, self.level)
+        try:
+            written = bundle(path, exclude, out)
+        except (GitException, OSError):
+            out.abort()
+            raise
+        if not written:
+            # only deleted refs
+            out.abort()
+        else:
+            out.close()
+        with self.__lock:
+            self.repos.setdefault(name, {})['refs'] = refs
+        return (kind + " bundle exported") if written else "bundle unchanged"
+
+    def export_issues(self, name: str, issue_folder: str) -> str:
+        """
+        pack the saved issues of a repo that changed since its last export
+        the manifest tells which ones changed, in the files format their files are packed,
+        in the other formats each issue as <number>.json with the fields of Issue.to_dict;
+        removed.json lists the packed files of earlier exports that are gone
+        :param name: the full name of the repo
+        :param issue_folder: the folder of the saved issues of the repo
+        :return: what was done
+        """
+        manifest = Manifest(issue_folder)
+        manifest.load()
+        if not manifest.issues:
+            return "issues unchanged"
+        # issue number to hash and packed file, as in .export.json
+        issues: Dict[str, Dict[str, str]] = {
+            str(number): {'hash': entry['hash'],
+                          'file': entry['file'] if manifest.format == FILES
+                          else str(number) + ".json"}
+            for number, entry in manifest.issues.items()}
+        with self.__lock:
+            state = self.repos.get(name, {})
+            exported: Dict[str, Dict[str, str]] = state.get('issues') \
+                if isinstance(state.get('issues'), dict) \
+                and state.get('issue_format') == manifest.format else {}
+        changed = sorted(int(number) for number, entry in issues.items()
+                         if exported.get(number) != entry)
+        files = {entry['file'] for entry in issues.values()}
+        removed = sorted({entry['file'] for entry in exported.values()} - files)
+        if not changed and not removed:
+            return "issues unchanged"
+        out = CompressedFile(self.__file_of(name, "issues.tar"), self.compression, self.level)
+        archive = open_archive(manifest.format, issue_folder)
+        try:
+            # a stream, so tarfile only writes and never seeks
+            with tarfile.open(fileobj=out, mode='w|') as packed:
+                for number in changed:
+                    file = issues[str(number)]['file']
+                    if manifest.format == FILES:
+                        packed.add(os.path.join(issue_folder, file), arcname=name + "/" + file)
+                        continue
+                    issue = archive.lookup(number)
+                    if issue is not None:
+                        Exporter.__add(packed, name + "/" + file,
+                                       json.dumps(issue.to_dict()).encode())
+                if removed:
+                    Exporter.__add(packed, name + "/removed.json", json.dumps(removed).encode())
+        except (OSError, tarfile.TarError):
+            out.abort()
+            raise
+        finally:
+            archive.close()
+        out.close()
+        with self.__lock:
+            self.repos.setdefault(name, {}).update({'issues': issues,
+                                                    'issue_format': manifest.format})
+        return str(len(changed)) + (" issue" if len(changed) == 1 else " issues") + " exported"
+
+    def __file_of(self, name: str, kind: str) -> str:
+        folder = os.path.join(self.folder, name)
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, self.stamp + "-" + kind + EXTENSIONS[self.compression])
+
+    @staticmethod
+    def __add(packed: tarfile.TarFile, name: str, data: bytes) -> None:
+        """
+        add a file that is only in memory to a tar
+        :param packed: the tar
+        :param name: the name of the file in the tar
+        :param data: the content of the file
+        :return: None
+        """
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(datetime.now(timezone.utc).timestamp())
+        packed.addfile(info, io.BytesIO(data))
@@ -0,0 +1,141 @@
+"""
+hold all calls of the git executable and some error handling
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import BinaryIO, Dict, Iterable, List, Optional, Set
+
+
+def clone(url: str, path: str, arguments: Optional[List[str]] = None,
+          environment: Optional[Dict[str, str]] = None) -> None:
+    """
+    git clone url into path
+    :param url: the url to clone from
+    :param path: the folder to clone into
+    :param arguments: further arguments for git clone (see CloneStrategy)
+    :param environment: additional environment variables for git (see Transport)
+    :return: None
+    """
+    __run(['clone'] + (arguments or []) + [url, path], environment=environment)
+
+
+def fetch(path: str, url: Optional[str] = None,
+          environment: Optional[Dict[str, str]] = None) -> int:
+    """
+    fetch all remotes of an existing clone and prune deleted refs
+    :param path: the folder of the clone
+    :param url: the url of origin, it is changed if it differs (e.g. another transport)
+    :param environment: additional environment variables for git (see Transport)
+    :return: the number of refs that were added, changed or removed
+    """
+    before: Dict[str, str] = list_refs(path)
+    if url is not None and __run(['remote', 'get-url', 'origin'], path).strip() != url:
+        __run(['remote', 'set-url', 'origin', url], path)
+    __run(['remote', 'update', '--prune'], path, environment=environment)
+    after: Dict[str, str] = list_refs(path)
+    return len([ref for ref in set(before) | set(after) if before.get(ref) != after.get(ref)])
+
+
+def remote_refs(url: str, environment: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    get all refs of a remote repo without fetching it
+    :param url: the url of the repo
+    :param environment: additional environment variables for git (see Transport)
+    :return: dict of ref name to object id
+    """
+    refs: Dict[str, str] = {}
+    for line in __run(['ls-remote', url], environment=environment).splitlines():
+        object_id, ref = line.split('\t', 1)
+        refs[ref] = object_id
+    return refs
+
+
+def list_refs(path: str) -> Dict[str, str]:
+    """
+    get all refs of a clone
+    :param path: the folder of the clone
+    :return: dict of ref name to object id
+    """
+    refs: Dict[str, str] = {}
+    for line in __run(['for-each-ref', '--format=%(refname) %(objectname)'], path).splitlines():
+        ref, object_id = line.rsplit(' ', 1)
+        refs[ref] = object_id
+    return refs
+
+
+def existing_objects(path: str, object_ids: Iterable[str]) -> Set[str]:
+    """
+    get which objects are in a clone, e.g. commits may be gone after a force push
+    :param path: the folder of the clone
+    :param object_ids: the ids of the objects
+    :return: the ids of the objects that are there
+    """
+    lines = __run(['cat-file', '--batch-check'], path,
+                  "".join(object_id + "\n" for object_id in object_ids)).splitlines()
+    return {line.split(' ', 1)[0] for line in lines if not line.endswith(" missing")}
+
+
+def bundle(path: str, exclude: Iterable[str], out: BinaryIO) -> bool:
+    """
+    write a bundle of all refs of a clone, streamed without a file of its own
+    :param path: the folder of the clone
+    :param exclude: ids of commits whose history is left out (e.g. already in an earlier bundle)
+    :param out: where to write the bundle to
+    :return: False if there was nothing to bundle (out may hold a part of a bundle then)
+    """
+    command = ['git', '-C', path, 'bundle', 'create', '-', '--all'] \
+        + ['^' + object_id for object_id in exclude]
+    # stderr goes to a file, a full pipe would block git while its output is read
+    with tempfile.TemporaryFile() as error:
+        try:
+            git = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   stderr=error)
+        except OSError as exception:
+            raise GitException(str(exception))
+        with git:
+            shutil.copyfileobj(git.stdout, out, 1024 * 1024)
+        error.seek(0)
+        message = error.read().decode(errors='replace')
+    if git.returncode != 0:
+        if "empty bundle" in message:
+            return False
+        lines = message.strip().splitlines()
+        raise GitException("git bundle failed" + (": " + lines[-1] if lines else ""))
+    return True
+
+
+def __run(arguments: List[str], path: Optional[str] = None,
+          text_input: Optional[str] = None, environment: Optional[Dict[str, str]] = None) -> str:
+    """
+    common function to run git with
+    :param arguments: the arguments for git
+    :param path: the folder to run git in
+    :param text_input: the input for git or None for none
+    :param environment: additional environment variables for git or None
+    :return: the output of git
+    """
+    command = ['git']
+    if path is not None:
+        command += ['-C', path]
+    try:
+        git = subprocess.Popen(command + arguments,
+                               stdin=subprocess.DEVNULL if text_input is None else subprocess.PIPE,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               env=dict(os.environ, **environment) if environment else None)
+        output, error = git.communicate(None if text_input is None else text_input.encode())
+    except OSError as exception:
+        raise GitException(str(exception))
+
+    if git.returncode != 0:
+        lines = error.decode(errors='replace').strip().splitlines()
+        raise GitException("git " + arguments[0] + " failed" + (": " + lines[-1] if lines else ""))
+    return output.decode(errors='replace')
+
+
+class GitException(Exception):
+    """
+    An catch-all exception for problems with git
+    """
@@ -1,27 +1,93 @@
 """
 hold all requests to the gitea instance and some error handling
 """
-from typing import Set, List
-from urllib.parse import urljoin
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, Optional, Set, List, Tuple
+from urllib.parse import quote, urlencode, urljoin, urlparse
 
 from colorama import Fore, Style
 import requests
-from requests import Response
-from requests.auth import HTTPBasicAuth
+from requests import PreparedRequest, Response, Session
+from requests.adapters import HTTPAdapter
+from requests.auth import AuthBase, HTTPBasicAuth
 
+from util.asset import Asset, Attachments, safe_name
+from util.comment_store import CommentStore
 from util.config import Config, AuthMode
+from util.http_cache import HttpCache, identity_of
 from util.issue import Issue, Comment
+from util.listing_cache import ListingCache, key_of
 from util.repo import Repo
+from util.registry import Registry
+from util.repo_filter import RepoFilter
+from util.scheduler import API_REQUESTS, BandwidthLimiter, RequestScheduler, get_limit
+from util.stats import get_stats
 
 STATUS_CODE_OK = 200
+STATUS_CODE_NOT_MODIFIED = 304
 STATUS_CODE_NO_AUTH = 403
+STATUS_CODE_PARTIAL_CONTENT = 206
+STATUS_CODE_NOT_FOUND = 404
+STATUS_CODE_RANGE_NOT_SATISFIABLE = 416
+STATUS_CODE_TOO_MANY_REQUESTS = 429
+STATUS_CODE_SERVICE_UNAVAILABLE = 503
+# answers worth another try
+RETRY_STATUS_CODES = [STATUS_CODE_TOO_MANY_REQUESTS, 500, 502, STATUS_CODE_SERVICE_UNAVAILABLE, 504]
+# answers of an overloaded instance
+PUSH_BACK_STATUS_CODES = [STATUS_CODE_TOO_MANY_REQUESTS, STATUS_CODE_SERVICE_UNAVAILABLE]
+MAX_BACKOFF = 60  # seconds
+MAX_RETRY_AFTER = 300  # seconds
 
 API_URL = "/api/v1"  # API Base URL
 VERSION_URL = API_URL + "/version"  # Version API URL
-REPOS_URL = API_URL + "/repos/search?uid={uid}&page={page}&limit=50"  # Repos API URL
+SETTINGS_URL = API_URL + "/settings/api"  # API Settings URL
+REPOS_URL = API_URL + "/repos/search?uid={uid}"  # Repos API URL
+REPO_URL = API_URL + "/repos/{repo}"  # Single Repo API URL
 USER_ID_URL = API_URL + "/user"  # User ID API URL
-ISSUE_URL = API_URL + "/repos/{repo}/issues?page={page}&state={state}"  # Issue API URL
+ISSUE_URL = API_URL + "/repos/{repo}/issues?state=all"  # Issue API URL
+SINGLE_ISSUE_URL = API_URL + "/repos/{repo}/issues/{index}"  # Single Issue API URL
 COMMENT_URL = API_URL + "/repos/{repo}/issues/{index}/comments"  # Comment API URL
+RELEASES_URL = API_URL + "/repos/{repo}/releases"  # Releases API URL
+REPO_COMMENTS_URL = API_URL + "/repos/{repo}/issues/comments"  # Comments of a whole repo API URL
+PAGE_URL = "{url}{separator}page={page}&limit={limit}"  # appended to paginated URLs
+SINCE_URL = "{url}{separator}since={since}"  # appended to only get changed items
+# downloads of assets are counted in the stats under this url
+ASSET_STATS_URL = API_URL + "/repos/{repo}/assets/download"
+
+# the number of the issue a comment belongs to is the end of its issue_url,
+# or of its pull_request_url for comments on pull requests
+ISSUE_NUMBER_PATTERN = re.compile(r'/(\d+)/?$')
+
+DEFAULT_PAGE_LIMIT = 50  # gitea's default for the largest allowed limit
+CHUNK_SIZE = 1024 * 1024  # bytes of a download held in memory at once
+
+# one session per gitea instance and user, see get_session
+__SESSIONS: Dict[Tuple[str, str, AuthMode], Session] = {}
+__SESSIONS_LOCK = threading.Lock()
+# one connection pool per host, shared by the sessions of all its accounts
+__ADAPTERS: Dict[str, HTTPAdapter] = {}
+# one scheduler per host, see get_scheduler
+__SCHEDULERS: Dict[str, RequestScheduler] = {}
+# one response cache per cache folder, see get_http_cache
+__HTTP_CACHES: Dict[str, HttpCache] = {}
+# one listing cache per cache folder, see get_listing_cache
+__LISTING_CACHES: Dict[str, ListingCache] = {}
+# the downloads of all instances share the bandwidth, see get_bandwidth_limiter
+__BANDWIDTH_LIMITER: Optional[BandwidthLimiter] = None
+# the largest allowed page limit per gitea instance, see get_page_limit
+__PAGE_LIMITS: Dict[str, int] = {}
+# the version per gitea instance, see get_version
+__VERSIONS: Dict[str, str] = {}
 
 
 def get_user_id(config: Config) -> int:
@@ -40,80 +106,285 @@ def get_version(config: Config) -> str:
     :param config: the config to be used
     :return: the gitea instance version
     """
-    return __general_request(config, VERSION_URL, False).json()['version']
+    version = __VERSIONS.get(config.url)
+    if version is None:
+        version = __general_request(config, VERSION_URL, False).json()['version']
+        __VERSIONS[config.url] = version
+    return version
 
 
-def get_repos(config: Config) -> Set[Repo]:
+def get_page_limit(config: Config) -> int:
     """
-    get all repos the user in the config owns or has worked on
+    get the largest number of items the gitea instance returns per page
     :param config: the config to be used
-    :return: set of Repo objects
+    :return: the page limit
     """
-    user_id: int = get_user_id(config)
-    repos: Set[Repo] = set()
-    page = 1
-    while True:
+    limit = __PAGE_LIMITS.get(config.url)
+    if limit is None:
         try:
-            repos_result = __general_request(config,
-                                             REPOS_URL.format(uid=user_id, page=page))
-        except GiteaException:
-            break
+            limit = int(__general_request(config, SETTINGS_URL).json()['max_response_items'])
+        except (GiteaException, KeyError, ValueError):
+            # older gitea versions don't have this endpoint
+            limit = DEFAULT_PAGE_LIMIT
+        __PAGE_LIMITS[config.url] = limit
+    return limit
 
-        if not repos_result.json()['data']:
-            break
 
-        page += 1
+def get_listing(config: Config, repo_filter: RepoFilter,
+                refresh: bool = False) -> Tuple[Set[Repo], bool]:
+    """
+    get the repos like get_repos, from the listing cache if there is a usable listing
+    (without updated_at, see RepoStates.is_unchanged)
+    a new listing is cached together with the user id and the version of the instance
+    :param config: the config to be used
+    :param repo_filter: the rules which repos to leave out
+    :param refresh: ignore the cached listing?
+    :return: (set of Repo objects, should the listing be refreshed in the background?)
+    """
+    cache = get_listing_cache(config)
+    if cache is None:
+        return get_repos(config, repo_filter), False
+    key = key_of(config.url, __identity(config), repo_filter.describe())
+    listing = cache.load(key)
+    if listing is not None and not refresh and cache.is_usable(listing):
+        __VERSIONS.setdefault(config.url, listing['version'])
+        repo_filter.excluded.update(listing['excluded'])
+        repos = {Repo.from_dict(repo) for repo in listing['repos']}
+        for repo in repos:
+            # a push since the listing was cached isn't in it, an unknown last change
+            # makes a backup ask git for the refs instead of skipping the repo as unchanged
+            repo.updated_at = ""
+        return repos, not cache.is_fresh(listing) and cache.start_refresh(key)
+
+    # the id of a user never changes
+    user_id = listing['user_id'] if listing is not None else get_user_id(config)
+    try:
+        repos = get_repos(config, repo_filter, user_id)
+    except GiteaException:
+        # an incomplete listing isn't cached, but the next run may try again
+        cache.end_refresh(key)
+        raise
+    cache.store(key, {'user_id': user_id,
+                      'version': get_version(config),
+                      'repos': [repo.to_dict() for repo in repos],
+                      'excluded': repo_filter.excluded})
+    return repos, False
+
+
+def get_repos(config: Config, repo_filter: Optional[RepoFilter] = None,
+              user_id: Optional[int] = None) -> Set[Repo]:
+    """
+    get all repos the user in the config owns or has worked on
+    :param config: the config to be used
+    :param repo_filter: the rules which repos to leave out or None to get all
+    :param user_id: the id of the user, if already known
+    :return: set of Repo objects
+    """
+    if user_id is None:
+        user_id = get_user_id(config)
+    url = REPOS_URL.format(uid=user_id)
+    if repo_filter is not None and repo_filter.search_parameters():
+        # leave out as many repos as possible on the instance
+        url += "&" + urlencode(repo_filter.search_parameters())
+    # a repo may show up on two pages if repos are added while paginating
+    repos = Registry()
+    try:
+        for page in __paginate(config, url, lambda json: json['data']):
+            for entry in page:
+                repo = __to_repo(entry)
+                if repo_filter is None or repo_filter.keep(repo):
+                    repos.add(repo)
+    except GiteaException as exception:
+        raise IncompleteResultException(str(exception), set(repos))
+
+    return set(repos)
 
-        for repo in repos_result.json()['data']:
-            repos.add(Repo(name=repo['full_name'], url=repo['ssh_url']))
 
-    return repos
+def get_repo(config: Config, name: str) -> Repo:
+    """
+    get a single repo
+    :param config: the config to be used
+    :param name: the full name of the repo (owner/name)
+    :return: the Repo
+    """
+    return __to_repo(__general_request(config, REPO_URL.format(repo=name)).json())
 
 
-def get_issues(config: Config, repo: Repo) -> List[Issue]:
+def get_issues(config: Config, repo: Repo, since: Optional[str] = None, first_page: int = 1,
+               on_page: Optional[Callable[[int], None]] = None,
+               attachments: Optional[Attachments] = None) -> Iterator[Issue]:
     """
     get all issues of corresponding repo
+    the issues are returned as their page arrives, so they can be saved right away
     :param config: the config to be used
     :param repo: the repo to gather the issues from
-    :return: list of Issue
+    :param since: only get issues changed since then (ISO 8601), or everything if None
+    :param first_page: the page to start at, to resume an export that stopped (see Journal)
+    :param on_page: called with the number of a page once all its issues were returned
+    :param attachments: to add the attachments of the issues and their comments to or None
+    :return: iterator over Issue
+    :raises GiteaException: if not all issues could be requested
     """
-    issues: List[Issue] = []
-    for state in ['open', 'closed']:
-        page = 1
-        while True:
+    limit = get_page_limit(config)
+    comments: Optional[CommentStore] = None
+    changed = CommentStore()
+    if since is None:
+        comments = get_repo_comments(config, repo, attachments=attachments)
+    else:
+        # comments can change without their issue changing
+        changed = get_repo_comments(config, repo, since, attachments) or changed
+        if len(changed) > limit:
+            changed.close()
+            # too many to get one by one (or since isn't supported), so get everything
+            if attachments is not None:
+                attachments.since = None
+            yield from get_issues(config, repo, first_page=first_page, on_page=on_page,
+                                  attachments=attachments)
+            return
+    # a few changed issues are cheaper to get one by one than all comments of the repo
+    all_comments_tried = since is None
+
+    # an issue may show up on two pages if issues change while paginating,
+    # only the keys are kept, the issues are saved as they arrive
+    seen = Registry(keep=False)
+    try:
+        try:
+            pages = __paginate(config, __since(ISSUE_URL.format(repo=repo.name), since),
+                               first_page=first_page)
+            for number, page in enumerate(pages, first_page):
+                if not all_comments_tried and len(page) >= limit:
+                    comments = get_repo_comments(config, repo, attachments=attachments)
+                    all_comments_tried = True
+                for issue_json in page:
+                    issue = __to_issue(issue_json)
+                    if not seen.add(issue):
+                        continue
+                    __add_attachments(attachments, issue.number, issue_json.get('assets'))
+                    # older gitea versions don't tell the number of comments
+                    if issue_json.get('comments', 1):
+                        issue.comments = __comments_of(config, repo, issue.number, comments,
+                                                       attachments)
+                    yield issue
+                if on_page is not None:
+                    on_page(number)
+        except GiteaException as exception:
+            # repos without issues answer 404
+            if exception.status_code != STATUS_CODE_NOT_FOUND:
+                raise
+
+        for index in changed:
+            if index in seen:
+                continue
             try:
-                issues_result = __general_request(config, ISSUE_URL.format(repo=repo.name,
-                                                                           page=page,
-                                                                           state=state))
-            except GiteaException:
-                break
+                issue = get_issue(config, repo, index)
+            except GiteaException as exception:
+                # the issue was deleted
+                if exception.status_code != STATUS_CODE_NOT_FOUND:
+                    raise
+                continue
+            issue.comments = __comments_of(config, repo, index, comments, attachments)
+            yield issue
+    finally:
+        # the comments may be in a temporary database
+        changed.close()
+        if comments is not None:
+            comments.close()
 
-            if not issues_result.json():
-                break
 
-            page += 1
+def get_issues_by_number(config: Config, repo: Repo, numbers: Iterable[int]) -> Iterator[Issue]:
+    """
+    get some issues of a repo with their comments, one by one
+    :param config: the config to be used
+    :param repo: the repo of the issues
+    :param numbers: the numbers of the issues, deleted ones are left out
+    :return: iterator over Issue
+    :raises GiteaException: if an issue could not be requested
+    """
+    for index in sorted(numbers):
+        try:
+            issue = get_issue(config, repo, index)
+        except GiteaException as exception:
+            if exception.status_code != STATUS_CODE_NOT_FOUND:
+                raise
+            continue
+        issue.comments = get_comments(config, repo, index)
+        yield issue
 
-            if issues_result.status_code is STATUS_CODE_OK:
-                for issue_json in issues_result.json():
-                    issue = Issue(title=issue_json['title'],
-                                  author=issue_json['user']['full_name'],
-                                  body=issue_json['body'],
-                                  state=issue_json['state'])
-                    for label_json in issue_json['labels']:
-                        issue.add_label(label_json['name'])
-                    issue.comments = get_comments(config, repo, issue_json['number'])
-                    issues.append(issue)
 
-    return issues
+def get_issue(config: Config, repo: Repo, index: int) -> Issue:
+    """
+    get a single issue (without its comments)
+    :param config: the config to be used
+    :param repo: the repo of the issue
+    :param index: the index of the issue
+    :return: the Issue
+    """
+    return __to_issue(__general_request(config, SINGLE_ISSUE_URL.format(repo=repo.name,
+                                                                        index=index)).json())
 
 
-def get_comments(config: Config, repo: Repo, index: int) -> List[Comment]:
+def get_repo_comments(config: Config, repo: Repo, since: Optional[str] = None,
+                      attachments: Optional[Attachments] = None
+                      ) -> Optional[CommentStore]:
+    """
+    get all comments of all issues of a repo with one paginated pass
+    instead of one request per issue
+    :param config: the config to be used
+    :param repo: the repo to gather the comments from
+    :param since: only get comments changed since then (ISO 8601), or everything if None
+    :param attachments: to add the attachments of the comments to or None
+    :return: the comments grouped by the number of their issue (see CommentStore)
+             or None if the gitea instance can't list the comments of a repo
+    :raises GiteaException: if not all comments could be requested
+    """
+    # a comment may show up on two pages if comments are added while paginating,
+    # the store leaves it out the second time
+    comments = CommentStore()
+    try:
+        for page in __paginate(config, __since(REPO_COMMENTS_URL.format(repo=repo.name), since)):
+            for comment_json in page:
+                number = __issue_number_of(comment_json)
+                if number is None:
+                    continue
+                comment = Comment(body=comment_json['body'],
+                                  author=sys.intern(comment_json['user']['full_name']))
+                if comments.add(comment_json.get('id'), number, comment):
+                    __add_attachments(attachments, number, comment_json.get('assets'))
+    except GiteaException as exception:
+        comments.close()
+        if exception.status_code == STATUS_CODE_NOT_FOUND:
+            return None
+        raise
+    except BaseException:
+        comments.close()
+        raise
+    return comments
+
+
+def __issue_number_of(comment_json: Dict[str, Any]) -> Optional[int]:
+    """
+    get the number of the issue or pull request a comment belongs to
+    :param comment_json: the comment as gitea answered it
+    :return: the number or None if neither url has one
+    """
+    for key in ['issue_url', 'pull_request_url']:
+        match = ISSUE_NUMBER_PATTERN.search(comment_json.get(key) or '')
+        if match is not None:
+            return int(match.group(1))
+    return None
+
+
+def get_comments(config: Config, repo: Repo, index: int,
+                 attachments: Optional[Attachments] = None) -> List[Comment]:
     """
     get all comments of a specific issue
+    only used if the gitea instance can't list the comments of a whole repo
     :param config: config: the config to be used
     :param repo: the repo to gather the issues from
     :param index: the index of the issue to gather comments from
+    :param attachments: to add the attachments of the comments to or None
     :return: list of Comment
+    :raises GiteaException: if the comments could not be requested
     """
     comments: List[Comment] = []
 
@@ -121,39 +392,537 @@ def get_comments(config: Config, repo: Repo, index: int) -> List[Comment]:
         comments_result = __general_request(config, COMMENT_URL.format(repo=repo.name,
                                                                        index=index))
         for comment_json in comments_result.json():
+            __add_attachments(attachments, index, comment_json.get('assets'))
             comments.append(Comment(body=comment_json['body'],
-                                    author=comment_json['user']['full_name']))
-    except GiteaException:
-        pass
+                                    author=sys.intern(comment_json['user']['full_name'])))
+    except GiteaException as exception:
+        # the issue was deleted
+        if exception.status_code != STATUS_CODE_NOT_FOUND:
+            raise
 
     return comments
 
 
-def __general_request(config: Config, url: str, use_auth: bool = True) -> Response:
+def __comments_of(config: Config, repo: Repo, index: int,
+                  comments: Optional[CommentStore],
+                  attachments: Optional[Attachments] = None) -> List[Comment]:
     """
-    common function to build requests from
+    get the comments of an issue from all comments of the repo or with its own request
     :param config: the config to be used
-    :param url: the url to work with
-    :return: the response
+    :param repo: the repo of the issue
+    :param index: the index of the issue
+    :param comments: all comments of the repo (see get_repo_comments) or None
+    :param attachments: to add the attachments of the comments to, if they are requested, or None
+    :return: list of Comment
+    """
+    if comments is None:
+        return get_comments(config, repo, index, attachments)
+    # each issue needs its comments once, so let them go
+    return comments.pop(index, [])
+
+
+def get_release_assets(config: Config, repo: Repo) -> List[Asset]:
+    """
+    get the files attached to the releases of a repo
+    :param config: the config to be used
+    :param repo: the repo to gather the assets from
+    :return: list of Asset, saved as releases/<tag>/<name>
+    :raises GiteaException: if not all releases could be requested
     """
-    request = ""
+    assets: Dict[str, Asset] = {}
     try:
-        if not use_auth:
-            request = requests.get(urljoin(config.url, url))
-        else:
+        for page in __paginate(config, RELEASES_URL.format(repo=repo.name)):
+            for release_json in page:
+                folder = "releases/" + safe_name(release_json.get('tag_name')
+                                                 or str(release_json.get('id', "")))
+                for asset_json in release_json.get('assets') or []:
+                    asset = __to_asset(asset_json, folder + "/" + safe_name(asset_json['name']))
+                    assets[asset.path] = asset
+    except GiteaException as exception:
+        # repos without releases answer 404
+        if exception.status_code != STATUS_CODE_NOT_FOUND:
+            raise
+    return list(assets.values())
+
+
+def get_attachments(config: Config, repo: Repo, since: Optional[str] = None) -> List[Asset]:
+    """
+    get the files attached to the issues and comments of a repo
+    :param config: the config to be used
+    :param repo: the repo to gather the attachments from
+    :param since: only look at issues and comments changed since then (ISO 8601),
+                  or at everything if None
+    :return: list of Asset, saved as attachments/<issue number>/<id>-<name>
+    :raises GiteaException: if not all issues or comments could be requested
+    """
+    found = Attachments()
+    try:
+        for page in __paginate(config, __since(ISSUE_URL.format(repo=repo.name), since)):
+            for issue_json in page:
+                __add_attachments(found, issue_json['number'], issue_json.get('assets'))
+        for page in __paginate(config, __since(REPO_COMMENTS_URL.format(repo=repo.name), since)):
+            for comment_json in page:
+                number = __issue_number_of(comment_json)
+                if number is not None:
+                    __add_attachments(found, number, comment_json.get('assets'))
+    except GiteaException as exception:
+        # repos without issues answer 404
+        if exception.status_code != STATUS_CODE_NOT_FOUND:
+            raise
+    return list(found.assets.values())
+
+
+def __add_attachments(attachments: Optional[Attachments], number: int,
+                      attachments_json: Optional[List[Dict[str, Any]]]) -> None:
+    """
+    add the attachments of an issue or comment
+    :param attachments: to add them to or None to leave them out
+    :param number: the number of the issue (of the comment)
+    :param attachments_json: the attachments as gitea answered them
+    :return: None
+    """
+    if attachments is None:
+        return
+    for asset_json in attachments_json or []:
+        asset = __to_asset(asset_json, "attachments/" + str(number) + "/"
+                           + str(asset_json.get('id', "")) + "-" + safe_name(asset_json['name']))
+        attachments.assets[asset.path] = asset
+
+
+def download_asset(config: Config, repo: Repo, asset: Asset, path: str) -> bool:
+    """
+    download an asset to a file, chunk by chunk straight to the disk
+    gitea has no checksums of assets, so a file that has the size of the asset is kept;
+    the download goes to <path>.part first and a part left by a failed try or an earlier run
+    is continued with a range request
+    failed downloads are retried like requests (see __general_request),
+    all downloads together share the bandwidth (see get_bandwidth_limiter), a download holds
+    a request slot of the host (see get_scheduler) only until the headers arrived
+    :param config: the config to be used
+    :param repo: the repo of the asset
+    :param asset: the asset
+    :param path: the file to save it to
+    :return: was it downloaded (False if the file was there already)?
+    :raises GiteaException: if it could not be downloaded
+    """
+    if asset.size and os.path.isfile(path) and os.path.getsize(path) == asset.size:
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + ".part"
+    if asset.size and __size_of(partial) > asset.size:
+        os.remove(partial)
+    stats_url = ASSET_STATS_URL.format(repo=repo.name)
+    scheduler = get_scheduler(config)
+    stats = get_stats()
+    attempt = 0
+    while asset.size == 0 or __size_of(partial) < asset.size:
+        response: Optional[Response] = None
+        error = ""
+        received = __size_of(partial)
+        scheduler.acquire()
+        start = time.perf_counter()
+        try:
+            response = __request_asset(config, asset, received)
+        except requests.RequestException as exception:
+            error = str(exception)
+        finally:
+            retry_after = __retry_after(response) if response is not None else None
+            # the slot is only held until the headers arrived, the body only takes bandwidth
+            scheduler.release(response is not None
+                              and response.status_code in PUSH_BACK_STATUS_CODES, retry_after)
+        try:
+            if response is not None:
+                with response:
+                    __save_body(asset, response, partial, received, get_bandwidth_limiter(config))
+        except requests.RequestException as exception:
+            error = str(exception)
+            response = None
+        finally:
+            stats.record_request(stats_url, response.status_code if response is not None else None,
+                                 max(0, __size_of(partial) - received),
+                                 time.perf_counter() - start)
+
+        if response is not None and response.status_code in [STATUS_CODE_OK,
+                                                              STATUS_CODE_PARTIAL_CONTENT]:
+            break
+        if response is not None:
+            error = "gitea answered " + str(response.status_code) + " for " + asset.url
+            if response.status_code not in RETRY_STATUS_CODES + [
+                    STATUS_CODE_RANGE_NOT_SATISFIABLE]:
+                raise GiteaException(error, response.status_code)
+        if attempt >= config.retries:
+            raise GiteaException(error, response.status_code if response is not None else None)
+        if retry_after is None:
+            retry_after = random.uniform(0, min(MAX_BACKOFF, config.backoff * 2 ** attempt))
+        stats.record_retry(stats_url)
+        time.sleep(retry_after)
+        attempt += 1
+
+    size = __size_of(partial)
+    if asset.size and size != asset.size:
+        os.remove(partial)
+        raise GiteaException("got " + str(size) + " of " + str(asset.size)
+                             + " bytes for " + asset.url)
+    os.replace(partial, path)
+    return True
+
+
+def __request_asset(config: Config, asset: Asset, offset: int) -> Response:
+    """
+    send one request for an asset, the body is left to __save_body
+    :param config: the config to be used
+    :param asset: the asset
+    :param offset: the number of bytes there are already, to request only the rest
+    :return: the response (once its headers arrived)
+    """
+    headers = {'Accept': '*/*'}
+    if offset:
+        headers['Range'] = "bytes=" + str(offset) + "-"
+    # the credentials only go to the instance itself
+    same_instance = urlparse(asset.url).netloc == urlparse(config.url).netloc
+    return get_session(config).get(asset.url, timeout=config.timeout, headers=headers,
+                                   stream=True, auth=None if same_instance else __without_auth)
+
+
+def __save_body(asset: Asset, response: Response, partial: str, offset: int,
+                limiter: BandwidthLimiter) -> None:
+    """
+    append what arrives for an asset to the partial file
+    :param asset: the asset
+    :param response: the response (see __request_asset)
+    :param partial: the file the download goes to
+    :param offset: the number of bytes that were requested to be left out
+    :param limiter: the bandwidth all downloads share
+    :return: None
+    """
+    if response.status_code == STATUS_CODE_RANGE_NOT_SATISFIABLE:
+        # the part doesn't fit the asset anymore, so start over
+        os.remove(partial)
+        return
+    if response.status_code not in [STATUS_CODE_OK, STATUS_CODE_PARTIAL_CONTENT]:
+        return
+    append = response.status_code == STATUS_CODE_PARTIAL_CONTENT
+    if append and not response.headers.get('Content-Range', "").startswith(
+            "bytes " + str(offset) + "-"):
+        os.remove(partial)
+        raise requests.RequestException("unexpected range for " + asset.url)
+    with open(partial, 'ab' if append else 'wb') as part_file:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            limiter.consume(len(chunk))
+            part_file.write(chunk)
+
+
+def __size_of(path: str) -> int:
+    """
+    get the size of a file
+    :param path: the file
+    :return: bytes or 0 if there is no file
+    """
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def __to_asset(asset_json: Dict[str, Any], path: str) -> Asset:
+    """
+    convert the json of a release asset or attachment to an Asset
+    :param asset_json: the parsed json of the asset
+    :param path: where to save it, relative to the assets folder of the repo
+    :return: the Asset
+    """
+    return Asset(url=asset_json['browser_download_url'], path=path,
+                 size=asset_json.get('size') or 0)
+
+
+def __to_repo(repo_json: Dict[str, Any]) -> Repo:
+    """
+    convert the json of a repo to a Repo
+    :param repo_json: the parsed json of the repo
+    :return: the Repo
+    """
+    return Repo(name=repo_json['full_name'], url=repo_json['ssh_url'],
+                owner=repo_json.get('owner', {}).get('login', ""),
+                archived=repo_json.get('archived', False), fork=repo_json.get('fork', False),
+                mirror=repo_json.get('mirror', False), size=repo_json.get('size', 0),
+                updated_at=repo_json.get('updated_at', ""), repo_id=repo_json.get('id', 0),
+                clone_url=repo_json.get('clone_url', ""))
+
+
+def __to_issue(issue_json: Dict[str, Any]) -> Issue:
+    """
+    convert the json of an issue to an Issue
+    :param issue_json: the parsed json of the issue
+    :return: the Issue (without comments)
+    """
+    issue = Issue(title=issue_json['title'],
+                  author=issue_json['user']['full_name'],
+                  body=issue_json['body'],
+                  state=issue_json['state'],
+                  number=issue_json['number'],
+                  updated_at=issue_json.get('updated_at', ''),
+                  issue_id=issue_json.get('id', 0))
+    for label_json in issue_json['labels']:
+        issue.add_label(label_json['name'])
+    return issue
+
+
+def __since(url: str, since: Optional[str]) -> str:
+    """
+    restrict an api url to items changed since a time
+    :param url: the url to restrict
+    :param since: the time (ISO 8601) or None for no restriction
+    :return: the restricted url
+    """
+    if since is None:
+        return url
+    return SINCE_URL.format(url=url, separator='&' if '?' in url else '?', since=quote(since))
+
+
+def get_session(config: Config) -> Session:
+    """
+    get the shared session for the gitea instance and account in the config
+    the session keeps its connections alive and has the auth set once,
+    so all requests of a run reuse a handful of connections
+    (at most pool_size per host, further requests wait for a free connection)
+    :param config: the config to be used
+    :return: the session
+    """
+    key = (config.url, config.auth.user, config.auth.mode)
+    with __SESSIONS_LOCK:
+        session = __SESSIONS.get(key)
+        if session is None:
+            session = Session()
+            adapter = __ADAPTERS.get(__host(config))
+            if adapter is None:
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.pool_size,
+                                      pool_block=True)
+                __ADAPTERS[__host(config)] = adapter
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['Accept'] = 'application/json'
             if config.auth.mode == AuthMode.PASSWORD:
-                request = requests.get(urljoin(config.url, url),
-                                       auth=HTTPBasicAuth(username=config.auth.user,
-                                                          password=config.auth.password))
+                session.auth = HTTPBasicAuth(username=config.auth.user,
+                                             password=config.auth.password)
             elif config.auth.mode == AuthMode.TOKEN:
-                request = requests.get(urljoin(config.url, url),
-                                       headers={'Authorization': 'token ' + config.auth.token})
+                session.auth = TokenAuth(config.auth.token)
             else:
                 print("I should auth but I can't. Somethings seems wrong")
                 print("Exiting...")
                 exit(2)
-    except Exception:
-        raise GiteaException()
+            __SESSIONS[key] = session
+    return session
+
+
+def get_scheduler(config: Config) -> RequestScheduler:
+    """
+    get the scheduler for the host of the gitea instance in the config,
+    all targets on a host share it
+    :param config: the config to be used
+    :return: the scheduler
+    """
+    with __SESSIONS_LOCK:
+        scheduler = __SCHEDULERS.get(__host(config))
+        if scheduler is None:
+            scheduler = RequestScheduler(config.pool_size)
+            __SCHEDULERS[__host(config)] = scheduler
+    return scheduler
+
+
+def __host(config: Config) -> str:
+    """
+    get the host of the gitea instance in the config
+    :param config: the config to be used
+    :return: scheme and host (with port)
+    """
+    url = urlparse(config.url)
+    return url.scheme + "://" + url.netloc
+
+
+def get_bandwidth_limiter(config: Config) -> BandwidthLimiter:
+    """
+    get the bandwidth limiter all downloads share, the first config sets the limit
+    :param config: the config to be used
+    :return: the limiter
+    """
+    global __BANDWIDTH_LIMITER
+    with __SESSIONS_LOCK:
+        if __BANDWIDTH_LIMITER is None:
+            __BANDWIDTH_LIMITER = BandwidthLimiter(config.asset_bandwidth * 1024)
+    return __BANDWIDTH_LIMITER
+
+
+def get_http_cache(config: Config) -> Optional[HttpCache]:
+    """
+    get the response cache of the config
+    unused responses are evicted when the cache is first used
+    :param config: the config to be used
+    :return: the cache or None if there is no cache folder configured
+    """
+    if not config.cache_folder:
+        return None
+    with __SESSIONS_LOCK:
+        cache = __HTTP_CACHES.get(config.cache_folder)
+        if cache is None:
+            cache = HttpCache(config.cache_folder,
+                              max_age=config.cache_max_age * 24 * 60 * 60,
+                              max_size=config.cache_max_size * 1024 * 1024)
+            cache.evict()
+            __HTTP_CACHES[config.cache_folder] = cache
+    return cache
+
+
+def get_listing_cache(config: Config) -> Optional[ListingCache]:
+    """
+    get the listing cache of the config
+    :param config: the config to be used
+    :return: the cache or None if there is no cache folder or listing_ttl configured
+    """
+    if not config.cache_folder or config.listing_ttl <= 0:
+        return None
+    with __SESSIONS_LOCK:
+        cache = __LISTING_CACHES.get(config.cache_folder)
+        if cache is None:
+            cache = ListingCache(config.cache_folder, config.listing_ttl, config.listing_stale)
+            __LISTING_CACHES[config.cache_folder] = cache
+    return cache
+
+
+def __paginate(config: Config, url: str,
+               items: Callable[[Any], List[Any]] = lambda json: json,
+               first_page: int = 1) -> Iterator[List[Any]]:
+    """
+    get all pages of a paginated api url
+    the first page tells how many pages there are (X-Total-Count),
+    the remaining pages are then requested concurrently and returned in order
+    :param config: the config to be used
+    :param url: the url to work with (without page and limit)
+    :param items: get the list of items from the parsed json of a page
+    :param first_page: the page to start at
+    :return: iterator over the items of each page
+    :raises GiteaException: if a page can't be requested, so the list would be incomplete
+    """
+    limit = get_page_limit(config)
+    separator = '&' if '?' in url else '?'
+
+    def get_page(page: int) -> List[Any]:
+        return items(__general_request(config, PAGE_URL.format(url=url, separator=separator,
+                                                               page=page, limit=limit)).json())
+
+    first = __general_request(config, PAGE_URL.format(url=url, separator=separator,
+                                                      page=first_page, limit=limit))
+    first_items: List[Any] = items(first.json())
+    if not first_items:
+        return
+    yield first_items
+
+    total = first.headers.get('X-Total-Count')
+    if total is None:
+        # no total known, so walk the pages one by one until an empty one
+        # (or a repeated one, if the instance ignores the page parameter)
+        page = first_page + 1
+        previous_items = first_items
+        while True:
+            try:
+                page_items = get_page(page)
+            except GiteaException as exception:
+                raise __truncated(url, page, exception)
+            if not page_items or page_items == previous_items:
+                return
+            yield page_items
+            previous_items = page_items
+            page += 1
+
+    # the instance might return less than we asked for
+    per_page = min(limit, len(first_items))
+    pages = math.ceil(int(total) / per_page)
+    if pages <= first_page:
+        return
+    workers = min(config.page_workers, pages - first_page)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: Deque[Future] = deque()
+        next_page = first_page + 1
+        page = first_page + 1
+        try:
+            while pending or next_page <= pages:
+                # only a few pages are requested ahead, so a slow consumer doesn't pile them up
+                while next_page <= pages and len(pending) < 2 * workers:
+                    pending.append(executor.submit(get_page, next_page))
+                    next_page += 1
+                page_items = pending.popleft().result()
+                if not page_items:
+                    return
+                yield page_items
+                page += 1
+        except GiteaException as exception:
+            raise __truncated(url, page, exception)
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def __truncated(url: str, page: int, exception: 'GiteaException') -> 'GiteaException':
+    """
+    build the exception for a list that stopped before its end
+    :param url: the url of the list
+    :param page: the page that could not be requested
+    :param exception: why it could not be requested
+    :return: the exception
+    """
+    return GiteaException("list " + url + " is incomplete, page " + str(page)
+                          + " failed: " + str(exception), exception.status_code)
+
+
+def __general_request(config: Config, url: str, use_auth: bool = True) -> Response:
+    """
+    common function to build requests from
+    failed requests are retried with jittered exponential backoff (or as long as the
+    instance asks with Retry-After) and the scheduler of the instance limits how many
+    requests run at the same time, together with [limits] requests for all targets
+    :param config: the config to be used
+    :param url: the url to work with
+    :param use_auth: send the credentials with the request?
+    :return: the response
+    """
+    scheduler = get_scheduler(config)
+    limit = get_limit(API_REQUESTS, config.limit_requests)
+    stats = get_stats()
+    attempt = 0
+    while True:
+        request: Optional[Response] = None
+        cached = False
+        error = ""
+        scheduler.acquire()
+        limit.acquire()
+        start = time.perf_counter()
+        try:
+            request, cached = __send(config, url, use_auth)
+        except requests.RequestException as exception:
+            error = str(exception)
+        finally:
+            limit.release()
+        seconds = time.perf_counter() - start
+        retry_after: Optional[float] = None
+        if request is not None:
+            retry_after = __retry_after(request)
+            scheduler.release(request.status_code in PUSH_BACK_STATUS_CODES, retry_after)
+            stats.record_request(url, request.status_code,
+                                 0 if cached else len(request.content), seconds, cached)
+        else:
+            scheduler.release()
+            stats.record_request(url, None, 0, seconds)
+
+        if request is not None and request.status_code not in RETRY_STATUS_CODES:
+            break
+        if attempt >= config.retries:
+            if request is None:
+                raise GiteaException(error)
+            break
+        if retry_after is None:
+            retry_after = random.uniform(0, min(MAX_BACKOFF, config.backoff * 2 ** attempt))
+        stats.record_retry(url)
+        time.sleep(retry_after)
+        attempt += 1
 
     if request.status_code is STATUS_CODE_NO_AUTH:
         print(Fore.RED
@@ -164,11 +933,120 @@ def __general_request(config: Config, url: str, use_auth: bool = True) -> Respon
     elif request.status_code is STATUS_CODE_OK:
         pass
     else:
-        raise GiteaException()
+        raise GiteaException("gitea answered " + str(request.status_code) + " for " + url,
+                             request.status_code)
+    return request
+
+
+def __send(config: Config, url: str, use_auth: bool) -> Tuple[Response, bool]:
+    """
+    send one request, answered from the response cache if it is still valid
+    :param config: the config to be used
+    :param url: the url to work with
+    :param use_auth: send the credentials with the request?
+    :return: (the response, was it served from the cache?)
+    """
+    session = get_session(config)
+    cache = get_http_cache(config)
+    full_url = urljoin(config.url, url)
+    identity = __identity(config) if use_auth else ""
+    entry = cache.lookup(full_url, identity) if cache is not None else None
+    headers = HttpCache.conditional_headers(entry) if entry is not None else None
+    request = __get(config, session, full_url, use_auth, headers)
+    if entry is not None and request.status_code == STATUS_CODE_NOT_MODIFIED:
+        cached = cache.response(full_url, identity, entry, request)
+        if cached is not None:
+            return cached, True
+        # the cached body is gone, so ask again without the cache
+        request = __get(config, session, full_url, use_auth)
+    if cache is not None and request.status_code == STATUS_CODE_OK:
+        cache.store(full_url, identity, request)
+    return request, False
+
+
+def __identity(config: Config) -> str:
+    """
+    get an identity of the credentials of the config that doesn't reveal them
+    :param config: the config to be used
+    :return: the identity
+    """
+    return identity_of(config.auth.user, config.auth.password
+                       if config.auth.mode == AuthMode.PASSWORD else config.auth.token)
+
+
+def __retry_after(request: Response) -> Optional[float]:
+    """
+    get how long the instance asked to wait before retrying
+    :param request: the response
+    :return: seconds or None if it didn't ask
+    """
+    value = request.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return min(MAX_RETRY_AFTER, max(0.0, float(value)))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return min(MAX_RETRY_AFTER, max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds()))
+
+
+def __get(config: Config, session: Session, url: str, use_auth: bool,
+          headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    send a get request with the session
+    :param config: the config to be used
+    :param session: the session to send the request with
+    :param url: the full url
+    :param use_auth: send the credentials with the request?
+    :param headers: additional headers
+    :return: the response
+    """
+    if use_auth:
+        return session.get(url, timeout=config.timeout, headers=headers)
+    return session.get(url, timeout=config.timeout, headers=headers, auth=__without_auth)
+
+
+def __without_auth(request: PreparedRequest) -> PreparedRequest:
+    """
+    auth for requests that should not send the credentials of the session
+    :param request: the request to send
+    :return: the unchanged request
+    """
     return request
 
 
+class TokenAuth(AuthBase):
+    """
+    auth with a gitea api token
+    """
+
+    def __init__(self, token: str) -> None:
+        self.token: str = token
+
+    def __call__(self, request: PreparedRequest) -> PreparedRequest:
+        request.headers['Authorization'] = 'token ' + self.token
+        return request
+
+
 class GiteaException(Exception):
     """
     An catch-all exception for problems with requests against gitea
     """
+
+    def __init__(self, message: str = "", status_code: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.status_code: Optional[int] = status_code
+
+
+class IncompleteResultException(GiteaException):
+    """
+    A list could only be requested in part
+    """
+
+    def __init__(self, message: str, result: Any) -> None:
+        super().__init__(message)
+        self.result: Any = result
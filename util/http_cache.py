@@ -0,0 +1,164 @@
+"""
+holds the on-disk cache for responses of the gitea instance
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from requests import Response
+
+from util.atomic import atomic_file, atomic_write_json
+
+# headers of a response that are kept in the cache
+CACHED_HEADERS = ['Content-Type', 'ETag', 'Last-Modified', 'Link', 'X-Total-Count']
+
+
+class HttpCache:
+    """
+    represents a cache of responses on disk consisting of:
+    - folder (to keep the responses in)
+    - max_age (seconds after which an unused response is deleted)
+    - max_size (bytes the cache may use)
+    a cached response is only used after the gitea instance confirmed it
+    with 304 Not Modified (see conditional_headers)
+    """
+    META_SUFFIX = ".json"
+    BODY_SUFFIX = ".body"
+
+    def __init__(self, folder: str, max_age: float, max_size: int) -> None:
+        self.folder: str = folder
+        self.max_age: float = max_age
+        self.max_size: int = max_size
+        self.__lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def lookup(self, url: str, identity: str) -> Optional[Dict[str, Any]]:
+        """
+        get the cached response for an url
+        :param url: the requested url
+        :param identity: who requested it (see identity_of)
+        :return: the cached entry or None
+        """
+        path = self.__path(url, identity)
+        try:
+            with open(path + HttpCache.META_SUFFIX) as meta_file:
+                entry = json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+        if entry.get('url') != url:
+            return None
+        return entry
+
+    @staticmethod
+    def conditional_headers(entry: Dict[str, Any]) -> Dict[str, str]:
+        """
+        get the headers to ask if a cached response is still valid
+        :param entry: the cached entry (see lookup)
+        :return: the headers
+        """
+        headers: Dict[str, str] = {}
+        if entry['headers'].get('ETag'):
+            headers['If-None-Match'] = entry['headers']['ETag']
+        if entry['headers'].get('Last-Modified'):
+            headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return headers
+
+    def response(self, url: str, identity: str, entry: Dict[str, Any],
+                 not_modified: Response) -> Optional[Response]:
+        """
+        turn a 304 Not Modified answer into the cached response
+        :param url: the requested url
+        :param identity: who requested it (see identity_of)
+        :param entry: the cached entry (see lookup)
+        :param not_modified: the 304 answer of the gitea instance
+        :return: the response or None if the body is gone
+        """
+        path = self.__path(url, identity)
+        try:
+            with open(path + HttpCache.BODY_SUFFIX, 'rb') as body_file:
+                body = body_file.read()
+            # mark as recently used
+            os.utime(path + HttpCache.META_SUFFIX)
+        except OSError:
+            return None
+        not_modified.status_code = 200
+        not_modified._content = body
+        for header, value in entry['headers'].items():
+            not_modified.headers.setdefault(header, value)
+        return not_modified
+
+    def store(self, url: str, identity: str, response: Response) -> None:
+        """
+        store a response if it can be validated later
+        :param url: the requested url
+        :param identity: who requested it (see identity_of)
+        :param response: the response of the gitea instance
+        :return: None
+        """
+        if not response.headers.get('ETag') and not response.headers.get('Last-Modified'):
+            return
+        headers = {header: response.headers[header]
+                   for header in CACHED_HEADERS if header in response.headers}
+        path = self.__path(url, identity)
+        try:
+            with atomic_file(path + HttpCache.BODY_SUFFIX, 'wb') as body_file:
+                body_file.write(response.content)
+            atomic_write_json(path + HttpCache.META_SUFFIX, {'url': url, 'headers': headers})
+        except OSError:
+            pass
+
+    def evict(self) -> None:
+        """
+        delete responses unused for longer than max_age
+        and then the least recently used ones until the cache is smaller than max_size
+        :return: None
+        """
+        with self.__lock:
+            now = time.time()
+            entries: List[Tuple[float, int, str]] = []
+            for name in os.listdir(self.folder):
+                if not name.endswith(HttpCache.META_SUFFIX):
+                    continue
+                path = os.path.join(self.folder, name[:-len(HttpCache.META_SUFFIX)])
+                try:
+                    used = os.path.getmtime(path + HttpCache.META_SUFFIX)
+                    size = os.path.getsize(path + HttpCache.META_SUFFIX) \
+                        + os.path.getsize(path + HttpCache.BODY_SUFFIX)
+                except OSError:
+                    size = 0
+                    used = 0
+                entries.append((used, size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for used, size, path in sorted(entries):
+                if now - used <= self.max_age and total <= self.max_size:
+                    break
+                for suffix in [HttpCache.META_SUFFIX, HttpCache.BODY_SUFFIX]:
+                    try:
+                        os.remove(path + suffix)
+                    except OSError:
+                        pass
+                total -= size
+
+    def __path(self, url: str, identity: str) -> str:
+        """
+        get the path of the cache files for an url
+        :param url: the requested url
+        :param identity: who requested it
+        :return: the path without suffix
+        """
+        digest = hashlib.sha256((identity + " " + url).encode()).hexdigest()
+        return os.path.join(self.folder, digest)
+
+
+def identity_of(user: str, secret: str) -> str:
+    """
+    get an identity for credentials that doesn't reveal them
+    :param user: the user name
+    :param secret: the password or token
+    :return: the identity
+    """
+    return hashlib.sha256((user + ":" + secret).encode()).hexdigest()
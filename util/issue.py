@@ -3,7 +3,8 @@ holds all infos about Issues
 """
 from collections import namedtuple
 from enum import Enum
-from typing import List
+import sys
+from typing import Any, Dict, List
 
 
 class Issue:
@@ -15,9 +16,20 @@ class Issue:
     - body
     - labels
     - comments (see Comment object)
+    - number (of the issue in its repo, the key of the issue, see Registry)
+    - updated_at (when the issue was last changed)
+    - id (of the issue on the gitea instance, 0 if unknown)
+    author and labels are interned, they repeat across many issues
     """
-    def __init__(self, author, title, body, state) -> None:
-        self.author: str = author
+    __slots__ = ['number', 'updated_at', 'id', 'author', 'title', 'body', 'state', 'labels',
+                 'comments']
+
+    def __init__(self, author, title, body, state, number: int = 0, updated_at: str = "",
+                 issue_id: int = 0) -> None:
+        self.number: int = number
+        self.updated_at: str = updated_at
+        self.id: int = issue_id  # pylint: disable=invalid-name
+        self.author: str = sys.intern(author)
         self.title: str = title
         self.body: str = body
 
@@ -37,11 +49,51 @@ class Issue:
         :param label: the label to add
         :return: None
         """
-        self.labels.append(label)
+        self.labels.append(sys.intern(label))
+
+    @property
+    def key(self) -> int:
+        """
+        get what identifies the issue within its repo
+        :return: the number
+        """
+        return self.number
 
     def __repr__(self) -> str:
         return "{title} by {author}".format(title=self.title, author=self.author)
 
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        convert this issue into a dict that can be saved as json
+        :return: dict
+        """
+        return {'number': self.number,
+                'updated_at': self.updated_at,
+                'state': self.state.name,
+                'title': self.title,
+                'author': self.author,
+                'body': self.body,
+                'labels': self.labels,
+                'comments': [comment._asdict() for comment in self.comments]}
+
+    @staticmethod
+    def from_dict(issue_dict: Dict[str, Any]) -> 'Issue':
+        """
+        convert a dict (see to_dict) back into an issue
+        :param issue_dict: the dict
+        :return: the Issue
+        """
+        issue = Issue(author=issue_dict['author'],
+                      title=issue_dict['title'],
+                      body=issue_dict['body'],
+                      state=issue_dict['state'],
+                      number=issue_dict['number'],
+                      updated_at=issue_dict['updated_at'])
+        for label in issue_dict['labels']:
+            issue.add_label(label)
+        issue.comments = [Comment(**comment) for comment in issue_dict['comments']]
+        return issue
+
     def save_to_file(self) -> str:
         """
         convert this issue into an multiline string to write to a file
@@ -0,0 +1,345 @@
+"""
+holds the formats the issues of a repo can be saved in
+"""
+import json
+import os
+import sqlite3
+from typing import Any, Dict, List, Optional, Set
+
+from util.atomic import atomic_file, atomic_write_json
+from util.issue import Issue
+from util.manifest import Manifest
+
+FILES = "files"  # one file per issue, sorted into folders by state
+JSONL = "jsonl"  # one json line per issue in a single file with an index
+SQLITE = "sqlite"  # one sqlite database
+FORMATS = [FILES, JSONL, SQLITE]
+
+
+class IssueArchive:
+    """
+    represents where the issues of one repo are saved consisting of:
+    - folder (of the issues of the repo)
+    every format names the file an issue is saved to (see file_of),
+    the manifest uses it to notice moved issues
+    """
+
+    def __init__(self, folder: str) -> None:
+        self.folder: str = folder
+
+    def file_of(self, issue: Issue, manifest: Optional[Manifest]) -> str:
+        """
+        get the file (relative to the folder) an issue is saved to
+        :param issue: the issue
+        :param manifest: the manifest of the already saved issues or None
+        :return: the file
+        """
+        raise NotImplementedError()
+
+    def exists(self, file: str) -> bool:
+        """
+        check if a file of the archive exists
+        :param file: the file (see file_of)
+        :return: bool
+        """
+        return os.path.isfile(os.path.join(self.folder, file))
+
+    def write(self, issue: Issue, content: str, file: str) -> None:
+        """
+        save an issue
+        :param issue: the issue
+        :param content: the issue as text (see Issue.save_to_file)
+        :param file: the file to save it to (see file_of)
+        :return: None
+        """
+        raise NotImplementedError()
+
+    def remove(self, file: str) -> None:
+        """
+        remove a file no issue is saved to anymore
+        :param file: the file (see file_of)
+        :return: None
+        """
+
+    def lookup(self, number: int) -> Optional[Issue]:
+        """
+        get a saved issue
+        :param number: the number of the issue
+        :return: the Issue or None if it isn't saved or can't be read back (files)
+        """
+        return None
+
+    def flush(self) -> None:
+        """
+        make everything written so far durable, so a crash loses none of it
+        :return: None
+        """
+
+    def close(self) -> None:
+        """
+        finish writing
+        :return: None
+        """
+
+
+class FileArchive(IssueArchive):
+    """
+    saves each issue to <state>/<title>
+    """
+
+    def __init__(self, folder: str) -> None:
+        super().__init__(folder)
+        self.__created: Set[str] = set()
+
+    def file_of(self, issue: Issue, manifest: Optional[Manifest]) -> str:
+        # titles may contain anything, but no path separators
+        title = issue.title.replace('/', '_').replace('\\', '_').replace('\0', '_').strip()
+        if title in ['', '.', '..']:
+            title = '#' + str(issue.number)
+        file = issue.state.name + "/" + title
+        if manifest is not None and manifest.is_used(file, issue.number):
+            # another issue has the same title
+            file += " (#" + str(issue.number) + ")"
+        return file
+
+    def write(self, issue: Issue, content: str, file: str) -> None:
+        state_folder = os.path.join(self.folder, issue.state.name)
+        if state_folder not in self.__created:
+            os.makedirs(state_folder, exist_ok=True)
+            self.__created.add(state_folder)
+        with open(os.path.join(self.folder, file), 'w') as out:
+            out.write(content)
+
+    def remove(self, file: str) -> None:
+        path = os.path.join(self.folder, file)
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+class JsonlArchive(IssueArchive):
+    """
+    appends each issue as one json line to issues.jsonl
+    issues.idx.json holds offset and length of the latest line of every issue
+    and its state and labels, so issues can be looked up without reading the whole file
+    """
+    FILE_NAME = "issues.jsonl"
+    INDEX_NAME = "issues.idx.json"
+
+    def __init__(self, folder: str) -> None:
+        super().__init__(folder)
+        os.makedirs(folder, exist_ok=True)
+        self.path: str = os.path.join(folder, JsonlArchive.FILE_NAME)
+        self.index_path: str = os.path.join(folder, JsonlArchive.INDEX_NAME)
+        self.index: Dict[int, Dict[str, Any]] = {}
+        self.__size: int = 0
+        self.__out = None
+        self.__load_index()
+
+    def file_of(self, issue: Issue, manifest: Optional[Manifest]) -> str:
+        return JsonlArchive.FILE_NAME
+
+    def write(self, issue: Issue, content: str, file: str) -> None:
+        if self.__out is None:
+            self.__out = open(self.path, 'ab')
+        line = (json.dumps(issue.to_dict()) + "\n").encode()
+        self.__out.write(line)
+        self.__add_to_index(issue.number, issue.state.name, issue.labels, self.__size, len(line))
+        self.__size += len(line)
+
+    def flush(self) -> None:
+        # the index is saved on close, lines after it are indexed again on load
+        if self.__out is not None:
+            self.__out.flush()
+            os.fsync(self.__out.fileno())
+
+    def close(self) -> None:
+        if self.__out is not None:
+            self.__out.close()
+            self.__out = None
+            live = sum(entry['length'] for entry in self.index.values())
+            # an issue saved again leaves its old line behind
+            if self.__size > 2 * live:
+                self.__compact()
+            self.__save_index()
+
+    def lookup(self, number: int) -> Optional[Issue]:
+        entry = self.index.get(number)
+        if entry is None:
+            return None
+        with open(self.path, 'rb') as archive:
+            archive.seek(entry['offset'])
+            return Issue.from_dict(json.loads(archive.read(entry['length'])))
+
+    def find(self, state: Optional[str] = None, label: Optional[str] = None) -> List[int]:
+        """
+        get the numbers of the saved issues with a state and/or label
+        :param state: the state (see State) or None for every state
+        :param label: the label or None for every label
+        :return: list of issue numbers
+        """
+        return sorted(number for number, entry in self.index.items()
+                      if (state is None or entry['state'] == state)
+                      and (label is None or label in entry['labels']))
+
+    def __add_to_index(self, number: int, state: str, labels: List[str],
+                       offset: int, length: int) -> None:
+        self.index[number] = {'offset': offset, 'length': length, 'state': state, 'labels': labels}
+
+    def __load_index(self) -> None:
+        """
+        load the index and add lines written after it was saved (e.g. by a crashed run)
+        :return: None
+        """
+        if not os.path.isfile(self.path):
+            return
+        indexed = 0
+        if os.path.isfile(self.index_path):
+            with open(self.index_path) as index_file:
+                index = json.load(index_file)
+            self.index = {int(number): entry for number, entry in index['issues'].items()}
+            indexed = index['size']
+        self.__size = os.path.getsize(self.path)
+        if indexed > self.__size:
+            # the index doesn't belong to this file
+            self.index = {}
+            indexed = 0
+        if indexed == self.__size:
+            return
+        with open(self.path, 'rb') as archive:
+            archive.seek(indexed)
+            offset = indexed
+            for line in archive:
+                if not line.endswith(b"\n"):
+                    # cut off line of a crashed run
+                    break
+                issue = json.loads(line)
+                self.__add_to_index(issue['number'], issue['state'], issue['labels'],
+                                    offset, len(line))
+                offset += len(line)
+        if offset < self.__size:
+            with open(self.path, 'ab') as archive:
+                archive.truncate(offset)
+            self.__size = offset
+
+    def __save_index(self) -> None:
+        issues = {str(number): entry for number, entry in sorted(self.index.items())}
+        atomic_write_json(self.index_path, {'size': self.__size, 'issues': issues})
+
+    def __compact(self) -> None:
+        """
+        rewrite the archive with only the latest line of every issue
+        :return: None
+        """
+        offset = 0
+        with open(self.path, 'rb') as archive, atomic_file(self.path, 'wb') as compacted:
+            for _, entry in sorted(self.index.items()):
+                archive.seek(entry['offset'])
+                compacted.write(archive.read(entry['length']))
+                entry['offset'] = offset
+                offset += entry['length']
+        self.__size = offset
+
+
+class SqliteArchive(IssueArchive):
+    """
+    saves all issues and their labels and comments to the tables of issues.sqlite
+    """
+    FILE_NAME = "issues.sqlite"
+
+    def __init__(self, folder: str) -> None:
+        super().__init__(folder)
+        os.makedirs(folder, exist_ok=True)
+        self.path: str = os.path.join(folder, SqliteArchive.FILE_NAME)
+        self.database = sqlite3.connect(self.path)
+        self.database.executescript('''
+            CREATE TABLE IF NOT EXISTS issues (
+                number INTEGER PRIMARY KEY,
+                updated_at TEXT,
+                state TEXT,
+                title TEXT,
+                author TEXT,
+                body TEXT
+            );
+            CREATE INDEX IF NOT EXISTS issues_state ON issues (state);
+            CREATE TABLE IF NOT EXISTS labels (
+                number INTEGER,
+                label TEXT
+            );
+            CREATE INDEX IF NOT EXISTS labels_number ON labels (number);
+            CREATE INDEX IF NOT EXISTS labels_label ON labels (label);
+            CREATE TABLE IF NOT EXISTS comments (
+                number INTEGER,
+                position INTEGER,
+                author TEXT,
+                body TEXT
+            );
+            CREATE INDEX IF NOT EXISTS comments_number ON comments (number, position);
+        ''')
+
+    def file_of(self, issue: Issue, manifest: Optional[Manifest]) -> str:
+        return SqliteArchive.FILE_NAME
+
+    def write(self, issue: Issue, content: str, file: str) -> None:
+        self.database.execute('INSERT OR REPLACE INTO issues VALUES (?, ?, ?, ?, ?, ?)',
+                              (issue.number, issue.updated_at, issue.state.name,
+                               issue.title, issue.author, issue.body))
+        self.database.execute('DELETE FROM labels WHERE number = ?', (issue.number,))
+        self.database.executemany('INSERT INTO labels VALUES (?, ?)',
+                                  [(issue.number, label) for label in issue.labels])
+        self.database.execute('DELETE FROM comments WHERE number = ?', (issue.number,))
+        self.database.executemany('INSERT INTO comments VALUES (?, ?, ?, ?)',
+                                  [(issue.number, position, comment.author, comment.body)
+                                   for position, comment in enumerate(issue.comments)])
+
+    def flush(self) -> None:
+        self.database.commit()
+
+    def close(self) -> None:
+        self.database.commit()
+        self.database.close()
+
+    def lookup(self, number: int) -> Optional[Issue]:
+        row = self.database.execute('SELECT number, updated_at, state, title, author, body '
+                                    'FROM issues WHERE number = ?', (number,)).fetchone()
+        if row is None:
+            return None
+        return Issue.from_dict({
+            'number': row[0], 'updated_at': row[1], 'state': row[2],
+            'title': row[3], 'author': row[4], 'body': row[5],
+            'labels': [label for (label,) in self.database.execute(
+                'SELECT label FROM labels WHERE number = ? ORDER BY rowid', (number,))],
+            'comments': [{'author': author, 'body': body}
+                         for author, body in self.database.execute(
+                             'SELECT author, body FROM comments WHERE number = ? '
+                             'ORDER BY position', (number,))]})
+
+    def find(self, state: Optional[str] = None, label: Optional[str] = None) -> List[int]:
+        """
+        get the numbers of the saved issues with a state and/or label
+        :param state: the state (see State) or None for every state
+        :param label: the label or None for every label
+        :return: list of issue numbers
+        """
+        query = 'SELECT DISTINCT issues.number FROM issues LEFT JOIN labels USING (number) WHERE 1'
+        parameters: List[str] = []
+        if state is not None:
+            query += ' AND issues.state = ?'
+            parameters.append(state)
+        if label is not None:
+            query += ' AND labels.label = ?'
+            parameters.append(label)
+        return [number for (number,) in self.database.execute(query + ' ORDER BY 1', parameters)]
+
+
+def open_archive(issue_format: str, folder: str) -> IssueArchive:
+    """
+    get the archive for a format
+    :param issue_format: the format (see FORMATS)
+    :param folder: the folder of the issues of the repo
+    :return: the archive
+    """
+    if issue_format == JSONL:
+        return JsonlArchive(folder)
+    if issue_format == SQLITE:
+        return SqliteArchive(folder)
+    return FileArchive(folder)
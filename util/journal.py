@@ -0,0 +1,202 @@
+"""
+holds the journal of a backup run, so a run that died can be resumed
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from util.atomic import atomic_file
+from util.issue_archive import IssueArchive
+from util.manifest import Manifest
+from util.stats import ISSUES
+
+# the stages of a repo are GIT, ISSUES and ASSETS of stats
+ISSUE_PAGE = "issue_page"  # a page of issues of the repo was saved
+
+
+class Journal:
+    """
+    represents the append-only journal of a backup run consisting of:
+    - path (of the journal file)
+    - done (stage and name of every finished stage of a repo)
+    - pages (name of a repo to the record of its last saved page of issues)
+    - resumed (was the journal of a run that stopped loaded?)
+    every record is one json line, a line cut off by a crash is dropped on load
+    all methods may be called from several threads
+    """
+    FILE_NAME = ".journal.jsonl"
+
+    def __init__(self, folder: str) -> None:
+        self.path: str = os.path.join(folder, Journal.FILE_NAME)
+        self.done: Set[Tuple[str, str]] = set()
+        self.pages: Dict[str, Dict[str, Any]] = {}
+        self.resumed: bool = False
+        self.__lock = threading.Lock()
+        self.__out = None
+
+    def load(self) -> None:
+        """
+        load the journal of the last run, if there is one, to resume it
+        the journal is written again without what is no longer needed
+        :return: None
+        """
+        if not os.path.isfile(self.path):
+            return
+        self.resumed = True
+        with open(self.path) as journal_file:
+            for line in journal_file:
+                if not line.endswith("\n"):
+                    # cut off line of a crashed run
+                    break
+                try:
+                    self.__apply(json.loads(line))
+                except (ValueError, KeyError):
+                    break
+        records: List[Dict[str, Any]] = [{'stage': stage, 'repo': repo}
+                                         for stage, repo in sorted(self.done)]
+        records += [page for _, page in sorted(self.pages.items())]
+        with atomic_file(self.path) as journal_file:
+            for record in records:
+                journal_file.write(json.dumps(record) + "\n")
+
+    def reset(self) -> None:
+        """
+        start a new journal and forget the last run, e.g. after a run that finished
+        :return: None
+        """
+        with self.__lock:
+            self.done = set()
+            self.pages = {}
+            self.resumed = False
+            self.__close()
+            if os.path.isfile(self.path):
+                os.remove(self.path)
+
+    def is_done(self, stage: str, repo: str) -> bool:
+        """
+        check if a stage of a repo was finished
+        :param stage: the stage (GIT, ISSUES or ASSETS)
+        :param repo: the full name of the repo
+        :return: bool
+        """
+        with self.__lock:
+            return (stage, repo) in self.done
+
+    def finish(self, stage: str, repo: str) -> None:
+        """
+        record that a stage of a repo was finished
+        :param stage: the stage (GIT, ISSUES or ASSETS)
+        :param repo: the full name of the repo
+        :return: None
+        """
+        self.__append({'stage': stage, 'repo': repo})
+
+    def last_page(self, repo: str, issue_format: str) -> Optional[Dict[str, Any]]:
+        """
+        get the last saved page of issues of a repo whose issues weren't all saved
+        :param repo: the full name of the repo
+        :param issue_format: the format the issues are saved in now
+        :return: the record with page, since, started_at and the manifest entries (issues)
+                 of all saved pages or None to start from the first page
+        """
+        with self.__lock:
+            page = self.pages.get(repo)
+        if page is None or page['format'] != issue_format:
+            return None
+        return page
+
+    def save_page(self, repo: str, page: int, since: Optional[str], started_at: str,
+                  issue_format: str, issues: Dict[int, Dict[str, str]]) -> None:
+        """
+        record that a page of issues of a repo was saved
+        :param repo: the full name of the repo
+        :param page: the number of the page
+        :param since: the issues were requested changed since then (see Manifest)
+        :param started_at: when the export of the issues of the repo started (see sync_start)
+        :param issue_format: the format the issues are saved in
+        :param issues: the manifest entries of the issues saved since the last page
+        :return: None
+        """
+        self.__append({'stage': ISSUE_PAGE, 'repo': repo, 'page': page, 'since': since,
+                       'started_at': started_at, 'format': issue_format,
+                       'issues': {str(number): entry for number, entry in issues.items()}})
+
+    def close(self) -> None:
+        """
+        finish writing
+        :return: None
+        """
+        with self.__lock:
+            self.__close()
+
+    def __append(self, record: Dict[str, Any]) -> None:
+        """
+        append a record and wait until it is on disk
+        :param record: the record
+        :return: None
+        """
+        line = json.dumps(record) + "\n"
+        with self.__lock:
+            if self.__out is None:
+                self.__out = open(self.path, 'a')
+            # one write per line, so a crash can only cut off the last line
+            self.__out.write(line)
+            self.__out.flush()
+            os.fsync(self.__out.fileno())
+            self.__apply(record)
+
+    def __apply(self, record: Dict[str, Any]) -> None:
+        if record['stage'] == ISSUE_PAGE:
+            # the entries of the earlier pages of the same export are carried on
+            previous = self.pages.get(record['repo'])
+            if previous is not None and previous['started_at'] == record['started_at'] \
+                    and previous['format'] == record['format']:
+                previous['issues'].update(record['issues'])
+                record['issues'] = previous['issues']
+            self.pages[record['repo']] = record
+        else:
+            self.done.add((record['stage'], record['repo']))
+            if record['stage'] == ISSUES:
+                self.pages.pop(record['repo'], None)
+
+    def __close(self) -> None:
+        if self.__out is not None:
+            self.__out.close()
+            self.__out = None
+
+
+class IssueCheckpoint:
+    """
+    represents the progress of the issue export of a repo consisting of:
+    - journal (to record saved pages in)
+    - repo (the full name of the repo)
+    - since, started_at (of the export, see Manifest)
+    - issue_format (the issues are saved in)
+    - manifest (of the saved issues)
+    - archive (the issues are saved to, set once it is opened)
+    """
+
+    def __init__(self, journal: Journal, repo: str, since: Optional[str], started_at: str,
+                 issue_format: str, manifest: Manifest) -> None:
+        self.journal: Journal = journal
+        self.repo: str = repo
+        self.since: Optional[str] = since
+        self.started_at: str = started_at
+        self.issue_format: str = issue_format
+        self.manifest: Manifest = manifest
+        self.archive: Optional[IssueArchive] = None
+
+    def page_saved(self, page: int) -> None:
+        """
+        make the issues saved so far durable and record the page
+        with the manifest entries of its issues, the manifest itself is saved once the repo
+        is done, so a page costs only as much as its issues
+        called by get_issues once every issue of a page was handed on
+        :param page: the number of the page
+        :return: None
+        """
+        if self.archive is not None:
+            self.archive.flush()
+        self.journal.save_page(self.repo, page, self.since, self.started_at, self.issue_format,
+                               self.manifest.take_changes())
@@ -0,0 +1,123 @@
+"""
+holds the on-disk cache of the repo listing, user id and version of a gitea instance
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+from util.atomic import atomic_write_json
+
+FOLDER_NAME = "listings"  # in the cache folder, next to the cached responses
+REFRESH_TIMEOUT = 10 * 60  # seconds after which a refresh that never finished is started again
+
+
+class ListingCache:
+    """
+    represents the cached listings consisting of:
+    - folder (to keep the listings in)
+    - ttl (seconds a listing is used without asking the gitea instance)
+    - stale (seconds after the ttl a listing is still used while it is refreshed in the background)
+    a listing is a dict of:
+    - fetched_at (when it was requested)
+    - user_id, version (of the user and the gitea instance)
+    - repos (list of Repo.to_dict), excluded (name of left out repo to why)
+    """
+
+    def __init__(self, folder: str, ttl: float, stale: float) -> None:
+        self.folder: str = os.path.join(folder, FOLDER_NAME)
+        self.ttl: float = ttl
+        self.stale: float = stale
+        os.makedirs(self.folder, exist_ok=True)
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        get a cached listing, however old it is (see is_fresh and is_usable)
+        :param key: the key of the listing (see key_of)
+        :return: the listing or None if there is none
+        """
+        try:
+            with open(self.__path(key)) as listing_file:
+                return json.load(listing_file)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, key: str, listing: Dict[str, Any]) -> None:
+        """
+        cache a listing and end a refresh of it
+        :param key: the key of the listing (see key_of)
+        :param listing: the listing without fetched_at
+        :return: None
+        """
+        listing['fetched_at'] = time.time()
+        try:
+            atomic_write_json(self.__path(key), listing)
+        except OSError:
+            pass
+        self.end_refresh(key)
+
+    def age(self, listing: Dict[str, Any]) -> float:
+        """
+        get how old a listing is
+        :param listing: the listing
+        :return: seconds
+        """
+        return time.time() - listing.get('fetched_at', 0)
+
+    def is_fresh(self, listing: Dict[str, Any]) -> bool:
+        """
+        check if a listing may be used without refreshing it
+        :param listing: the listing
+        :return: bool
+        """
+        return self.age(listing) < self.ttl
+
+    def is_usable(self, listing: Dict[str, Any]) -> bool:
+        """
+        check if a listing may be used while it is refreshed in the background
+        :param listing: the listing
+        :return: bool
+        """
+        return self.age(listing) < self.ttl + self.stale
+
+    def start_refresh(self, key: str) -> bool:
+        """
+        claim the refresh of a listing, so only one process refreshes it
+        :param key: the key of the listing (see key_of)
+        :return: did this process get the claim?
+        """
+        lock = self.__path(key) + ".refresh"
+        try:
+            if time.time() - os.path.getmtime(lock) > REFRESH_TIMEOUT:
+                os.remove(lock)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except OSError:
+            return False
+        return True
+
+    def end_refresh(self, key: str) -> None:
+        """
+        release the claim of a refresh
+        :param key: the key of the listing (see key_of)
+        :return: None
+        """
+        try:
+            os.remove(self.__path(key) + ".refresh")
+        except OSError:
+            pass
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.folder, key + ".json")
+
+
+def key_of(*parts: str) -> str:
+    """
+    get the key of a listing from everything it depends on
+    :param parts: e.g. url, credentials and filter of the listing
+    :return: the key
+    """
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
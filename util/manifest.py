@@ -0,0 +1,162 @@
+"""
+holds the record of which issues of a repo were saved
+"""
+from datetime import datetime, timedelta, timezone
+import hashlib
+import json
+import os
+from typing import Dict, Optional, Set
+
+from util.atomic import atomic_write_json
+
+# overlap between two syncs, so small clock differences to the gitea instance lose no changes
+SYNC_OVERLAP = timedelta(minutes=5)
+
+
+class Manifest:
+    """
+    represents the manifest of the saved issues of a repo consisting of:
+    - path (of the manifest file)
+    - format (the issues were saved in, see issue_archive)
+    - synced_at (when the issues were last synced, None if never)
+    - issues (issue number to updated_at, hash and file of the saved issue)
+    """
+    FILE_NAME = ".manifest.json"
+
+    def __init__(self, folder: str) -> None:
+        self.path: str = os.path.join(folder, Manifest.FILE_NAME)
+        self.format: str = "files"
+        self.synced_at: Optional[str] = None
+        self.issues: Dict[int, Dict[str, str]] = {}
+        # file to the numbers of the issues saved to it, kept in step with issues
+        self.__users: Dict[str, Set[int]] = {}
+        # entries recorded since the last take_changes
+        self.__changes: Dict[int, Dict[str, str]] = {}
+
+    def load(self) -> None:
+        """
+        load the manifest from file, if there is one
+        :return: None
+        :raises ValueError: if the manifest can't be read
+        """
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path) as manifest_file:
+                manifest = json.load(manifest_file)
+            # manifests of older versions are always of saved files
+            issue_format = manifest.get('format', "files")
+            issues = {int(number): entry for number, entry in manifest.get('issues', {}).items()}
+            users: Dict[str, Set[int]] = {}
+            for number, entry in issues.items():
+                users.setdefault(entry['file'], set()).add(number)
+        except (ValueError, AttributeError, KeyError, TypeError) as exception:
+            raise ValueError("corrupt manifest " + self.path + ": " + str(exception)) from exception
+        self.format = issue_format
+        self.synced_at = manifest.get('synced_at')
+        self.issues = issues
+        self.__users = users
+
+    def save(self) -> None:
+        """
+        save the manifest to file
+        :return: None
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        atomic_write_json(self.path, {'format': self.format,
+                                      'synced_at': self.synced_at,
+                                      'issues': {str(number): entry for number, entry
+                                                 in sorted(self.issues.items())}}, indent=1)
+
+    def is_saved(self, number: int, content_hash: str, file: str) -> bool:
+        """
+        check if the issue was already saved with this content to this file
+        :param number: the number of the issue
+        :param content_hash: the hash of the content of the issue (see hash_content)
+        :param file: the file the issue is saved to
+        :return: bool
+        """
+        entry = self.issues.get(number)
+        return entry is not None \
+            and entry['hash'] == content_hash \
+            and entry['file'] == file
+
+    def is_used(self, file: str, number: int) -> bool:
+        """
+        check if another issue is saved to a file
+        :param file: the file
+        :param number: the number of the issue that wants to use it
+        :return: bool
+        """
+        users = self.__users.get(file, set())
+        return len(users) > 1 or (len(users) == 1 and number not in users)
+
+    def reset(self, issue_format: str) -> None:
+        """
+        forget everything, so all issues are saved again
+        :param issue_format: the format they are saved in now
+        :return: None
+        """
+        self.format = issue_format
+        self.synced_at = None
+        self.issues = {}
+        self.__users = {}
+        self.__changes = {}
+
+    def record(self, number: int, updated_at: str, content_hash: str, file: str) -> Optional[str]:
+        """
+        record that the issue was saved
+        :param number: the number of the issue
+        :param updated_at: when the issue was last changed
+        :param content_hash: the hash of the content of the issue (see hash_content)
+        :param file: the file the issue was saved to
+        :return: the file the issue was saved to before, if no other issue uses it now
+        """
+        entry = self.issues.get(number)
+        self.issues[number] = {'updated_at': updated_at, 'hash': content_hash, 'file': file}
+        self.__changes[number] = self.issues[number]
+        self.__users.setdefault(file, set()).add(number)
+        if entry is None or entry['file'] == file:
+            return None
+        users = self.__users[entry['file']]
+        users.discard(number)
+        if users:
+            return None
+        del self.__users[entry['file']]
+        return entry['file']
+
+    def take_changes(self) -> Dict[int, Dict[str, str]]:
+        """
+        get the entries recorded since the last call, e.g. to journal them instead of saving
+        :return: dict of issue number to entry
+        """
+        changes = self.__changes
+        self.__changes = {}
+        return changes
+
+    def merge(self, changes: Dict[int, Dict[str, str]]) -> None:
+        """
+        record entries taken by take_changes before, e.g. from the journal of a run that stopped
+        :param changes: dict of issue number to entry
+        :return: None
+        """
+        for number, entry in changes.items():
+            self.record(number, entry['updated_at'], entry['hash'], entry['file'])
+            self.__changes.pop(number, None)
+
+
+def hash_content(content: str) -> str:
+    """
+    hash the content of a saved issue
+    :param content: the content
+    :return: the hash as hex string
+    """
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def sync_start() -> str:
+    """
+    get the time to record as synced_at for a sync starting now
+    :return: the time as ISO 8601 string
+    """
+    return (datetime.now(timezone.utc) - SYNC_OVERLAP).replace(microsecond=0).isoformat()
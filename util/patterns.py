@@ -0,0 +1,47 @@
+"""
+holds the matching of repo names against names, globs and regular expressions
+"""
+from fnmatch import translate
+import re
+from typing import List, Optional, Pattern, Set, Tuple
+
+REGEX_PREFIX = "re:"  # patterns starting with this are regular expressions
+GLOB_CHARACTERS = set("*?[")  # patterns with one of these are globs
+
+
+def compile_patterns(patterns: List[str]) -> Tuple[Set[str], Optional[Pattern]]:
+    """
+    compile patterns once, so matching a name is a set lookup and one regular expression
+    :param patterns: exact names (owner/name), globs (owner/*) or regular expressions (re:...)
+    :return: (set of the exact names, one regular expression of the rest or None)
+    :raises ValueError: if a regular expression is invalid
+    """
+    names: Set[str] = set()
+    expressions: List[str] = []
+    for pattern in patterns:
+        if pattern.startswith(REGEX_PREFIX):
+            expression = pattern[len(REGEX_PREFIX):]
+            try:
+                re.compile(expression)
+            except re.error as exception:
+                raise ValueError("invalid regular expression " + pattern + " ("
+                                 + str(exception) + ")") from exception
+            expressions.append(expression)
+        elif GLOB_CHARACTERS & set(pattern):
+            expressions.append(translate(pattern))
+        else:
+            names.add(pattern)
+    if not expressions:
+        return names, None
+    return names, re.compile("|".join("(?:" + expression + ")" for expression in expressions))
+
+
+def matches(name: str, names: Set[str], pattern: Optional[Pattern]) -> bool:
+    """
+    check if a name matches compiled patterns (see compile_patterns)
+    :param name: the name
+    :param names: the exact names
+    :param pattern: the regular expression or None
+    :return: bool
+    """
+    return name in names or (pattern is not None and pattern.fullmatch(name) is not None)
@@ -0,0 +1,40 @@
+"""
+holds the registry that de-duplicates models across the pages of a list
+"""
+from typing import Any, Dict, Hashable, Iterator, Set
+
+
+class Registry:
+    """
+    represents the models (Repo, Issue) seen in a list consisting of:
+    - keep (are the models kept or only their keys?)
+    a model that shows up again (e.g. on the next page when items were added during
+    the pagination) is recognized by its key and replaces the one seen before
+    """
+
+    def __init__(self, keep: bool = True) -> None:
+        self.keep: bool = keep
+        self.__keys: Set[Hashable] = set()
+        self.__models: Dict[Hashable, Any] = {}
+
+    def add(self, model: Any) -> bool:
+        """
+        add a model
+        :param model: the model with a key
+        :return: was it seen for the first time?
+        """
+        key = model.key
+        new = key not in self.__keys
+        self.__keys.add(key)
+        if self.keep:
+            self.__models[key] = model
+        return new
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.__keys
+
+    def __len__(self) -> int:
+        return len(self.__keys)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.__models.values())
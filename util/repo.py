@@ -1,18 +1,50 @@
 """
 hold all infos about Repos
 """
+import sys
+from typing import Any, Dict, Union
 
 
 class Repo:
     """
     represents an repo with:
-        - name
-        - url
+        - name (owner/name)
+        - url (ssh)
+        - clone_url (https, empty if unknown)
+        - owner
+        - archived
+        - fork
+        - mirror
+        - size (in KB)
+        - updated_at
+        - id (of the repo on the gitea instance, 0 if unknown)
+    two repos are the same if they have the same id (or the same name if the id is unknown)
     """
+    __slots__ = ['name', 'url', 'clone_url', 'owner', 'archived', 'fork', 'mirror', 'size',
+                 'updated_at', 'id']
 
-    def __init__(self, name: str, url: str) -> None:
+    def __init__(self, name: str, url: str, owner: str = "", archived: bool = False,
+                 fork: bool = False, mirror: bool = False, size: int = 0,
+                 updated_at: str = "", repo_id: int = 0, clone_url: str = "") -> None:
         self.name = name
         self.url = url
+        self.clone_url = clone_url
+        # many repos share an owner
+        self.owner = sys.intern(owner or name.split('/')[0])
+        self.archived = archived
+        self.fork = fork
+        self.mirror = mirror
+        self.size = size
+        self.updated_at = updated_at
+        self.id = repo_id  # pylint: disable=invalid-name
+
+    @property
+    def key(self) -> Union[int, str]:
+        """
+        get what identifies the repo on the gitea instance
+        :return: the id or the name if the id is unknown
+        """
+        return self.id or self.name
 
     def is_name(self, name: str) -> bool:
         """
@@ -20,13 +52,32 @@ class Repo:
         :param name: the name to check
         :return: bool
         """
-        return self.name is name
+        return self.name == name
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        get the repo as dict (see from_dict)
+        :return: dict
+        """
+        return {'name': self.name, 'url': self.url, 'owner': self.owner,
+                'archived': self.archived, 'fork': self.fork, 'mirror': self.mirror,
+                'size': self.size, 'updated_at': self.updated_at, 'repo_id': self.id,
+                'clone_url': self.clone_url}
+
+    @staticmethod
+    def from_dict(repo: Dict[str, Any]) -> 'Repo':
+        """
+        get a repo from a dict (see to_dict)
+        :param repo: the dict
+        :return: the Repo
+        """
+        return Repo(**repo)
 
     def __repr__(self) -> str:
         return self.name
 
     def __eq__(self, other):
-        return self.name == other.name and self.url == other.url
+        return isinstance(other, Repo) and self.key == other.key
 
     def __hash__(self):
-        return id(self)
+        return hash(self.key)
@@ -0,0 +1,99 @@
+"""
+holds the rules which repos are left out of the backup
+"""
+import json
+from typing import Dict, Optional, Pattern, Set
+
+from util.config import Config
+from util.patterns import compile_patterns, matches
+from util.repo import Repo
+
+
+class RepoFilter:
+    """
+    represents the rules of the config compiled for fast matching consisting of:
+    - names (exact names of excluded repos)
+    - pattern (one regular expression of all excluded globs and regular expressions)
+    - owners (owners whose repos are excluded)
+    - skip_archived, skip_forks, skip_mirrors
+    - max_size (in KB, 0 for no limit)
+    - only_own (only repos the user owns)
+    - user (the user of the config)
+    - search (keyword gitea searches the repos for)
+    - excluded (name of every repo left out by keep to why)
+    """
+
+    def __init__(self, config: Config) -> None:
+        self.names: Set[str]
+        self.pattern: Optional[Pattern]
+        self.names, self.pattern = compile_patterns(config.exceptions)
+        self.owners: Set[str] = set(config.exclude_owners)
+        self.skip_archived: bool = config.skip_archived
+        self.skip_forks: bool = config.skip_forks
+        self.skip_mirrors: bool = config.skip_mirrors
+        self.max_size: int = config.max_size * 1024
+        self.only_own: bool = config.only_own
+        self.user: str = config.auth.user
+        self.search: str = config.search
+        self.excluded: Dict[str, str] = {}
+
+    def describe(self) -> str:
+        """
+        get all rules as text, equal for equal rules
+        :return: the rules
+        """
+        return json.dumps([sorted(self.names), self.pattern.pattern if self.pattern else None,
+                           sorted(self.owners), self.skip_archived, self.skip_forks,
+                           self.skip_mirrors, self.max_size, self.only_own, self.user,
+                           self.search])
+
+    def search_parameters(self) -> Dict[str, str]:
+        """
+        get the parameters of /repos/search that leave out repos on the gitea instance already
+        :return: parameter to value
+        """
+        parameters: Dict[str, str] = {}
+        if self.search:
+            parameters['q'] = self.search
+        if self.only_own:
+            parameters['exclusive'] = "true"
+        if self.skip_archived:
+            parameters['archived'] = "false"
+        if self.skip_forks and self.skip_mirrors:
+            # gitea has no mode for "no forks" or "no mirrors" alone
+            parameters['mode'] = "source"
+        return parameters
+
+    def keep(self, repo: Repo) -> bool:
+        """
+        check if a repo is backed up and remember why not
+        :param repo: the repo
+        :return: bool
+        """
+        reason = self.excludes(repo)
+        if reason is not None:
+            self.excluded[repo.name] = reason
+        return reason is None
+
+    def excludes(self, repo: Repo) -> Optional[str]:
+        """
+        check if a repo is left out
+        the rules are checked again for everything passed to gitea, older versions ignore some
+        :param repo: the repo
+        :return: why it is left out or None if it isn't
+        """
+        if matches(repo.name, self.names, self.pattern):
+            return "it is an exception"
+        if self.only_own and repo.owner != self.user:
+            return "it isn't owned by " + self.user
+        if repo.owner in self.owners:
+            return "its owner " + repo.owner + " is excluded"
+        if self.skip_archived and repo.archived:
+            return "it is archived"
+        if self.skip_forks and repo.fork:
+            return "it is a fork"
+        if self.skip_mirrors and repo.mirror:
+            return "it is a mirror"
+        if self.max_size and repo.size > self.max_size:
+            return "it is larger than " + str(self.max_size // 1024) + " MB"
+        return None
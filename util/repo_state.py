@@ -0,0 +1,91 @@
+"""
+holds what was known about every repo after its last sync, to skip unchanged repos
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+from util.atomic import atomic_write_json
+from util.repo import Repo
+
+
+class RepoStates:
+    """
+    represents the state of all synced repos of a download folder consisting of:
+    - path (of the state file)
+    - repos (name of the repo to updated_at and the digest of its remote refs at the last sync)
+    all methods may be called from several threads
+    """
+    FILE_NAME = ".repos.json"
+
+    def __init__(self, folder: str) -> None:
+        self.path: str = os.path.join(folder, RepoStates.FILE_NAME)
+        self.repos: Dict[str, Dict[str, Optional[str]]] = {}
+        self.__lock = threading.Lock()
+
+    def load(self) -> None:
+        """
+        load the states from file, if there is one
+        :return: None
+        """
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path) as state_file:
+                self.repos = json.load(state_file)
+        except ValueError:
+            # only costs a fetch of every repo
+            self.repos = {}
+
+    def save(self) -> None:
+        """
+        save the states to file
+        :return: None
+        """
+        with self.__lock:
+            atomic_write_json(self.path, dict(sorted(self.repos.items())), indent=1)
+
+    def is_unchanged(self, repo: Repo) -> bool:
+        """
+        check if gitea reports the same last change as at the last sync
+        :param repo: the repo
+        :return: bool
+        """
+        with self.__lock:
+            state = self.repos.get(repo.name)
+        return bool(repo.updated_at) \
+            and state is not None \
+            and state['updated_at'] == repo.updated_at
+
+    def has_refs(self, repo: Repo, digest: str) -> bool:
+        """
+        check if the remote refs are the same as at the last sync
+        :param repo: the repo
+        :param digest: the digest of the remote refs now (see refs_digest)
+        :return: bool
+        """
+        with self.__lock:
+            state = self.repos.get(repo.name)
+        return state is not None and state['refs'] == digest
+
+    def record(self, repo: Repo, digest: Optional[str]) -> None:
+        """
+        record a successful sync
+        :param repo: the repo
+        :param digest: the digest of the remote refs (see refs_digest) or None if unknown
+        :return: None
+        """
+        with self.__lock:
+            self.repos[repo.name] = {'updated_at': repo.updated_at, 'refs': digest}
+
+
+def refs_digest(refs: Dict[str, str]) -> str:
+    """
+    get a digest of refs, equal for equal refs
+    :param refs: dict of ref name to object id
+    :return: the digest as hex string
+    """
+    lines = "".join(ref + " " + object_id + "\n" for ref, object_id in sorted(refs.items()))
+    return hashlib.sha256(lines.encode()).hexdigest()
@@ -0,0 +1,55 @@
+"""
+holds the outcome of working on a single repo
+"""
+from typing import List
+
+from colorama import Fore, Style
+
+
+class RepoResult:
+    """
+    represents the result of backing up one repo consisting of:
+    - name (of the repo)
+    - ok (did everything succeed)
+    - messages (why something failed or what was done)
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self.ok: bool = True
+        self.messages: List[str] = []
+
+    def fail(self, message: str) -> None:
+        """
+        mark the result as failed
+        :param message: why it failed
+        :return: None
+        """
+        self.ok = False
+        self.messages.append(message)
+
+    def note(self, message: str) -> None:
+        """
+        add an informational message without failing the result
+        :param message: the message to add
+        :return: None
+        """
+        self.messages.append(message)
+
+    def merge(self, other: 'RepoResult') -> None:
+        """
+        add the outcome of another stage of the same repo
+        :param other: the result of the other stage
+        :return: None
+        """
+        self.ok = self.ok and other.ok
+        self.messages.extend(other.messages)
+
+    def __repr__(self) -> str:
+        if self.ok:
+            line = self.name + " " + Fore.GREEN + "✓" + Style.RESET_ALL
+        else:
+            line = self.name + " " + Fore.RED + "✘" + Style.RESET_ALL
+        if self.messages:
+            line += " (" + "; ".join(self.messages) + ")"
+        return line
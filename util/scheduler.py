@@ -0,0 +1,158 @@
+"""
+holds the schedulers that limit the requests to a gitea instance and the bandwidth of downloads
+and the limits all targets share
+"""
+from contextlib import contextmanager
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+# shrink the limit at most this often (seconds), one overload answers many requests at once
+DECREASE_INTERVAL = 1.0
+
+API_REQUESTS = "requests"  # api requests to all gitea instances
+GIT_TRANSFERS = "git"  # clones and fetches
+DISK_WRITES = "writes"  # writing issues and exports
+
+
+class RequestScheduler:
+    """
+    limits the number of concurrent requests to a gitea instance
+    the limit is halved when the instance pushes back (429, 503)
+    and grows by one again after as many answered requests as the limit is high
+    if the instance asks to retry after some time, no request is sent before then
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.max_limit: int = limit
+        self.limit: float = float(limit)
+        self.in_flight: int = 0
+        self.paused_until: float = 0.0
+        self.__last_decrease: float = 0.0
+        self.__condition = threading.Condition()
+
+    def acquire(self) -> None:
+        """
+        wait until a request may be sent
+        :return: None
+        """
+        with self.__condition:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    self.__condition.wait(pause)
+                elif self.in_flight < int(self.limit):
+                    break
+                else:
+                    self.__condition.wait()
+            self.in_flight += 1
+
+    def release(self, pushed_back: bool = False, retry_after: Optional[float] = None) -> None:
+        """
+        a request was answered
+        :param pushed_back: did the instance answer that it is overloaded?
+        :param retry_after: seconds the instance asked to wait, if it did
+        :return: None
+        """
+        with self.__condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if pushed_back:
+                if now - self.__last_decrease >= DECREASE_INTERVAL:
+                    self.limit = max(1.0, self.limit / 2)
+                    self.__last_decrease = now
+                if retry_after:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self.__condition.notify_all()
+
+
+class BandwidthLimiter:
+    """
+    limits the bytes per second all downloads together receive
+    every download takes its chunks from one bucket that fills at the limit,
+    holding at most one second of bytes
+    """
+
+    def __init__(self, bytes_per_second: int) -> None:
+        self.bytes_per_second: int = bytes_per_second
+        self.available: float = float(bytes_per_second)
+        self.__filled_at: float = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def consume(self, size: int) -> None:
+        """
+        wait until size bytes may be received
+        :param size: the number of bytes
+        :return: None
+        """
+        if not self.bytes_per_second:
+            return
+        with self.__lock:
+            now = time.monotonic()
+            self.available = min(float(self.bytes_per_second), self.available
+                                 + (now - self.__filled_at) * self.bytes_per_second)
+            self.__filled_at = now
+            self.available -= size
+            # the debt is paid by waiting, later chunks wait behind this one
+            wait = -self.available / self.bytes_per_second
+        if wait > 0:
+            time.sleep(wait)
+
+
+class ConcurrencyLimit:
+    """
+    limits how many threads do a kind of work at the same time, 0 for no limit
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit: int = limit
+        self.__semaphore: Optional[threading.Semaphore] = \
+            threading.Semaphore(limit) if limit > 0 else None
+
+    def acquire(self) -> None:
+        """
+        wait until the work may start
+        :return: None
+        """
+        if self.__semaphore is not None:
+            self.__semaphore.acquire()
+
+    def release(self) -> None:
+        """
+        the work is done
+        :return: None
+        """
+        if self.__semaphore is not None:
+            self.__semaphore.release()
+
+    @contextmanager
+    def hold(self) -> Iterator[None]:
+        """
+        do the work within the limit, use with `with`
+        :return: None
+        """
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+# one limit per kind of work for all targets, see get_limit
+__LIMITS: Dict[str, ConcurrencyLimit] = {}
+__LIMITS_LOCK = threading.Lock()
+
+
+def get_limit(kind: str, limit: int = 0) -> ConcurrencyLimit:
+    """
+    get the limit of a kind of work all targets share, the first call sets how many may run
+    :param kind: the kind of work (API_REQUESTS, GIT_TRANSFERS or DISK_WRITES)
+    :param limit: how many may run at the same time, 0 for no limit
+    :return: the limit
+    """
+    with __LIMITS_LOCK:
+        if kind not in __LIMITS:
+            __LIMITS[kind] = ConcurrencyLimit(limit)
+        return __LIMITS[kind]
@@ -0,0 +1,121 @@
+"""
+holds the partition of the repos into shards, so several hosts can back up one instance
+"""
+from datetime import datetime, timezone
+import hashlib
+import json
+from typing import Dict, List, Optional, Tuple
+
+from util.atomic import atomic_write_json
+
+
+class ShardManifest:
+    """
+    represents the record of a backup of one shard consisting of:
+    - path (of the manifest file)
+    - shard (the number of the shard, starting at 1)
+    - shards (the number of all shards)
+    - complete (was the list of repos complete?)
+    - repos (name of every repo of the shard to whether its backup succeeded)
+    - finished_at (when the backup finished)
+    """
+
+    def __init__(self, path: str, shard: int = 1, shards: int = 1) -> None:
+        self.path: str = path
+        self.shard: int = shard
+        self.shards: int = shards
+        self.complete: bool = True
+        self.repos: Dict[str, bool] = {}
+        self.finished_at: Optional[str] = None
+
+    @staticmethod
+    def file_name(shard: int, shards: int) -> str:
+        """
+        get the name of the manifest file of a shard
+        :param shard: the number of the shard
+        :param shards: the number of all shards
+        :return: the file name
+        """
+        return ".shard-" + str(shard) + "-of-" + str(shards) + ".json"
+
+    def load(self) -> None:
+        """
+        load the manifest from file
+        :return: None
+        """
+        with open(self.path) as manifest_file:
+            manifest = json.load(manifest_file)
+        self.shard = manifest['shard']
+        self.shards = manifest['shards']
+        self.complete = manifest['complete']
+        self.repos = manifest['repos']
+        self.finished_at = manifest.get('finished_at')
+
+    def save(self) -> None:
+        """
+        save the manifest to file
+        :return: None
+        """
+        self.finished_at = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+        atomic_write_json(self.path, {'shard': self.shard,
+                                      'shards': self.shards,
+                                      'complete': self.complete,
+                                      'finished_at': self.finished_at,
+                                      'repos': dict(sorted(self.repos.items()))}, indent=1)
+
+
+def shard_of(name: str, shards: int) -> int:
+    """
+    get the shard a repo belongs to
+    the hash is stable across hosts and python versions, unlike hash()
+    :param name: the full name of the repo (owner/name)
+    :param shards: the number of all shards
+    :return: the number of the shard, starting at 1
+    """
+    digest = hashlib.sha256(name.encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % shards + 1
+
+
+def verify_shards(manifests: List[ShardManifest], names: List[str]) -> List[str]:
+    """
+    check that the shard manifests together cover every repo exactly once
+    :param manifests: the manifests of all shards
+    :param names: the full names of all repos that should be backed up
+    :return: list of problems, empty if there are none
+    """
+    problems: List[str] = []
+    shards = {manifest.shards for manifest in manifests}
+    if len(shards) != 1:
+        return ["the manifests are of different numbers of shards: "
+                + ", ".join(str(count) for count in sorted(shards))]
+    count = shards.pop()
+    seen: Dict[int, str] = {}
+    for manifest in manifests:
+        if manifest.shard in seen:
+            problems.append("shard " + str(manifest.shard) + " is in " + seen[manifest.shard]
+                            + " and " + manifest.path)
+        seen[manifest.shard] = manifest.path
+        if not manifest.complete:
+            problems.append("shard " + str(manifest.shard) + " had an incomplete list of repos")
+    for shard in range(1, count + 1):
+        if shard not in seen:
+            problems.append("shard " + str(shard) + " of " + str(count) + " is missing")
+
+    expected = set(names)
+    covered: Dict[str, List[Tuple[int, bool]]] = {}
+    for manifest in manifests:
+        for name, ok in manifest.repos.items():
+            covered.setdefault(name, []).append((manifest.shard, ok))
+    for name in sorted(expected | set(covered)):
+        backups = covered.get(name, [])
+        if not backups:
+            problems.append(name + " is in no shard (expected in shard "
+                            + str(shard_of(name, count)) + ")")
+        elif len(backups) > 1:
+            problems.append(name + " is in shards "
+                            + ", ".join(str(shard) for shard, _ in backups))
+        elif not backups[0][1]:
+            problems.append(name + " failed in shard " + str(backups[0][0]))
+        if name not in expected and backups:
+            problems.append(name + " is backed up but no longer on the instance")
+    return problems
@@ -0,0 +1,262 @@
+"""
+holds the counters and timings collected while backing up, see get_stats
+"""
+from contextlib import contextmanager
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from util.atomic import atomic_file, atomic_write_json
+
+# the repo in an api url and the issue numbers in it, see endpoint_of
+REPO_URL_PATTERN = re.compile(r'/repos/([^/?]+/[^/?]+)(?=/|$)')
+NUMBER_PATTERN = re.compile(r'/\d+(?=/|$)')
+
+GIT = "git"  # cloning or fetching a repo
+ISSUES = "issues"  # requesting and saving the issues of a repo
+WRITE = "write"  # writing issues to the archive (part of issues)
+EXPORT = "export"  # writing bundles and packed issues for offsite storage
+ASSETS = "assets"  # downloading the release assets and attachments of a repo
+PHASES = [GIT, ISSUES, WRITE, EXPORT, ASSETS]
+
+PROMETHEUS_PREFIX = "gitea_downloader_"
+
+
+class Stats:
+    """
+    represents what happened during a run consisting of:
+    - endpoints (counters of the api requests per endpoint)
+    - repos (counters of the api requests and phase timings per repo)
+    - phases (total seconds and number of repos per phase, see PHASES)
+    - started (when the run started)
+    all methods may be called from several threads
+    """
+
+    def __init__(self) -> None:
+        self.endpoints: Dict[str, Dict[str, Any]] = {}
+        self.repos: Dict[str, Dict[str, Any]] = {}
+        self.phases: Dict[str, Dict[str, float]] = {phase: {'seconds': 0.0, 'count': 0}
+                                                     for phase in PHASES}
+        self.started: float = time.time()
+        self.__lock = threading.Lock()
+
+    def record_request(self, url: str, status_code: Optional[int], size: int, seconds: float,
+                       cached: bool = False) -> None:
+        """
+        count one request sent to the gitea instance
+        :param url: the requested url (relative to the instance)
+        :param status_code: the status code of the answer or None if there was none
+        :param size: bytes of the body received
+        :param seconds: how long the request took
+        :param cached: was the body served from the response cache?
+        :return: None
+        """
+        endpoint, repo = endpoint_of(url)
+        with self.__lock:
+            for counters in self.__counters_of(endpoint, repo):
+                counters['requests'] += 1
+                counters['bytes'] += size
+                counters['seconds'] += seconds
+                counters['max_seconds'] = max(counters['max_seconds'], seconds)
+                if cached:
+                    counters['cached'] += 1
+                if status_code is None:
+                    counters['errors'] += 1
+                else:
+                    status = str(status_code)
+                    counters['status'][status] = counters['status'].get(status, 0) + 1
+
+    def record_retry(self, url: str) -> None:
+        """
+        count a request that is tried again
+        :param url: the requested url (relative to the instance)
+        :return: None
+        """
+        endpoint, repo = endpoint_of(url)
+        with self.__lock:
+            for counters in self.__counters_of(endpoint, repo):
+                counters['retries'] += 1
+
+    def record_phase(self, phase: str, repo: str, seconds: float) -> None:
+        """
+        add the time spent in a phase for a repo
+        :param phase: the phase (see PHASES)
+        :param repo: the name of the repo
+        :param seconds: the time spent
+        :return: None
+        """
+        with self.__lock:
+            repo_counters = self.__repo(repo)
+            self.phases[phase]['seconds'] += seconds
+            # a phase may be timed several times for a repo (e.g. the export of bundle and issues)
+            if phase not in repo_counters['phases']:
+                self.phases[phase]['count'] += 1
+            repo_counters['phases'][phase] = repo_counters['phases'].get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, phase: str, repo: str) -> Iterator[None]:
+        """
+        time a phase for a repo, use with `with`
+        :param phase: the phase (see PHASES)
+        :param repo: the name of the repo
+        :return: None
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_phase(phase, repo, time.perf_counter() - start)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        get everything that was counted
+        :return: dict
+        """
+        with self.__lock:
+            return json.loads(json.dumps({'started': self.started,
+                                          'seconds': time.time() - self.started,
+                                          'phases': self.phases,
+                                          'endpoints': self.endpoints,
+                                          'repos': self.repos}))
+
+    def summary(self) -> str:
+        """
+        get a short human readable summary
+        :return: the summary
+        """
+        stats = self.to_dict()
+        lines = ["finished in {:.1f}s".format(stats['seconds'])]
+        for phase, counters in stats['phases'].items():
+            if counters['count']:
+                lines.append("{:<8}{:>10.1f}s over {} repos".format(phase, counters['seconds'],
+                                                                   counters['count']))
+        lines.append("{:<40}{:>9}{:>12}{:>9}{:>9}{:>10}".format(
+            "endpoint", "requests", "bytes", "retries", "cached", "avg [ms]"))
+        for endpoint, counters in sorted(stats['endpoints'].items(),
+                                         key=lambda item: -item[1]['seconds']):
+            lines.append("{:<40}{:>9}{:>12}{:>9}{:>9}{:>10.1f}".format(
+                endpoint, counters['requests'], counters['bytes'], counters['retries'],
+                counters['cached'], 1000 * counters['seconds'] / max(1, counters['requests'])))
+        return "\n".join(lines)
+
+    def to_prometheus(self) -> str:
+        """
+        get everything that was counted in the prometheus text format
+        :return: the metrics
+        """
+        stats = self.to_dict()
+        metrics: Dict[str, Tuple[str, str, Dict[str, float]]] = {}
+
+        def add(name: str, kind: str, help_text: str, labels: str, value: float) -> None:
+            metrics.setdefault(name, (kind, help_text, {}))[2][labels] = value
+
+        add("run_started_timestamp_seconds", "gauge", "when the run started", "", stats['started'])
+        add("run_duration_seconds", "gauge", "how long the run took", "", stats['seconds'])
+        for phase, counters in stats['phases'].items():
+            labels = '{phase="' + phase + '"}'
+            add("phase_seconds_total", "counter", "seconds spent per phase", labels,
+                counters['seconds'])
+            add("phase_runs_total", "counter", "repos that went through a phase", labels,
+                counters['count'])
+        for kind, label, entries in [("endpoint", "endpoint", stats['endpoints']),
+                                     ("repo", "repo", stats['repos'])]:
+            for key, counters in entries.items():
+                labels = '{' + label + '="' + Stats.__escape(key) + '"}'
+                add(kind + "_requests_total", "counter", "api requests per " + kind, labels,
+                    counters['requests'])
+                add(kind + "_response_bytes_total", "counter", "bytes received per " + kind,
+                    labels, counters['bytes'])
+                add(kind + "_retries_total", "counter", "api requests tried again per " + kind,
+                    labels, counters['retries'])
+                add(kind + "_cached_total", "counter", "answers served from the cache per " + kind,
+                    labels, counters['cached'])
+                add(kind + "_request_seconds_total", "counter", "seconds spent in api requests per "
+                    + kind, labels, counters['seconds'])
+                add(kind + "_request_seconds_max", "gauge", "slowest api request per " + kind,
+                    labels, counters['max_seconds'])
+                for phase, seconds in counters.get('phases', {}).items():
+                    add("repo_phase_seconds_total", "counter", "seconds spent per repo and phase",
+                        '{repo="' + Stats.__escape(key) + '",phase="' + phase + '"}', seconds)
+
+        lines = []
+        for name, (kind, help_text, values) in metrics.items():
+            lines.append("# HELP " + PROMETHEUS_PREFIX + name + " " + help_text)
+            lines.append("# TYPE " + PROMETHEUS_PREFIX + name + " " + kind)
+            for labels, value in values.items():
+                lines.append(PROMETHEUS_PREFIX + name + labels + " " + repr(float(value)))
+        return "\n".join(lines) + "\n"
+
+    def save(self, path: str) -> None:
+        """
+        write everything that was counted to a file,
+        in the prometheus text format if it ends with .prom, otherwise as json
+        :param path: the file
+        :return: None
+        """
+        if not path.endswith(".prom"):
+            atomic_write_json(path, self.to_dict(), indent=1)
+            return
+        with atomic_file(path) as stats_file:
+            stats_file.write(self.to_prometheus())
+
+    def __counters_of(self, endpoint: str, repo: Optional[str]) -> Iterator[Dict[str, Any]]:
+        """
+        get the request counters of an endpoint and repo, call with the lock held
+        :param endpoint: the endpoint (see endpoint_of)
+        :param repo: the name of the repo or None
+        :return: the counters
+        """
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = Stats.__new_counters()
+        yield self.endpoints[endpoint]
+        if repo is not None:
+            yield self.__repo(repo)
+
+    def __repo(self, repo: str) -> Dict[str, Any]:
+        """
+        get the counters of a repo, call with the lock held
+        :param repo: the name of the repo
+        :return: the counters
+        """
+        if repo not in self.repos:
+            self.repos[repo] = Stats.__new_counters()
+            self.repos[repo]['phases'] = {}
+        return self.repos[repo]
+
+    @staticmethod
+    def __new_counters() -> Dict[str, Any]:
+        return {'requests': 0, 'bytes': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                'retries': 0, 'cached': 0, 'errors': 0, 'status': {}}
+
+    @staticmethod
+    def __escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def endpoint_of(url: str) -> Tuple[str, Optional[str]]:
+    """
+    get the endpoint of an api url and the repo it belongs to
+    :param url: the url (relative to the instance)
+    :return: (endpoint with {repo} and {index} in place of names and numbers, repo or None)
+    """
+    path = url.split('?', 1)[0]
+    repo: Optional[str] = None
+    match = REPO_URL_PATTERN.search(path)
+    if match is not None:
+        repo = match.group(1)
+        path = path[:match.start(1)] + "{repo}" + path[match.end(1):]
+    return NUMBER_PATTERN.sub("/{index}", path), repo
+
+
+# one collection per run, see get_stats
+__STATS = Stats()
+
+
+def get_stats() -> Stats:
+    """
+    get the counters and timings of this run
+    :return: the Stats
+    """
+    return __STATS
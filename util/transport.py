@@ -0,0 +1,117 @@
+"""
+holds how git reaches the gitea instance: over ssh sharing one connection
+or over https with the credentials of the config
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Dict, Optional, Tuple
+
+from util.config import AuthMode, Config
+from util.repo import Repo
+
+SSH = "ssh"  # the ssh_url of the repos
+HTTPS = "https"  # the clone_url of the repos
+TRANSPORTS = [SSH, HTTPS]
+
+# the credentials are only in the environment of git, the helper tells them when git asks (get)
+# and ignores store and erase, so they are never written anywhere
+CREDENTIAL_HELPER = '!f() { test "$1" = get' \
+                    ' && echo "username=$GITEA_DOWNLOADER_USER"' \
+                    ' && echo "password=$GITEA_DOWNLOADER_PASSWORD"; }; f'
+
+
+class Transport:
+    """
+    represents how git reaches a gitea instance consisting of:
+    - kind (see TRANSPORTS)
+    - environment (additional environment variables of every git process)
+    over ssh all git processes share one connection per host (ControlMaster),
+    which stays open for persist seconds after the last one ended,
+    over https git gets the credentials from a helper that reads them from its environment
+    """
+
+    def __init__(self, kind: str, multiplex: bool = True, persist: int = 60,
+                 user: str = "", password: str = "") -> None:
+        self.kind: str = kind
+        self.environment: Dict[str, str] = {}
+        self.__sockets: Optional[str] = None
+        if kind == HTTPS:
+            self.environment = {'GIT_TERMINAL_PROMPT': "0",
+                                'GITEA_DOWNLOADER_USER': user,
+                                'GITEA_DOWNLOADER_PASSWORD': password,
+                                # an empty helper drops the helpers of the user, e.g. store
+                                'GIT_CONFIG_COUNT': "2",
+                                'GIT_CONFIG_KEY_0': "credential.helper",
+                                'GIT_CONFIG_VALUE_0': "",
+                                'GIT_CONFIG_KEY_1': "credential.helper",
+                                'GIT_CONFIG_VALUE_1': CREDENTIAL_HELPER}
+        elif multiplex:
+            # sockets have a short length limit, %C is a hash of host, port and user
+            self.__sockets = tempfile.mkdtemp(prefix="gitea-ssh-")
+            ssh = os.environ.get('GIT_SSH_COMMAND') or "ssh"
+            self.environment = {'GIT_SSH_COMMAND': ssh + " -o ControlMaster=auto"
+                                + " -o ControlPath=" + os.path.join(self.__sockets, "%C")
+                                + " -o ControlPersist=" + str(persist)}
+
+    def url_of(self, repo: Repo) -> str:
+        """
+        get the url git clones and fetches a repo from
+        :param repo: the repo
+        :return: the url
+        """
+        if self.kind == HTTPS and repo.clone_url:
+            return repo.clone_url
+        return repo.url
+
+    def stop(self) -> None:
+        """
+        close the shared ssh connections
+        :return: None
+        """
+        if self.__sockets is None:
+            return
+        for socket in os.listdir(self.__sockets):
+            # the host is needed by ssh, but the socket decides which connection is closed
+            subprocess.run(['ssh', '-o', 'ControlPath=' + os.path.join(self.__sockets, socket),
+                            '-O', 'exit', 'gitea'],
+                           stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, check=False)
+        shutil.rmtree(self.__sockets, ignore_errors=True)
+        self.__sockets = None
+
+
+# one transport per gitea instance and account, see get_transport
+__TRANSPORTS: Dict[Tuple[str, str], Transport] = {}
+__TRANSPORTS_LOCK = threading.Lock()
+
+
+def get_transport(config: Config) -> Transport:
+    """
+    get the transport to the gitea instance in the config for its account
+    :param config: the config to be used
+    :return: the transport
+    """
+    key = (config.url, config.auth.user)
+    with __TRANSPORTS_LOCK:
+        transport = __TRANSPORTS.get(key)
+        if transport is None:
+            password = config.auth.token if config.auth.mode == AuthMode.TOKEN \
+                else config.auth.password
+            transport = Transport(config.git_transport, config.git_multiplex, config.git_persist,
+                                  config.auth.user, password or "")
+            __TRANSPORTS[key] = transport
+    return transport
+
+
+def stop_transports() -> None:
+    """
+    close the shared ssh connections of all transports
+    :return: None
+    """
+    with __TRANSPORTS_LOCK:
+        for transport in __TRANSPORTS.values():
+            transport.stop()
+        __TRANSPORTS.clear()
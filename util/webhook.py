@@ -0,0 +1,210 @@
+"""
+holds the receiver of gitea webhooks and the queue of repos waiting to be synced in watch mode
+"""
+import hashlib
+import hmac
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+from typing import Any, Dict, Optional, Set
+
+PUSH = "push"  # commits were pushed or refs were created or deleted
+ISSUES = "issues"  # an issue was opened, edited, closed, labeled, ...
+ISSUE_COMMENT = "issue_comment"  # a comment of an issue was created, edited or deleted
+EVENTS = [PUSH, "create", "delete", ISSUES, ISSUE_COMMENT]
+
+MAX_PAYLOAD = 10 * 1024 * 1024  # bytes, gitea's payloads are far smaller
+
+
+class Work:
+    """
+    represents what is waiting to be synced of a repo consisting of:
+    - name (the full name of the repo)
+    - git (should the repo be fetched?)
+    - issues (numbers of the issues that should be saved)
+    - first_at, last_at (time.monotonic of the first and the last webhook)
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self.git: bool = False
+        self.issues: Set[int] = set()
+        self.first_at: float = time.monotonic()
+        self.last_at: float = self.first_at
+
+
+class SyncQueue:
+    """
+    represents the repos waiting to be synced consisting of:
+    - debounce (seconds a repo waits after its last webhook, so a burst is synced once)
+    - max_delay (seconds a repo waits at most after its first webhook, even if more keep coming)
+    - pending (full name of the repo to its Work)
+    all methods may be called from several threads
+    """
+
+    def __init__(self, debounce: float, max_delay: float) -> None:
+        self.debounce: float = debounce
+        self.max_delay: float = max_delay
+        self.pending: Dict[str, Work] = {}
+        self.__changed = threading.Condition()
+
+    def add(self, name: str, git: bool = False, issue: Optional[int] = None) -> None:
+        """
+        add a change of a repo, merged with the ones still waiting
+        :param name: the full name of the repo
+        :param git: should the repo be fetched?
+        :param issue: the number of the issue that should be saved or None
+        :return: None
+        """
+        with self.__changed:
+            work = self.pending.get(name)
+            if work is None:
+                work = Work(name)
+                self.pending[name] = work
+            work.last_at = time.monotonic()
+            work.git = work.git or git
+            if issue is not None:
+                work.issues.add(issue)
+            self.__changed.notify()
+
+    def take(self, timeout: float) -> Optional[Work]:
+        """
+        wait for the repo that is due first
+        :param timeout: seconds to wait at most
+        :return: the Work of the repo or None if none was due in time
+        """
+        end = time.monotonic() + timeout
+        with self.__changed:
+            while True:
+                now = time.monotonic()
+                due: Optional[Work] = None
+                wait = end - now
+                for work in self.pending.values():
+                    due_at = self.__due_at(work)
+                    if due_at <= now:
+                        due = work
+                        break
+                    wait = min(wait, due_at - now)
+                if due is not None:
+                    del self.pending[due.name]
+                    return due
+                if wait <= 0:
+                    return None
+                self.__changed.wait(wait)
+
+    def __due_at(self, work: Work) -> float:
+        return min(work.last_at + self.debounce, work.first_at + self.max_delay)
+
+
+class WebhookServer:
+    """
+    represents the http listener for gitea webhooks consisting of:
+    - listen, port (the address to listen on)
+    - secret (the webhooks are signed with, see is_signed)
+    - queue (the changes of the webhooks are added to)
+    """
+
+    def __init__(self, listen: str, port: int, secret: str, queue: SyncQueue) -> None:
+        self.listen: str = listen
+        self.port: int = port
+        self.secret: bytes = secret.encode()
+        self.queue: SyncQueue = queue
+        self.__server: Optional[ThreadingHTTPServer] = None
+
+    def start(self) -> None:
+        """
+        start listening in a thread of its own
+        :return: None
+        """
+        self.__server = ThreadingHTTPServer((self.listen, self.port), handler_for(self))
+        self.__server.daemon_threads = True
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        """
+        stop listening
+        :return: None
+        """
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+
+    def is_signed(self, payload: bytes, signature: str) -> bool:
+        """
+        check the signature gitea sends in X-Gitea-Signature (the hex HMAC-SHA256 of the payload)
+        :param payload: the body of the webhook
+        :param signature: the signature
+        :return: bool
+        """
+        expected = hmac.new(self.secret, payload, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature.strip().lower())
+
+    def receive(self, event: str, payload: Dict[str, Any]) -> bool:
+        """
+        add the change a webhook tells of to the queue
+        :param event: the event of the webhook (X-Gitea-Event)
+        :param payload: the parsed body of the webhook
+        :return: was it an event that is synced?
+        """
+        if event not in EVENTS:
+            return False
+        name = payload['repository']['full_name']
+        if event in [ISSUES, ISSUE_COMMENT]:
+            self.queue.add(name, issue=int(payload['issue']['number']))
+        else:
+            self.queue.add(name, git=True)
+        return True
+
+
+def handler_for(server: WebhookServer) -> type:
+    """
+    build the request handler of a webhook server
+    :param server: the webhook server
+    :return: the handler class
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        """
+        answers the webhooks of gitea
+        """
+
+        def do_POST(self) -> None:  # pylint: disable=invalid-name
+            """
+            answer a webhook
+            :return: None
+            """
+            try:
+                length = int(self.headers.get('Content-Length', ""))
+            except ValueError:
+                self.__answer(411)
+                return
+            if length < 0:
+                # read(-1) would read until the client closes the connection
+                self.__answer(400)
+                return
+            if length > MAX_PAYLOAD:
+                self.__answer(413)
+                return
+            payload = self.rfile.read(length)
+            signature = self.headers.get('X-Gitea-Signature', "")
+            if not server.is_signed(payload, signature):
+                self.__answer(401)
+                return
+            try:
+                received = server.receive(self.headers.get('X-Gitea-Event', ""),
+                                          json.loads(payload))
+            except (ValueError, KeyError, TypeError):
+                self.__answer(400)
+                return
+            self.__answer(202 if received else 204)
+
+        def __answer(self, status: int) -> None:
+            self.send_response(status)
+            self.send_header('Content-Length', "0")
+            self.end_headers()
+
+        def log_message(self, *args: Any) -> None:  # pylint: disable=arguments-differ
+            pass
+
+    return Handler